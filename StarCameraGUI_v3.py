@@ -1,17 +1,42 @@
-from PyQt5.QtGui import *
-from PyQt5.QtCore import *
-from PyQt5.QtWidgets import *
-import sys
 import time
+# reference point for the startup-time measurement mode (see reportStartupTime())
+startup_reference = time.perf_counter()
+from PyQt5.QtGui import QColor, QFont, QIcon, QImage, QKeySequence, QPalette, QPixmap
+from PyQt5.QtCore import QRectF, QSize, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import (QApplication, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, 
+                             QGridLayout, QGroupBox, QFileDialog, QHBoxLayout, QInputDialog, QLabel, QLineEdit, 
+                             QListView, QListWidget, QListWidgetItem, QMenu, QMessageBox, QProgressBar, QPushButton, 
+                             QShortcut, QSizePolicy, QSlider, QSpacerItem, QSpinBox, QStyleFactory, QSystemTrayIcon, 
+                             QTabWidget, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+import sys
+import argparse
+import functools
+import threading
+import signal
 import numpy as np
 import struct
 import socket
 import os
+import multiprocessing
 import listening_final
+import blob_finder
+import frame_stack
+import image_pyramid
+import frame_cache
+import telemetry_log
+import pointing_stats
+import solve_monitor
+import coordinates
+import metrics
+import memory_budget
+import latency
+import image_quality
 import ipaddress
-from pyqtgraph import PlotWidget, plot
-import pyqtgraph as pg
-import pyqtgraph.ptime as ptime
+
+# pyqtgraph is only imported once the first graph or image is built (see importPyqtgraph()), and the modules only
+# used by menu actions and on connecting (export_engine, history, profiler, focus_planner, sequence, receiver_process)
+# where they are used, so none of them slow the start up
+pg = None
 
 # path
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -20,10 +45,91 @@ CAMERA_WIDTH = 1936
 CAMERA_HEIGHT = 1216
 # time limit for progress bar of telemetry-timing thread
 TIME_LIMIT = 30 
+# milliseconds between checks for new data when receiving through a separate receiver process
+RECEIVER_POLL_INTERVAL = 10
+# milliseconds between checks of the memory budget
+MEMORY_CHECK_INTERVAL = 5000
+# milliseconds between updates of the latency estimates
+LATENCY_UPDATE_INTERVAL = 2000
+# milliseconds between checks of whether the next step of an observing sequence is due
+SEQUENCE_TICK_INTERVAL = 500
+# size of the thumbnails in the filmstrip of recent frames in the Images tab
+FILMSTRIP_ICON_WIDTH = 121
+FILMSTRIP_ICON_HEIGHT = 76
 # possible aperture values on Star Camera (Canon EF f/2.8)
 aperture_range = ["2.8", "3.0", "3.3", "3.6", "4.0", "4.3", "4.7", "5.1", "5.6", "6.1", "6.7", "7.3", "8.0", "8.7", 
                   "9.5", "10.3", "11.3", "12.3", "13.4", "14.6", "16.0", "17.4", "19.0", "20.7", "22.6", "24.6", "26.9",
                   "29.3", "32.0"]
+# telemetry graphs in the order of their tabs: (key of the telemetry list, tab label, graph title, axis label)
+TELEMETRY_GRAPHS = [("alt", "&Altitude", "Observed Altitude [deg]", "Altitude [deg]"),
+                    ("az", "&Azimuth", "Observed Azimuth [deg]", "Azimuth [deg]"),
+                    ("ra", "&RA", "Observed Right Ascension [deg]", "RA [deg]"),
+                    ("dec", "&DEC", "Observed Declination [deg]", "DEC [deg]"),
+                    ("fr", "&FR", "Observed Field Rotation [deg]", "FR [deg]"),
+                    ("ps", "&PS", "Observed Pixel Scale [arcsec/px]", "PS [arcsec/px]"),
+                    ("ir", "&IR", "Observed Image Rotation [deg]", "IR [deg]")]
+TELEMETRY_GRAPHS_BY_KEY = {graph[0]: graph for graph in TELEMETRY_GRAPHS}
+# graphs of the image quality metrics of every frame (see image_quality.py), in the order of their tabs: (key of the
+# metric, tab label)
+QUALITY_GRAPHS = [("background", "Back&ground"), ("noise", "&Noise"), ("saturation", "Sat&uration"), 
+                  ("hfd", "&HFD"), ("sources", "Sour&ces")]
+# every graph: key -> (title, left/right axis label, bottom axis label, curves drawn on it from bottom to top)
+GRAPHS = {key: (title, axis_label, "Raw time [seconds]", 
+                ("history", "overlay", "data") if key in ("ra", "dec", "alt", "az") else ("history", "data"))
+          for (key, _, title, axis_label) in TELEMETRY_GRAPHS}
+GRAPHS["af"] = ("Auto-focusing curve", "Flux [raw pixel value]", "Focus position [encoder counts]", 
+                ("regression", "data"))
+GRAPHS["solve_rate"] = ("Astrometry Solve Rate", "Images solved [%]", "Raw time [seconds]", ("data",))
+GRAPHS.update({key: image_quality.METRICS[key] + ("Raw time [seconds]", ("data",)) 
+               for (key, _) in QUALITY_GRAPHS})
+GRAPHS["latency"] = ("Exposure-to-Display Latency", "Images", "Latency [seconds]", ("pipeline", "data"))
+# how each kind of curve is drawn: (color, width, line style, symbol, symbol size); a color or symbol size of None
+# follows the current color scheme
+CURVE_STYLES = {"data": (None, 3, Qt.SolidLine, "o", None),
+                # telemetry history loaded from a log
+                "history": ("#8c8c8c", 2, Qt.SolidLine, None, None),
+                # predicted RA/DEC, and ALT/AZ computed from the solved RA/DEC
+                "overlay": ("#ff8c00", 2, Qt.DashLine, "x", 8),
+                # polynomial fitted to the auto-focusing curve
+                "regression": ("#ADFF2F", 3, Qt.SolidLine, "+", 9),
+                # the GUI's own part of the latency
+                "pipeline": ("#ff8c00", 2, Qt.DashLine, "t", 8)}
+# columns of the pointing stability table (the Allan deviation columns follow)
+STABILITY_COLUMNS = ["Mean [deg]", "Std [arcsec]", "Min [deg]", "Max [deg]", "Drift [arcsec/min]"]
+
+"""
+Build the image pyramid of a live image, tagged with the image's camera time so its drawing can be timed (see
+latency.py).
+Inputs: the image, the downsampling mode and the camera time (None for anything but a newly received image).
+Outputs: The pyramid from image_pyramid.buildPyramid(), with the camera time under "camera_time".
+"""
+def buildTaggedPyramid(image, mode, camera_time = None):
+    pyramid = image_pyramid.buildPyramid(image, mode)
+    pyramid["camera_time"] = camera_time
+    return pyramid
+
+"""
+Import pyqtgraph the first time a graph or image needs to be built, since loading it is a large part of the start-up
+time of the GUI.
+Inputs: None.
+Outputs: The pyqtgraph module (also bound to the global pg).
+"""
+def importPyqtgraph():
+    global pg
+    if pg is None:
+        import pyqtgraph
+        # interpret image data as row-major instead of col-major
+        pyqtgraph.setConfigOptions(imageAxisOrder = "row-major")
+        pg = pyqtgraph
+    return pg
+
+"""
+Print how long the GUI has taken to reach a stage of its start-up (for the --startup-time measurement mode).
+Inputs: name of the stage reached.
+Outputs: None. Prints the time elapsed since the GUI module started loading.
+"""
+def reportStartupTime(stage):
+    print("Startup: %s after %.3f seconds" % (stage, time.perf_counter() - startup_reference))
 
 """
 Class that runs a counter thread to keep track of how long telemetry takes to arrive from the Star Camera.
@@ -146,8 +252,9 @@ Class for a thread that sends commands to the Star Camera.
 Attributes: a confirmation that commands were sent, a signal carrying the Star Camera socket information, and the 
 socket information once established.
 Methods: getSocket() - get the socket information and attach it to the thread as attributes; sendCommands() - send the
-packaged commands to the Star Camera; displayConfirmation() - display a pop-up window for the user confirming their
-commands were sent.
+packaged commands to the Star Camera and confirm it; transmitCommands() - send them without the confirmation (for 
+commands sent automatically, e.g. by a sequence); displayConfirmation() - display a pop-up window for the user 
+confirming their commands were sent.
 """
 class CommandingThread(QThread):
     # signals the thread can receive from the main GUI window
@@ -162,11 +269,14 @@ class CommandingThread(QThread):
 
     # transmit the commands via TCP to the Star Camera
     def sendCommands(self, data_to_send):   
-        self.StarCam_socket.sendto(data_to_send, (self.StarCam_IP, 
-                                                  self.StarCam_PORT))
+        self.transmitCommands(data_to_send)
         print("Commands sent to camera. Will display confirmation.")
         self.displayConfirmation()
 
+    def transmitCommands(self, data_to_send):
+        self.StarCam_socket.sendto(data_to_send, (self.StarCam_IP, 
+                                                  self.StarCam_PORT))
+
     # function to design commands confirmation pop-up window
     def displayConfirmation(self):
         msg = QMessageBox()
@@ -195,6 +305,10 @@ class TelemetryThread(QThread):
     telemetry_received_for_timer = pyqtSignal(bool)
     socket_transport = pyqtSignal(object)
     disconnected = pyqtSignal(bool)
+    # memory_budget.MemoryBudget limiting the images waiting for the GUI thread (set by the GUI), or None
+    memory_budget = None
+    # latency.LatencyEstimator stamping the arrival of each packet and image (set by the GUI), or None
+    latency_estimator = None
 
     # function to get the socket and attach it as an attribute to the thread
     def getSocket(self, socket_bundle):
@@ -209,6 +323,7 @@ class TelemetryThread(QThread):
             if isinstance(telemetry, type(None)):
                 self.disconnected.emit(True)
                 break
+            self.stampTelemetry(telemetry)
             # emit this telemetry to the main GUI thread
             self.telemetry_received.emit(telemetry)
             self.telemetry_received_for_timer.emit(True)
@@ -218,7 +333,148 @@ class TelemetryThread(QThread):
                 self.disconnected.emit(True)
                 break
             else:
-                self.image_received.emit(image)
+                self.emitImage(image)
+
+    # stamp the arrival of a telemetry packet with its camera time (the second field) for the latency estimates
+    def stampTelemetry(self, telemetry):
+        if self.latency_estimator is not None:
+            self.latency_estimator.received(struct.unpack_from("d", telemetry, 8)[0])
+
+    # emit an image to the main GUI thread, unless the images already waiting for it have used up their memory budget
+    def emitImage(self, image):
+        if self.latency_estimator is not None:
+            self.latency_estimator.imageReceived()
+        if (self.memory_budget is not None) and (not self.memory_budget.queueFrame(len(image))):
+            if listening_final.metrics is not None:
+                listening_final.metrics.add(frames_discarded = 1)
+            return
+        self.image_received.emit(image)
+
+"""
+Class for a thread that takes telemetry and images from a receiver process (see receiver_process.py) instead of 
+reading the socket itself, so the network work happens outside the GUI's interpreter. Emits the same signals as 
+TelemetryThread; the "socket" it is given is the receiver_process.ReceiverProcess.
+"""
+class ReceiverProcessThread(TelemetryThread):
+    def run(self):
+        while not self.isInterruptionRequested():
+            telemetry = self.StarCam_socket.nextTelemetry()
+            image = self.StarCam_socket.nextImage()
+            if (telemetry is None) and (image is None):
+                if self.StarCam_socket.isDisconnected():
+                    if not self.isInterruptionRequested():
+                        self.disconnected.emit(True)
+                    break
+                self.msleep(RECEIVER_POLL_INTERVAL)
+                continue
+            # the receiver process cannot count into the GUI's metrics, so count what arrives here
+            if telemetry is not None:
+                if listening_final.metrics is not None:
+                    listening_final.metrics.add(telemetry_received = 1, bytes_received = len(telemetry))
+                self.stampTelemetry(telemetry)
+                # emit this telemetry to the main GUI thread
+                self.telemetry_received.emit(telemetry)
+                self.telemetry_received_for_timer.emit(True)
+            if image is not None:
+                if listening_final.metrics is not None:
+                    listening_final.metrics.add(frames_received = 1, bytes_received = len(image))
+                self.emitImage(image)
+
+"""
+Class for a thread that processes received images off the GUI thread (e.g. finding stars with blob_finder.py or
+building image pyramids with image_pyramid.py).
+Attributes: result_ready (a signal carrying what the work function returned), the work function and the arguments
+waiting to be processed.
+Methods: submit() - queue the arguments for one call, replacing any still waiting so the thread never falls behind 
+the latest frame; stop() - end the thread; run() - call the work function as arguments are queued.
+"""
+class FrameWorkerThread(QThread):
+    result_ready = pyqtSignal(object)
+
+    def __init__(self, work, parent = None):
+        super(FrameWorkerThread, self).__init__(parent)
+        self.work = work
+        self.condition = threading.Condition()
+        self.pending_args = None
+        # arguments replaced by newer ones before they were processed
+        self.dropped = 0
+
+    def submit(self, *args):
+        with self.condition:
+            if self.pending_args is not None:
+                self.dropped += 1
+            self.pending_args = args
+            self.condition.notify()
+
+    def stop(self):
+        self.requestInterruption()
+        with self.condition:
+            self.condition.notify()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            with self.condition:
+                while (self.pending_args is None) and (not self.isInterruptionRequested()):
+                    self.condition.wait()
+                if self.pending_args is None:
+                    continue
+                args = self.pending_args
+                self.pending_args = None
+            self.result_ready.emit(self.work(*args))
+
+"""
+Class for a thread that writes an export (see export_engine.py), so large exports never hold up the live data.
+Attributes: progress (a signal carrying the steps done and the total), export_finished (a signal carrying an error
+message, or an empty string once the export has been written) and what to export.
+Methods: run() - load the telemetry and write the file; cancel with requestInterruption().
+"""
+class ExportThread(QThread):
+    progress = pyqtSignal(int, int)
+    export_finished = pyqtSignal(str)
+
+    def __init__(self, path, export_format, load_telemetry, frames, parent = None):
+        super(ExportThread, self).__init__(parent)
+        self.path = path
+        self.export_format = export_format
+        self.load_telemetry = load_telemetry
+        self.frames = frames
+
+    def run(self):
+        import export_engine
+        try:
+            telemetry = self.load_telemetry() if self.load_telemetry is not None else None
+            written = export_engine.runExport(self.path, self.export_format, telemetry, self.frames, 
+                                              self.progress.emit, self.isInterruptionRequested)
+        except ImportError as error:
+            self.export_finished.emit("The Python package for this format is not installed (%s)." % error)
+        except (OSError, ValueError) as error:
+            self.export_finished.emit("The export failed: %s" % error)
+        else:
+            self.export_finished.emit("" if written else "The export was cancelled.")
+
+"""
+Class for a thread that finds the telemetry log of a file chosen with Load History, importing a data.txt file into
+one first (see history.logRootFor()), so a long import never holds up the live data.
+Attributes: progress (a signal carrying the kilobytes imported and the total), import_finished (a signal carrying the
+root of the log, or None, and an error message) and the chosen file.
+Methods: run() - import the file.
+"""
+class HistoryImportThread(QThread):
+    progress = pyqtSignal(int, int)
+    import_finished = pyqtSignal(object, str)
+
+    def __init__(self, path, parent = None):
+        super(HistoryImportThread, self).__init__(parent)
+        self.path = path
+
+    def run(self):
+        import history
+        try:
+            root = history.logRootFor(self.path, lambda done, total: self.progress.emit(done//1024, total//1024))
+        except (OSError, ValueError) as error:
+            self.import_finished.emit(None, str(error))
+        else:
+            self.import_finished.emit(root, "")
 
 """
 Class for creating the main GUI window. Methods are described below before each one.
@@ -226,15 +482,33 @@ Class for creating the main GUI window. Methods are described below before each
 class GUI(QDialog):
     # signals the main window can send to the worker threads
     send_commands_signal = pyqtSignal(object)
+    # the same without the confirmation pop-up, whose event loop would let timers send more commands meanwhile
+    send_commands_quietly_signal = pyqtSignal(object)
     socket_transport = pyqtSignal(object)
 
     """ 
     Initialize the main GUI window. 
-    Inputs: self, no parents.
+    Inputs: self, no parents, whether to receive data through a separate receiver process, and the memory budget of
+    the process in megabytes.
     Outputs: None.
     """
-    def __init__(self, parent = None):
+    def __init__(self, parent = None, use_receiver_process = False, memory_budget_mb = memory_budget.DEFAULT_BUDGET_MB):
         super(GUI, self).__init__(parent)
+        self.use_receiver_process = use_receiver_process
+        # memory shared out between the telemetry history, the frame cache and the queued images (see 
+        # memory_budget.py)
+        self.memory_budget = memory_budget.MemoryBudget(memory_budget_mb*1024*1024)
+        # system tray icon for alerts (set once the application has created it)
+        self.tray_icon = None
+        # profile capture started with Ctrl+Shift+P or SIGUSR1 (see toggleProfiling()), its length (None for 
+        # profiler.DEFAULT_DURATION) and whether it includes cProfile of the main thread (set from the command line)
+        self.profile_capture = None
+        self.profile_seconds = None
+        self.profile_cprofile = False
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setSingleShot(True)
+        self.profile_timer.timeout.connect(self.toggleProfiling)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, self.toggleProfiling)
 
         # move window to position on user's computer screen and resize it
         self.move(100, 0)
@@ -242,8 +516,16 @@ class GUI(QDialog):
         self.setWindowFlag(Qt.WindowMinimizeButtonHint, True)
         self.setWindowFlag(Qt.WindowMaximizeButtonHint, True)
 
-        self.GUItelemetry = TelemetryThread()
+        if self.use_receiver_process:
+            self.GUItelemetry = ReceiverProcessThread()
+        else:
+            self.GUItelemetry = TelemetryThread()
         self.GUIcommanding = CommandingThread() 
+        self.GUItelemetry.memory_budget = self.memory_budget
+        # camera-to-screen latency of the images and the camera's clock offset (see latency.py)
+        self.latency = latency.LatencyEstimator()
+        self.GUItelemetry.latency_estimator = self.latency
+        self.latency_bottleneck = False
 
         # send this socket to the two worker threads (telemetry and commanding)
         self.socket_transport.connect(self.GUItelemetry.getSocket)
@@ -252,6 +534,7 @@ class GUI(QDialog):
         # connect clicking of command button to calling the actual function to 
         # send these commands
         self.send_commands_signal.connect(self.GUIcommanding.sendCommands)
+        self.send_commands_quietly_signal.connect(self.GUIcommanding.transmitCommands)
         # connect signal emitted by thread upon telemetry reception to display 
         # telemetry function
         self.GUItelemetry.telemetry_received.connect(self.displayTelemetryAndCameraSettings)
@@ -261,6 +544,35 @@ class GUI(QDialog):
         self.GUItelemetry.image_received.connect(self.updateImageData)
         self.GUItelemetry.disconnected.connect(self.resetConnection)
 
+        # client-side star finder for the overlay in the Images tab
+        self.blob_thread = FrameWorkerThread(blob_finder.findBlobs)
+        self.blob_thread.result_ready.connect(self.displayBlobs)
+        # downsampled copies of the displayed image for the Images tab
+        self.pyramid_thread = FrameWorkerThread(buildTaggedPyramid)
+        self.pyramid_thread.result_ready.connect(self.displayPyramid)
+        # image quality metrics of every frame, measured whether or not their tabs have been opened
+        self.quality_thread = FrameWorkerThread(image_quality.measureFrame)
+        self.quality_thread.result_ready.connect(self.recordQuality)
+
+        # health metrics, counted by the receive functions and the display slots (see metrics.py) and served if 
+        # --metrics-port or --metrics-socket is given
+        self.metrics = metrics.Metrics()
+        self.metrics.addGauge("frames_dropped_total", "Images skipped because a newer one arrived before they were "
+                              "drawn", self.droppedFrames, kind = "counter")
+        for name in self.memory_budget.limits:
+            self.metrics.addGauge("memory_%s_bytes" % name, "Memory used by the %s part of the memory budget" % name,
+                                  lambda name = name: self.memory_budget.usage()[name][0])
+        self.metrics.addGauge("clock_offset_seconds", "Estimated offset of the local clock from the camera's (plus " 
+                              "the camera's fastest time from timestamp to packet)", lambda: self.latency.offset)
+        for (stage, help_text) in (("total", "Median exposure-to-display latency by the two clocks"), 
+                                   ("excess", "Median exposure-to-display latency above the clock offset"),
+                                   ("display", "Median time from receiving an image to drawing it")):
+            self.metrics.addGauge("latency_%s_seconds" % stage, help_text, 
+                                  lambda stage = stage: self.latency.statistics()[stage]["p50"])
+        self.metrics.addGauge("pipeline_bottleneck", "1 if the GUI takes too long per image to keep up with the "
+                              "camera", lambda: int(self.latency_bottleneck))
+        self.metrics_server = None
+
         self.timing_thread = Counter()
         self.timing_thread.count_changed.connect(self.onCountChanged)
         self.GUItelemetry.disconnected.connect(self.timing_thread.reset)
@@ -324,6 +636,10 @@ class GUI(QDialog):
         self.alt_box = QLabel()
         self.alt_box.setToolTip("Altitude (degrees)")
         telemetry_layout.addRow(QLabel("ALT [deg]:"), self.alt_box)
+        self.prediction_box = QLabel()
+        self.prediction_box.setToolTip("Distance between the solved pointing and the pointing predicted from the " \
+                                       "previous solutions (arcseconds)")
+        telemetry_layout.addRow(QLabel("Off prediction [arcsec]:"), self.prediction_box)
 
         # add progress bar to telemetry section for timing purposes
         self.progress = QProgressBar(self)
@@ -333,6 +649,43 @@ class GUI(QDialog):
         self.progress_value = self.progress.value()
         self.progress_bar_label = QLabel("Waiting for telemetry:")
         telemetry_layout.addRow(self.progress_bar_label, self.progress)
+
+        # button to browse the telemetry of past nights in the graphs
+        self.history = None
+        self.history_thread = None
+        self.history_button = QPushButton("Load History...")
+        self.history_button.setToolTip("Show a stored telemetry log (or data.txt file) in the telemetry graphs")
+        self.history_button.clicked.connect(self.loadHistory)
+        self.history_progress = QProgressBar()
+        self.history_progress.setVisible(False)
+        telemetry_layout.addRow(self.history_button, self.history_progress)
+
+        # background export of telemetry and images
+        self.export_thread = None
+        self.export_button = QPushButton("Export Data...")
+        self.export_button.setToolTip("Save telemetry and images to an HDF5, NPZ or FITS file in the background")
+        self.export_button.clicked.connect(self.exportData)
+        self.export_progress = QProgressBar()
+        self.export_progress.setVisible(False)
+        telemetry_layout.addRow(self.export_button, self.export_progress)
+
+        # memory used by each part of the memory budget, checked (and enforced) every few seconds
+        self.memory_label = QLabel()
+        self.memory_label.setToolTip("Memory used / allowed for the telemetry history, the recent frames and the " \
+                                     "images waiting to be displayed (set the total with --memory-budget)")
+        telemetry_layout.addRow(QLabel("Memory [MB]:"), self.memory_label)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.timeout.connect(self.enforceMemoryBudget)
+        self.memory_timer.start(MEMORY_CHECK_INTERVAL)
+
+        # median exposure-to-display latency, and whether the GUI is what holds the images up
+        self.latency_label = QLabel()
+        self.latency_label.setToolTip("Median time from the camera's timestamp to the image being drawn, by the two " \
+                                      "clocks and above the estimated clock offset (see the Latency tab)")
+        telemetry_layout.addRow(QLabel("Latency [s]:"), self.latency_label)
+        self.latency_timer = QTimer(self)
+        self.latency_timer.timeout.connect(self.updateLatency)
+        self.latency_timer.start(LATENCY_UPDATE_INTERVAL)
         self.telemetry_group_box.setLayout(telemetry_layout)
 
         # create the commanding section of the GUI
@@ -454,12 +807,29 @@ class GUI(QDialog):
         self.photos_per_focus.setMaximum(10)
         self.photos_per_focus.setValue(3)
         self.prev_photos_per_focus = 3
+        # adaptive focus search: a coarse sweep over the range above, then narrower sweeps around the peak (see 
+        # focus_planner.py)
+        self.focus_tolerance = QSpinBox()
+        self.focus_tolerance.setToolTip("Stop the adaptive search once the best focus position is known to within " \
+                                        "this many encoder counts")
+        self.focus_tolerance.setRange(1, 500)
+        self.focus_tolerance.setValue(5)
+        self.focus_plan_button = QPushButton("Adaptive Focus Search")
+        self.focus_plan_button.setToolTip("Search the auto-focusing range with a coarse sweep followed by finer " \
+                                          "sweeps around the peak, then set the focus to the best position")
+        self.focus_plan_button.clicked.connect(self.toggleFocusPlan)
+        self.focus_planner = None
+        # commands the adaptive search sends its sweeps with, and whether the camera is in one of its sweeps
+        self.focus_plan_commands = None
+        self.focus_sweep_running = False
         auto_focus_layout.setContentsMargins(3, 3, 3, 3)
         auto_focus_layout.addRow(self.auto_focus_box)
         auto_focus_layout.addRow(QLabel("Starting position for auto-focusing range:           "), self.start_focus_pos)
         auto_focus_layout.addRow(QLabel("Ending position for auto-focusing range:"), self.end_focus_pos)
         auto_focus_layout.addRow(QLabel("Granularity of auto-focus checker:"), self.focus_step)
         auto_focus_layout.addRow(QLabel("Number of photos to take per focus:"), self.photos_per_focus)
+        auto_focus_layout.addRow(QLabel("Adaptive search tolerance [counts]:"), self.focus_tolerance)
+        auto_focus_layout.addRow(self.focus_plan_button)
         self.auto_focus_group.setLayout(auto_focus_layout)
 
         focus_slider_vbox.addWidget(self.auto_focus_group)
@@ -557,114 +927,73 @@ class GUI(QDialog):
         self.pause_button.clicked.connect(self.pauseButtonClicked)
         cmd_layout.addRow(self.cmd_button)
         cmd_layout.addRow(self.pause_button)
+
+        # scripted observing sequences: steps of commands from a plan file, each sent when due and confirmed by the 
+        # telemetry (see sequence.py)
+        self.sequence_button = QPushButton("Run Sequence...")
+        self.sequence_button.setToolTip("Load a plan of timed commands (e.g. an exposure ladder, an aperture sweep " \
+                                        "or a periodic re-focus) and send its steps as the camera confirms them")
+        self.sequence_button.clicked.connect(self.toggleSequence)
+        self.sequence_label = QLabel()
+        self.sequence_runner = None
+        self.sequence_timer = QTimer(self)
+        self.sequence_timer.timeout.connect(self.tickSequence)
+        cmd_layout.addRow(self.sequence_button)
+        cmd_layout.addRow(self.sequence_label)
         # add commanding layout to layout of main left box on GUI window
         self.commanding_group_box.setLayout(cmd_layout)
         self.commanding_group_box.setMinimumWidth(600) 
 
-        # create section for displaying photos (and add a tab for instructions)
+        # create section for displaying photos (and add a tab for instructions) - each page is only built the first 
+        # time it is opened, so the connection box is usable without waiting on pyqtgraph and the graphs
         self.photo_tab = QTabWidget()
         self.photo_tab.setMinimumWidth(750)
-        instructions = QLabel(alignment = Qt.AlignTop)
-        instructions.setIndent(10)
-        text = "Enter your commands to control the Star Camera. The 'logodds' parameter controls how many false " \
-               "positives Astrometry allows (the lower the number, the more false positives allowed). We suggest " \
-               "keeping this parameter at the default value unless you are absolutely sure of changing it. For " \
-               "changing the exposure, only enter integer values between 1 millisecond and 1 second. The camera will " \
-               "adjust the exposure to a decimal value, which will be displayed, but only enter commands as " \
-               "integers. To change the focus to a certain count, specify the position on the 'Set focus to:' " \
-               "scrollbar. You can also jump to infinity with the drop-down menu, but keep in mind that this command " \
-               "takes precedence (i.e. if you issue a slider command and a set focus to infinity command, the " \
-               "infinity command will be executed). By default, the camera begins in auto-focusing mode to determine " \
-               "the optimal focus position given an observing session's particular conditions and then switches to " \
-               "manual focusing mode, where the user can make changes and send them with the slider. If the camera " \
-               "has been running before the user connects, it will have already performed auto-focusing, so the GUI " \
-               "will update upon reception of the first batch of telemetry to reflect this. To re-enter " \
-               "auto-focusing, check the box and specify the range of focus positions you would like to check with " \
-               "the start and stop fields. Specify the step size and number of pictures to take at each focus " \
-               "position as well. Increasing the number of photos will increase how long the auto-focusing process " \
-               "takes. If desired, the default values may be left as is. If an auto-focusing process is aborted " \
-               "mid-way (unchecking the auto-focusing flag while it is still going), the focus position will stay at " \
-               "the most recent one. To change the aperture to one of the camera's f-numbers, select one from the " \
-               "drop-down menu. 2.8 is maximum aperture (fully open) and 32.0 is minimum aperture (fully closed). If " \
-               "you would like to set the focus to infinity or the aperture to maximum, select true in the drop-down " \
-               "menu(s). For changing the blob-finding parameters, enter the desired values in the proper entry " \
-               "field. If you are taking dark images and wish to re-make the static hot pixel mask, check the box, " \
-               "though this is not recommended (one has been made and tested previously). To turn this static hot " \
-               "pixel map on and off, check the 'use' button. These checkboxes will update to the current Star " \
-               "Camera settings on every iteration the telemetry is received from the camera. Once the commands you " \
-               "wish to send are entered, press the 'Send Commands' button. Left click on the graphics to export " \
-               "data and save as files.\n\n*WARNING: attempting to export the image as a CSV or HDF5 will result in " \
-               "an error pop-up; PyQtGraph raises an exception for trying to export their ImageItem()'s, since they " \
-               "are not PlotItem()'s.\n\n**Notes about the auto-focusing curve: if you connect to the camera in the " \
-               "middle of an auto-focusing process, your curve will only receive and show data from that point on. " \
-               "Likewise, if you start another auto-focusing process, the existing auto-focusing curve will be  " \
-               "erased, so be sure to export that data beforehand if you require it. The reception of data during " \
-               "auto-focusing will be a few seconds slower." 
-        instructions.setFont(QFont("Helvetica", 10, QFont.Light))
-        instructions.setText(text)
-        instructions.setWordWrap(True)
-        self.photo_tab.addTab(instructions, "&Instructions")
-
-        # interpret image data as row-major instead of col-major
-        pg.setConfigOptions(imageAxisOrder = "row-major")
-        # create window with GraphicsView widget
-        self.image_widget = pg.GraphicsLayoutWidget()
-        self.image_widget.setWindowTitle("Star Camera Image")
-        self.image_view = self.image_widget.addViewBox()
-        # show widget alone in its own window
-        self.image_widget.show() 
-        # create image item
-        self.img_item = pg.ImageItem(border = "w")
-        self.image_view.addItem(self.img_item)
-        self.photo_tab.addTab(self.image_widget, "&Images")
+        self.tab_builders = []
+        self.addLazyTab("&Instructions", self.buildInstructionsTab)
+        self.addLazyTab("&Images", self.buildImageTab)
 
         # lists to append telemetry to upon arrival
         self.time, self.alt, self.az, self.ra, self.dec, self.fr, self.ir, self.ps = [], [], [], [], [], [], [], []
         self.auto_focus, self.flux = [], []
-        # create pyqtgraph plot widgets
-        self.alt_graph_widget = pg.PlotWidget()
-        self.az_graph_widget = pg.PlotWidget()
-        self.ra_graph_widget = pg.PlotWidget()
-        self.dec_graph_widget = pg.PlotWidget()
-        self.fr_graph_widget = pg.PlotWidget()
-        self.ps_graph_widget = pg.PlotWidget()
-        self.ir_graph_widget = pg.PlotWidget()
-        self.af_graph_tab = QTabWidget()
-        self.af_graph_tab.setStyleSheet("QTabWidget::pane { border: 0; }")
-        self.af_graph_layout = QVBoxLayout()
-        self.af_graph_widget = pg.PlotWidget()
-        self.af_polyfit = QPushButton("Polynomial Regression")
-        self.af_polyfit.setStyleSheet("QPushButton { \
-                                       background-color: green; \
-                                       border-style: outset; \
-                                       border-width: 2px; \
-                                       border-color: beige;}")
-        self.af_polyfit.clicked.connect(self.polynomialRegression)
+        # image quality metrics, kept with the telemetry history (and thinned out with it, see enforceMemoryBudget())
+        self.quality_time = []
+        self.quality = {key: [] for key in image_quality.METRICS}
         # for regression of auto-focusing data
         self.coefficients = []
         self.polynomial = np.poly1d(self.coefficients)
-        self.af_polyfit.setToolTip("Perform a polynomial regression on the auto-focusing data")
-        self.af_graph_layout.addWidget(self.af_graph_widget)
-        self.af_graph_layout.addWidget(self.af_polyfit)
-        self.af_graph_tab.setLayout(self.af_graph_layout)
-        # add grids
-        self.alt_graph_widget.showGrid(x = True, y = True)
-        self.az_graph_widget.showGrid(x = True, y = True)
-        self.ra_graph_widget.showGrid (x = True, y = True)
-        self.dec_graph_widget.showGrid(x = True, y = True)
-        self.fr_graph_widget.showGrid(x = True, y = True)
-        self.ps_graph_widget.showGrid(x = True, y = True)
-        self.ir_graph_widget.showGrid(x = True, y = True)
-        self.af_graph_widget.showGrid(x = True, y = True)
+        # pyqtgraph widgets and lines, filled in as their tabs are built
+        self.image_widget, self.img_item, self.latest_image = None, None, None
+        self.show_blobs_box = None
+        self.stack_box, self.frame_stack = None, None
+        self.pyramid, self.pyramid_index, self.image_levels = None, None, None
+        # rolling pointing statistics, kept up to date whether or not the Stability tab has been opened
+        self.pointing_stats = pointing_stats.PointingStatistics()
+        self.stability_table = None
+        # solve-rate monitor, fed by the packets that are (or are not) solved
+        self.solve_monitor = solve_monitor.SolveMonitor()
+        # site of the camera, the pointing predicted for each solution, and the graph lines comparing them
+        self.site = None
+        self.pointing_predictor = coordinates.PointingPredictor()
+        self.predicted_time, self.predicted_ra, self.predicted_dec = [], [], []
+        # recent frames for the filmstrip, and the one being looked at instead of the live image (if any)
+        self.frame_cache = frame_cache.FrameCache(self.memory_budget.limit("frames"))
+        self.filmstrip, self.viewed_frame, self.latest_camera_time = None, None, None
+        # camera time of the image in self.latest_image (None until the first image)
+        self.latest_image_time = None
+        self.latency_stats_label = None
+        # graphs that have been built (key in GRAPHS -> PlotWidget) and their curves ((graph key, curve) -> 
+        # PlotDataItem), each created once and restyled in place when the color scheme changes
+        self.plot_widgets, self.curves = {}, {}
         # add all tabs/graphs to the GUI photo section
-        self.photo_tab.addTab(self.alt_graph_widget, "&Altitude")
-        self.photo_tab.addTab(self.az_graph_widget, "&Azimuth")
-        self.photo_tab.addTab(self.ra_graph_widget, "&RA")
-        self.photo_tab.addTab(self.dec_graph_widget, "&DEC")
-        self.photo_tab.addTab(self.fr_graph_widget, "&FR")
-        self.photo_tab.addTab(self.ps_graph_widget, "&PS")
-        self.photo_tab.addTab(self.ir_graph_widget, "&IR")
-        self.photo_tab.addTab(self.af_graph_tab, "&Auto-Focus")
+        for (key, tab_label, _, _) in TELEMETRY_GRAPHS:
+            self.addLazyTab(tab_label, functools.partial(self.buildGraphTab, key))
+        for (key, tab_label) in QUALITY_GRAPHS:
+            self.addLazyTab(tab_label, functools.partial(self.buildQualityTab, key))
+        self.addLazyTab("&Auto-Focus", self.buildAutoFocusTab)
+        self.addLazyTab("&Stability", self.buildStabilityTab)
+        self.addLazyTab("Solve Ra&te", self.buildSolveRateTab)
+        self.addLazyTab("&Latency", self.buildLatencyTab)
+        self.photo_tab.currentChanged.connect(self.buildTab)
 
         # create the top section of the GUI
         top_layout = QVBoxLayout()
@@ -716,6 +1045,677 @@ class GUI(QDialog):
         self.setLayout(main_layout)
         self.setWindowTitle("Star Camera")
         self.changeStyle("Fusion")
+        # build the page that is open at startup once the window is on screen
+        QTimer.singleShot(0, lambda: self.buildTab(self.photo_tab.currentIndex()))
+
+    """
+    Add a placeholder page to the photo section whose contents are built the first time the user opens it.
+    Inputs: the tab label and a function that creates and returns the page's widget.
+    Outputs: None.
+    """
+    def addLazyTab(self, label, builder):
+        page = QWidget()
+        page_layout = QVBoxLayout()
+        page_layout.setContentsMargins(0, 0, 0, 0)
+        page.setLayout(page_layout)
+        self.tab_builders.append(builder)
+        self.photo_tab.addTab(page, label)
+
+    """
+    Build the contents of a photo section tab if this is the first time it has been opened.
+    Inputs: index of the tab.
+    Outputs: None.
+    """
+    def buildTab(self, index):
+        if (index < 0) or (self.tab_builders[index] is None):
+            return
+        builder = self.tab_builders[index]
+        self.tab_builders[index] = None
+        self.photo_tab.widget(index).layout().addWidget(builder())
+
+    """
+    Create the instructions page.
+    Inputs: self.
+    Outputs: The instructions label.
+    """
+    def buildInstructionsTab(self):
+        instructions = QLabel(alignment = Qt.AlignTop)
+        instructions.setIndent(10)
+        text = "Enter your commands to control the Star Camera. The 'logodds' parameter controls how many false " \
+               "positives Astrometry allows (the lower the number, the more false positives allowed). We suggest " \
+               "keeping this parameter at the default value unless you are absolutely sure of changing it. For " \
+               "changing the exposure, only enter integer values between 1 millisecond and 1 second. The camera will " \
+               "adjust the exposure to a decimal value, which will be displayed, but only enter commands as " \
+               "integers. To change the focus to a certain count, specify the position on the 'Set focus to:' " \
+               "scrollbar. You can also jump to infinity with the drop-down menu, but keep in mind that this command " \
+               "takes precedence (i.e. if you issue a slider command and a set focus to infinity command, the " \
+               "infinity command will be executed). By default, the camera begins in auto-focusing mode to determine " \
+               "the optimal focus position given an observing session's particular conditions and then switches to " \
+               "manual focusing mode, where the user can make changes and send them with the slider. If the camera " \
+               "has been running before the user connects, it will have already performed auto-focusing, so the GUI " \
+               "will update upon reception of the first batch of telemetry to reflect this. To re-enter " \
+               "auto-focusing, check the box and specify the range of focus positions you would like to check with " \
+               "the start and stop fields. Specify the step size and number of pictures to take at each focus " \
+               "position as well. Increasing the number of photos will increase how long the auto-focusing process " \
+               "takes. If desired, the default values may be left as is. If an auto-focusing process is aborted " \
+               "mid-way (unchecking the auto-focusing flag while it is still going), the focus position will stay at " \
+               "the most recent one. To change the aperture to one of the camera's f-numbers, select one from the " \
+               "drop-down menu. 2.8 is maximum aperture (fully open) and 32.0 is minimum aperture (fully closed). If " \
+               "you would like to set the focus to infinity or the aperture to maximum, select true in the drop-down " \
+               "menu(s). For changing the blob-finding parameters, enter the desired values in the proper entry " \
+               "field. If you are taking dark images and wish to re-make the static hot pixel mask, check the box, " \
+               "though this is not recommended (one has been made and tested previously). To turn this static hot " \
+               "pixel map on and off, check the 'use' button. These checkboxes will update to the current Star " \
+               "Camera settings on every iteration the telemetry is received from the camera. Once the commands you " \
+               "wish to send are entered, press the 'Send Commands' button. Right click on the graphs to export what " \
+               "they show, or press 'Export Data...' in the telemetry section to save telemetry (from this session " \
+               "or the telemetry log) and images (from the filmstrip or a recording folder) to an HDF5, NPZ or FITS " \
+               "file; the export runs in the background, so the live data keeps coming in, and its progress is " \
+               "shown next to the button (press the button again to cancel).\n\n*WARNING: use 'Export Data...' for " \
+               "images. Exporting the image by right clicking it as a CSV or HDF5 will result in an error pop-up; " \
+               "PyQtGraph raises an exception for trying to export their ImageItem()'s, since they are not " \
+               "PlotItem()'s.\n\n**Notes about the auto-focusing curve: if you connect to the camera in the " \
+               "middle of an auto-focusing process, your curve will only receive and show data from that point on. " \
+               "Likewise, if you start another auto-focusing process, the existing auto-focusing curve will be  " \
+               "erased, so be sure to export that data beforehand if you require it. The reception of data during " \
+               "auto-focusing will be a few seconds slower." 
+        instructions.setFont(QFont("Helvetica", 10, QFont.Light))
+        instructions.setText(text)
+        instructions.setWordWrap(True)
+        return instructions
+
+    """
+    Create the image display page.
+    Inputs: self.
+    Outputs: The GraphicsLayoutWidget holding the Star Camera image.
+    """
+    def buildImageTab(self):
+        importPyqtgraph()
+        # controls above the image
+        image_controls = QHBoxLayout()
+        self.show_blobs_box = QCheckBox("Show detected stars")
+        self.show_blobs_box.setToolTip("Find stars in each image on this computer with the blob parameters in the " \
+                                       "Commands section and circle them")
+        self.show_blobs_box.stateChanged.connect(self.toggleBlobOverlay)
+        self.blob_count_label = QLabel()
+        image_controls.addWidget(self.show_blobs_box)
+        image_controls.addWidget(self.blob_count_label)
+        image_controls.addStretch()
+        # controls for stacking frames into a dark frame and hot pixel map
+        stack_controls = QHBoxLayout()
+        self.stack_box = QCheckBox("Stack frames")
+        self.stack_box.setToolTip("Add every received image to a running mean, variance and median, e.g. to build a " \
+                                  "dark frame and hot pixel map with the lens capped")
+        self.stack_view = QComboBox()
+        self.stack_view.addItems(["Live image", "Stack mean", "Stack median", "Stack variance", "Hot pixels"])
+        self.stack_view.currentIndexChanged.connect(self.showImage)
+        self.stack_count_label = QLabel("0 frames stacked")
+        reset_stack_button = QPushButton("Reset Stack")
+        reset_stack_button.clicked.connect(self.resetStack)
+        export_stack_button = QPushButton("Export Stack...")
+        export_stack_button.setToolTip("Save the mean, variance, median and hot pixel map (in camera pixel " \
+                                       "coordinates) to a .npz file")
+        export_stack_button.clicked.connect(self.exportStack)
+        stack_controls.addWidget(self.stack_box)
+        stack_controls.addWidget(QLabel("Show:"))
+        stack_controls.addWidget(self.stack_view)
+        stack_controls.addWidget(self.stack_count_label)
+        stack_controls.addWidget(reset_stack_button)
+        stack_controls.addWidget(export_stack_button)
+        stack_controls.addStretch()
+        # display levels, set from the histogram of the coarsest pyramid level
+        levels_controls = QHBoxLayout()
+        self.pyramid_mode = QComboBox()
+        self.pyramid_mode.addItems(["Max", "Mean"])
+        self.pyramid_mode.setToolTip("How the image is downsampled when zoomed out: Max keeps faint stars and hot " \
+                                     "pixels visible, Mean gives a smoother picture")
+        self.pyramid_mode.currentIndexChanged.connect(self.showImage)
+        self.auto_levels_box = QCheckBox("Auto levels")
+        self.auto_levels_box.setChecked(True)
+        self.auto_levels_box.stateChanged.connect(self.showImage)
+        self.histogram_widget = pg.PlotWidget()
+        self.histogram_widget.setFixedHeight(90)
+        self.histogram_widget.setBackground(self.theme["background"])
+        self.histogram_widget.hideAxis("left")
+        self.histogram_widget.setMouseEnabled(x = False, y = False)
+        self.histogram_widget.setMenuEnabled(False)
+        self.histogram_curve = self.histogram_widget.plot(fillLevel = 0, brush = (100, 100, 200, 150))
+        self.levels_region = pg.LinearRegionItem()
+        self.levels_region.sigRegionChangeFinished.connect(self.levelsDragged)
+        self.histogram_widget.addItem(self.levels_region)
+        levels_controls.addWidget(QLabel("Zoomed out:"))
+        levels_controls.addWidget(self.pyramid_mode)
+        levels_controls.addWidget(self.auto_levels_box)
+        levels_controls.addWidget(self.histogram_widget, 1)
+        # thumbnails of the recent frames; clicking one shows that frame instead of the live image
+        filmstrip_controls = QHBoxLayout()
+        self.filmstrip = QListWidget()
+        self.filmstrip.setViewMode(QListView.IconMode)
+        self.filmstrip.setFlow(QListView.LeftToRight)
+        self.filmstrip.setWrapping(False)
+        self.filmstrip.setMovement(QListView.Static)
+        self.filmstrip.setIconSize(QSize(FILMSTRIP_ICON_WIDTH, FILMSTRIP_ICON_HEIGHT))
+        self.filmstrip.setFixedHeight(FILMSTRIP_ICON_HEIGHT + 45)
+        self.filmstrip.itemClicked.connect(self.openCachedFrame)
+        self.live_button = QPushButton("Back to Live")
+        self.live_button.setToolTip("Show the newest image again")
+        self.live_button.setEnabled(False)
+        self.live_button.clicked.connect(self.showLiveImage)
+        filmstrip_controls.addWidget(self.filmstrip, 1)
+        filmstrip_controls.addWidget(self.live_button)
+        # create window with GraphicsView widget
+        self.image_widget = pg.GraphicsLayoutWidget()
+        self.image_widget.setBackground(self.theme["background"])
+        self.image_view = self.image_widget.addViewBox()
+        # create image item
+        self.img_item = pg.ImageItem(border = "w")
+        self.image_view.addItem(self.img_item)
+        # circles around the stars found by the blob thread
+        self.blob_overlay = pg.ScatterPlotItem(symbol = "o", size = 16, pen = pg.mkPen(color = "r", width = 1.5), 
+                                               brush = pg.mkBrush(None))
+        self.image_view.addItem(self.blob_overlay)
+        # switch pyramid levels as the view is zoomed
+        self.image_view.sigRangeChanged.connect(self.showPyramidLevel)
+        self.pyramid_thread.start()
+        # show the most recent image (and the frames cached so far) if any arrived before the tab was opened
+        self.refreshFilmstrip()
+        self.showImage()
+        image_page = QWidget()
+        image_layout = QVBoxLayout()
+        image_layout.setContentsMargins(0, 0, 0, 0)
+        image_layout.addLayout(image_controls)
+        image_layout.addLayout(stack_controls)
+        image_layout.addWidget(self.image_widget)
+        image_layout.addLayout(levels_controls)
+        image_layout.addLayout(filmstrip_controls)
+        image_page.setLayout(image_layout)
+        return image_page
+
+    """
+    Create one of the graphs in GRAPHS and its curves, registering them in self.plot_widgets and self.curves.
+    Inputs: key of the graph in GRAPHS.
+    Outputs: The graph's PlotWidget.
+    """
+    def createPlot(self, key):
+        importPyqtgraph()
+        plot_widget = pg.PlotWidget()
+        plot_widget.showGrid(x = True, y = True)
+        self.plot_widgets[key] = plot_widget
+        for curve in GRAPHS[key][3]:
+            self.curves[(key, curve)] = plot_widget.plot([], [])
+        self.stylePlot(key)
+        return plot_widget
+
+    """
+    Create the page for one of the telemetry graphs.
+    Inputs: key of the graph in TELEMETRY_GRAPHS.
+    Outputs: The graph's PlotWidget.
+    """
+    def buildGraphTab(self, key):
+        plot_widget = self.createPlot(key)
+        self.curves[(key, "data")].setData(self.time, getattr(self, key))
+        # the history line is re-paged from the log whenever the visible time range changes
+        plot_widget.sigXRangeChanged.connect(functools.partial(self.pageHistory, key))
+        if (key, "overlay") in self.curves:
+            self.updateOverlayLines()
+        if self.history is not None:
+            plot_widget.setXRange(*self.history.extent())
+        return plot_widget
+
+    """
+    Create the page for one of the image quality graphs.
+    Inputs: key of the metric in QUALITY_GRAPHS.
+    Outputs: The graph's PlotWidget.
+    """
+    def buildQualityTab(self, key):
+        plot_widget = self.createPlot(key)
+        self.curves[(key, "data")].setData(self.quality_time, self.quality[key], connect = "finite")
+        return plot_widget
+
+    """
+    Store the image quality metrics of a frame with the telemetry history and update their graphs.
+    Inputs: the metrics from image_quality.measureFrame().
+    Outputs: None.
+    """
+    def recordQuality(self, frame_metrics):
+        self.quality_time.append(frame_metrics["camera_time"])
+        for (key, values) in self.quality.items():
+            values.append(frame_metrics[key])
+        self.updateQualityPlots()
+
+    def updateQualityPlots(self):
+        for (key, _) in QUALITY_GRAPHS:
+            if key in self.plot_widgets:
+                self.curves[(key, "data")].setData(self.quality_time, self.quality[key], connect = "finite")
+
+    """
+    Create the auto-focusing page (curve and regression button).
+    Inputs: self.
+    Outputs: The auto-focusing page widget.
+    """
+    def buildAutoFocusTab(self):
+        importPyqtgraph()
+        self.af_graph_tab = QWidget()
+        self.af_graph_layout = QVBoxLayout()
+        self.af_graph_layout.setContentsMargins(0, 0, 0, 0)
+        af_graph_widget = self.createPlot("af")
+        self.curves[("af", "data")].setData(self.auto_focus, self.flux)
+        self.curves[("af", "regression")].setData(self.auto_focus, self.polynomial(self.auto_focus))
+        self.af_polyfit = QPushButton("Polynomial Regression")
+        self.af_polyfit.setStyleSheet("QPushButton { \
+                                       background-color: green; \
+                                       border-style: outset; \
+                                       border-width: 2px; \
+                                       border-color: beige;}")
+        self.af_polyfit.clicked.connect(self.polynomialRegression)
+        self.af_polyfit.setToolTip("Perform a polynomial regression on the auto-focusing data")
+        self.af_graph_layout.addWidget(af_graph_widget)
+        self.af_graph_layout.addWidget(self.af_polyfit)
+        self.af_graph_tab.setLayout(self.af_graph_layout)
+        return self.af_graph_tab
+
+    """
+    Create the pointing stability page (rolling statistics of each pointing channel).
+    Inputs: self.
+    Outputs: The stability page widget.
+    """
+    def buildStabilityTab(self):
+        stability_tab = QWidget()
+        stability_layout = QVBoxLayout()
+        window_layout = QHBoxLayout()
+        self.stability_window = QSpinBox()
+        self.stability_window.setRange(10, 10000)
+        self.stability_window.setValue(self.pointing_stats.window)
+        self.stability_window.setToolTip("Number of most recent solutions the statistics are computed over " \
+                                         "(changing it starts the statistics again)")
+        self.stability_window.editingFinished.connect(self.changeStabilityWindow)
+        self.stability_label = QLabel()
+        window_layout.addWidget(QLabel("Window [solutions]:"))
+        window_layout.addWidget(self.stability_window)
+        window_layout.addWidget(self.stability_label)
+        window_layout.addStretch()
+        channels = self.pointing_stats.channels
+        self.stability_table = QTableWidget(len(channels), len(STABILITY_COLUMNS) + len(pointing_stats.ALLAN_TAUS))
+        self.stability_table.setVerticalHeaderLabels([TELEMETRY_GRAPHS_BY_KEY[key][3].split(" [")[0] 
+                                                      for key in channels])
+        self.stability_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        stability_layout.addLayout(window_layout)
+        stability_layout.addWidget(self.stability_table)
+        stability_tab.setLayout(stability_layout)
+        self.updateStabilityTable()
+        return stability_tab
+
+    """
+    Create the solve-rate page (solve rate over time, counters and the alert threshold).
+    Inputs: self.
+    Outputs: The solve-rate page widget.
+    """
+    def buildSolveRateTab(self):
+        importPyqtgraph()
+        solve_rate_tab = QWidget()
+        solve_rate_layout = QVBoxLayout()
+        solve_rate_layout.setContentsMargins(0, 0, 0, 0)
+        solve_rate_widget = self.createPlot("solve_rate")
+        solve_rate_widget.setYRange(0, 100)
+        counters_layout = QHBoxLayout()
+        self.solve_count_label = QLabel()
+        self.solve_streak_label = QLabel()
+        self.solve_gap_label = QLabel()
+        self.solve_alert_label = QLabel()
+        self.solve_threshold = QSpinBox()
+        self.solve_threshold.setRange(0, 100)
+        self.solve_threshold.setSuffix(" %")
+        self.solve_threshold.setValue(int(round(100*self.solve_monitor.threshold)))
+        self.solve_threshold.setToolTip("Raise an alert when fewer than this percentage of the images in the last " \
+                                        "%d minutes were solved" % (solve_monitor.DEFAULT_ALERT_BUCKETS*
+                                                                    solve_monitor.DEFAULT_BUCKET_SECONDS/60))
+        self.solve_threshold.valueChanged.connect(self.changeSolveThreshold)
+        for widget in (self.solve_count_label, self.solve_streak_label, self.solve_gap_label):
+            counters_layout.addWidget(widget)
+            counters_layout.addStretch()
+        counters_layout.addWidget(QLabel("Alert below:"))
+        counters_layout.addWidget(self.solve_threshold)
+        counters_layout.addWidget(self.solve_alert_label)
+        solve_rate_layout.addWidget(solve_rate_widget)
+        solve_rate_layout.addLayout(counters_layout)
+        solve_rate_tab.setLayout(solve_rate_layout)
+        self.updateSolveRate()
+        return solve_rate_tab
+
+    def changeSolveThreshold(self, value):
+        self.solve_monitor.setThreshold(value/100.0)
+        self.updateSolveRate()
+
+    """
+    Show the current solve rate, counters and alert state in the Solve Rate tab.
+    Inputs: self.
+    Outputs: None.
+    """
+    def updateSolveRate(self):
+        monitor = self.solve_monitor
+        (times, rates) = monitor.series()
+        self.curves[("solve_rate", "data")].setData(times, 100*rates)
+        self.solve_count_label.setText("Solved: %d of %d" % (monitor.solved, monitor.total) + 
+                                       (" (%.0f%%)" % (100*monitor.rate()) if monitor.total else ""))
+        self.solve_streak_label.setText("Failed in a row: %d (longest %d)" % (monitor.failure_streak, 
+                                                                            monitor.longest_failure_streak))
+        if np.isnan(monitor.last_gap):
+            self.solve_gap_label.setText("Time between solves: -")
+        else:
+            self.solve_gap_label.setText("Time between solves: %.0f s (longest %.0f s)" % (monitor.last_gap, 
+                                                                                         monitor.longest_gap))
+        if monitor.alerting:
+            self.solve_alert_label.setText("Solve rate %.0f%%!" % (100*monitor.recentRate()[0]))
+            self.solve_alert_label.setStyleSheet("QLabel { color: red; font-weight: bold; }")
+        else:
+            self.solve_alert_label.setText("")
+
+    """
+    Create the latency page (distributions of the exposure-to-display latency and of the GUI's part of it, and the
+    percentiles of each stage).
+    Inputs: self.
+    Outputs: The latency page widget.
+    """
+    def buildLatencyTab(self):
+        importPyqtgraph()
+        latency_tab = QWidget()
+        latency_layout = QVBoxLayout()
+        latency_layout.setContentsMargins(0, 0, 0, 0)
+        latency_widget = self.createPlot("latency")
+        latency_widget.addLegend()
+        latency_widget.plotItem.legend.addItem(self.curves[("latency", "data")], "Exposure to display (above offset)")
+        latency_widget.plotItem.legend.addItem(self.curves[("latency", "pipeline")], "Receive to display (GUI)")
+        self.latency_stats_label = QLabel()
+        self.latency_stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        latency_layout.addWidget(latency_widget)
+        latency_layout.addWidget(self.latency_stats_label)
+        latency_tab.setLayout(latency_layout)
+        self.updateLatency()
+        return latency_tab
+
+    """
+    Show the latency estimates (in the telemetry section and, once built, the Latency tab) and alert the user when the
+    GUI becomes the bottleneck.
+    Inputs: self.
+    Outputs: None.
+    """
+    def updateLatency(self):
+        stats = self.latency.statistics()
+        if stats["frames"] == 0:
+            self.latency_label.setText("-")
+        else:
+            self.latency_label.setText("%.2f (%.2f above offset), GUI %.0f%% of the time between images" % 
+                                       (stats["total"]["p50"], stats["excess"]["p50"], 100*stats["pipeline_share"]))
+        if stats["bottleneck"] and (not self.latency_bottleneck):
+            message = "The GUI takes %.2f s to show each image, %.0f%% of the time between images" % \
+                      (stats["display"]["p50"], 100*stats["pipeline_share"])
+            print(message)
+            if self.tray_icon is not None:
+                self.tray_icon.showMessage("Star Camera", message, QSystemTrayIcon.Warning)
+        self.latency_bottleneck = stats["bottleneck"]
+        self.latency_label.setStyleSheet("QLabel { color: red; font-weight: bold; }" if stats["bottleneck"] else "")
+        if self.latency_stats_label is None:
+            return
+        self.curves[("latency", "data")].setData(*self.latency.histogram("excess"))
+        self.curves[("latency", "pipeline")].setData(*self.latency.histogram("display"))
+        lines = ["Clock offset: %.3f s    Time between images: %.2f s    Frames: %d" % (stats["offset"], 
+                                                                                        stats["period"], 
+                                                                                        stats["frames"])]
+        for (stage, name) in (("camera", "Camera timestamp to packet"), ("transfer", "Image transfer"), 
+                              ("display", "Receive to display (GUI)"), ("total", "Exposure to display"), 
+                              ("excess", "Exposure to display above offset")):
+            percentiles = stats[stage]
+            lines.append("%s: median %.3f s, 90%% %.3f s, 99%% %.3f s, max %.3f s" % 
+                         (name, percentiles["p50"], percentiles["p90"], percentiles["p99"], percentiles["max"]))
+        if stats["bottleneck"]:
+            lines.append("The GUI, not the camera, is the bottleneck")
+        self.latency_stats_label.setText("\n".join(lines))
+
+    """
+    Compare a new solution with the pointing predicted from the previous ones, and flag sudden jumps.
+    Inputs: camera time, solved RA and DEC.
+    Outputs: None.
+    """
+    def checkPrediction(self, camera_time, ra, dec):
+        (prediction, error, jump) = self.pointing_predictor.add(camera_time, ra, dec)
+        if prediction is None:
+            self.prediction_box.setText("")
+            return
+        self.predicted_time.append(camera_time)
+        self.predicted_ra.append(prediction[0])
+        self.predicted_dec.append(prediction[1])
+        self.prediction_box.setText("%.1f" % (3600*error))
+        if jump:
+            print("Pointing jumped %.1f arcsec from the predicted position" % (3600*error))
+            self.prediction_box.setStyleSheet("QLabel { color: red; font-weight: bold; }")
+        else:
+            self.prediction_box.setStyleSheet("")
+
+    """
+    Count a packet in the solve-rate monitor and alert the user if the solve rate has just dropped too low.
+    Inputs: camera time and whether the image was solved.
+    Outputs: None.
+    """
+    def recordSolve(self, camera_time, solved):
+        if self.solve_monitor.add(camera_time, solved):
+            (rate, attempts) = self.solve_monitor.recentRate()
+            message = "Only %.0f%% of the last %d images were solved (clouds or defocus?)" % (100*rate, attempts)
+            print(message)
+            if self.tray_icon is not None:
+                self.tray_icon.showMessage("Star Camera", message, QSystemTrayIcon.Warning)
+        if "solve_rate" in self.plot_widgets:
+            self.updateSolveRate()
+
+    """ Start the pointing statistics again with the window length entered in the Stability tab. """
+    def changeStabilityWindow(self):
+        if self.stability_window.value() != self.pointing_stats.window:
+            self.pointing_stats.reset(self.stability_window.value())
+            self.updateStabilityTable()
+
+    """
+    Show the current pointing statistics in the Stability tab.
+    Inputs: self.
+    Outputs: None.
+    """
+    def updateStabilityTable(self):
+        statistics = self.pointing_stats.statistics()
+        interval = next(iter(statistics.values()))["interval"]
+        # the Allan deviation is averaged over a number of solutions; show it in seconds once the cadence is known
+        taus = ["%g s" % (tau*interval) if not np.isnan(interval) else "%d solutions" % tau 
+                for tau in pointing_stats.ALLAN_TAUS]
+        self.stability_table.setHorizontalHeaderLabels(STABILITY_COLUMNS + ["ADEV %s [arcsec]" % tau for tau in taus])
+        for (row, channel) in enumerate(statistics.values()):
+            allan = list(channel["allan"].values())
+            cells = ["%.5f" % channel["mean"], "%.2f" % (3600*channel["std"]), "%.5f" % channel["min"], 
+                     "%.5f" % channel["max"], "%.3f" % (3600*60*channel["drift"])] + \
+                    ["%.2f" % (3600*value) for value in allan] + [""]*(len(taus) - len(allan))
+            for (column, cell) in enumerate(cells):
+                self.stability_table.setItem(row, column, QTableWidgetItem(cell if cell != "nan" else ""))
+        count = next(iter(statistics.values()))["count"]
+        self.stability_label.setText("%d solutions in the window" % count + 
+                                     (", %.1f s apart" % interval if not np.isnan(interval) else ""))
+
+    """
+    Let the user pick a stored telemetry log (or a data.txt file, which is imported into a log in the background, in
+    full the first time and then only the rows added since) and show it in the telemetry graphs once it is ready.
+    Inputs: self.
+    Outputs: None.
+    """
+    def loadHistory(self):
+        (path, _) = QFileDialog.getOpenFileName(self, "Load Telemetry History", script_dir, 
+                                                "Telemetry (*.f64 *.txt);;All files (*)")
+        if not path:
+            return
+        self.history_thread = HistoryImportThread(path)
+        self.history_thread.progress.connect(self.updateHistoryProgress)
+        self.history_thread.import_finished.connect(self.historyImported)
+        self.history_button.setEnabled(False)
+        self.history_progress.setValue(0)
+        self.history_progress.setVisible(True)
+        self.history_thread.start()
+
+    def updateHistoryProgress(self, done, total):
+        self.history_progress.setMaximum(total)
+        self.history_progress.setValue(done)
+
+    """
+    Open the telemetry log found (or imported) by the history thread and show it in the telemetry graphs.
+    Inputs: root of the log (None if it could not be found) and an error message.
+    Outputs: None.
+    """
+    def historyImported(self, root, error):
+        self.history_thread.wait()
+        self.history_thread = None
+        self.history_progress.setVisible(False)
+        self.history_button.setEnabled(True)
+        if root is not None:
+            import history
+            try:
+                self.history = history.TelemetryHistory(root)
+            except (OSError, ValueError) as history_error:
+                error = str(history_error)
+        if error:
+            msg = QMessageBox()
+            msg.setWindowTitle("Star Camera")
+            msg.setWindowIcon(QIcon(script_dir + os.path.sep + "SO_icon.png"))
+            msg.setIcon(QMessageBox.Warning)
+            msg.setText("Could not load telemetry history from this file: %s" % error)
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.exec_()
+            return
+        # zoom the graphs that exist out to the whole log; the rest do this when they are built
+        for key in TELEMETRY_GRAPHS_BY_KEY:
+            if key in self.plot_widgets:
+                self.plot_widgets[key].setXRange(*self.history.extent())
+
+    """
+    Ask what to export and start writing it in the background (or, if an export is running, cancel it).
+    Inputs: self.
+    Outputs: None.
+    """
+    def exportData(self):
+        if self.export_thread is not None:
+            self.export_thread.requestInterruption()
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Export Data")
+        form = QFormLayout()
+        telemetry_source = QComboBox()
+        telemetry_source.addItems(["This session", "Telemetry log", "None"])
+        start_box = QLineEdit()
+        start_box.setPlaceholderText("e.g. 2020-02-01T02:00:00 (UTC) or C time")
+        end_box = QLineEdit()
+        end_box.setPlaceholderText("blank for no limit")
+        frames_source = QComboBox()
+        frames_source.addItems(["Filmstrip frames", "Recording folder...", "None"])
+        format_box = QComboBox()
+        format_box.addItems(["HDF5", "NPZ", "FITS"])
+        form.addRow(QLabel("Telemetry:"), telemetry_source)
+        form.addRow(QLabel("From:"), start_box)
+        form.addRow(QLabel("To:"), end_box)
+        form.addRow(QLabel("Images:"), frames_source)
+        form.addRow(QLabel("Format:"), format_box)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        dialog.setLayout(form)
+        if not dialog.exec_():
+            return
+
+        # the time range applies to the telemetry log and recording folders
+        try:
+            t0 = telemetry_log.parseTime(start_box.text()) if start_box.text().strip() else None
+            t1 = telemetry_log.parseTime(end_box.text()) if end_box.text().strip() else None
+        except argparse.ArgumentTypeError as error:
+            self.showExportMessage(QMessageBox.Warning, str(error).capitalize() + ".")
+            return
+        load_telemetry = None
+        if telemetry_source.currentText() == "This session":
+            # copied now, since the lists keep growing while the export runs
+            columns = {"ctime": self.time, "ra": self.ra, "dec": self.dec, "fr": self.fr, "ps": self.ps, 
+                       "ir": self.ir, "alt": self.alt, "az": self.az}
+            session = {name: np.array(values, dtype = np.float64) for (name, values) in columns.items()}
+            load_telemetry = lambda: session
+        elif telemetry_source.currentText() == "Telemetry log":
+            root = self.history.log.root if self.history is not None else telemetry_log.DEFAULT_ROOT
+            # no limit means from the start of 1970 to the end of 2105
+            (start, end) = (t0 if t0 is not None else 0.0, t1 if t1 is not None else float(2**32))
+            load_telemetry = lambda: telemetry_log.TelemetryLog(root).query(start, end)
+        frames = []
+        if frames_source.currentText() == "Filmstrip frames":
+            frames = [(self.frame_cache.frameTime(key), functools.partial(self.cachedFrameForExport, key)) 
+                      for key in reversed(self.frame_cache.keys())]
+        elif frames_source.currentText() == "Recording folder...":
+            directory = QFileDialog.getExistingDirectory(self, "Recording Folder", script_dir)
+            if not directory:
+                return
+            import export_engine
+            frames = export_engine.recordedFrames(directory, t0, t1)
+
+        import export_engine
+        export_format = format_box.currentText().lower()
+        extension = export_engine.EXTENSIONS[export_format]
+        (path, _) = QFileDialog.getSaveFileName(self, "Export Data", script_dir + os.path.sep + "export" + extension,
+                                                "%s (*%s)" % (format_box.currentText(), extension))
+        if not path:
+            return
+        self.export_thread = ExportThread(path, export_format, load_telemetry, frames)
+        self.export_thread.progress.connect(self.updateExportProgress)
+        self.export_thread.export_finished.connect(self.exportFinished)
+        self.export_progress.setValue(0)
+        self.export_progress.setVisible(True)
+        self.export_button.setText("Cancel Export")
+        self.export_thread.start()
+
+    """
+    Get a frame from the frame cache for an export, in the camera's own pixel coordinates (like the frame stack).
+    Inputs: key of the frame.
+    Outputs: The image, or None if it has dropped out of the cache.
+    """
+    def cachedFrameForExport(self, key):
+        image = self.frame_cache.get(key, touch = False)
+        return None if image is None else image[::-1, :]
+
+    def updateExportProgress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+
+    """
+    Clean up after an export and report any problem.
+    Inputs: error message (empty if the export was written).
+    Outputs: None.
+    """
+    def exportFinished(self, error):
+        self.export_thread.wait()
+        self.export_thread = None
+        self.export_progress.setVisible(False)
+        self.export_button.setText("Export Data...")
+        if error:
+            self.showExportMessage(QMessageBox.Warning, error)
+
+    def showExportMessage(self, icon, text):
+        msg = QMessageBox()
+        msg.setWindowTitle("Star Camera")
+        msg.setWindowIcon(QIcon(script_dir + os.path.sep + "SO_icon.png"))
+        msg.setIcon(icon)
+        msg.setText(text)
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
+    """
+    Load the part of the history that is visible in one of the telemetry graphs (plus half a screen on each side).
+    Inputs: key of the graph in TELEMETRY_GRAPHS (the remaining arguments of the range-changed signal are unused).
+    Outputs: None.
+    """
+    def pageHistory(self, key, *args):
+        if self.history is None:
+            return
+        graph_widget = self.plot_widgets[key]
+        (t0, t1) = graph_widget.viewRange()[0]
+        margin = (t1 - t0)/2.0
+        (times, values) = self.history.window(key, t0 - margin, t1 + margin, max(4*graph_widget.width(), 1000))
+        self.curves[(key, "history")].setData(times, values)
 
     """ 
     Change the GUI operating system style. 
@@ -728,76 +1728,10 @@ class GUI(QDialog):
 
     """ Change the GUI color palette. """
     def changePalette(self):
-        regression_pen = pg.mkPen(color = "#ADFF2F", width = 3)
-        self.regression = self.af_graph_widget.plot(self.auto_focus, self.polynomial(self.auto_focus), 
-                                                    pen = regression_pen, symbol = "+", symbolSize = 9, 
-                                                    symbolBrush = ("#ADFF2F"))
         if self.color_box.currentText() == "Light":
             QApplication.setPalette(self.original_palette)
-            # background color for all telemetry graphs in this color scheme
-            self.image_widget.setBackground("#ffffff")
-            self.alt_graph_widget.setBackground("#ffffff")
-            self.az_graph_widget.setBackground("#ffffff")
-            self.ra_graph_widget.setBackground("#ffffff")
-            self.dec_graph_widget.setBackground("#ffffff")
-            self.fr_graph_widget.setBackground("#ffffff")
-            self.ps_graph_widget.setBackground("#ffffff")
-            self.ir_graph_widget.setBackground("#ffffff")
-            self.af_graph_widget.setBackground("#ffffff")
-            # titles of graphs
-            title_style = {"color": "#524f4f", "font-size": "30pt"}
-            self.alt_graph_widget.setTitle("Observed  Altitude [deg]", **title_style)
-            self.az_graph_widget.setTitle("Observed Azimuth [deg]", **title_style)
-            self.ra_graph_widget.setTitle("Observed Right Ascension [deg]", **title_style)
-            self.dec_graph_widget.setTitle("Observed  Declination [deg]", **title_style)
-            self.fr_graph_widget.setTitle("Observed Field Rotation [deg]", **title_style)
-            self.ps_graph_widget.setTitle("Observed Pixel Scale [arcsec/px]", **title_style)
-            self.ir_graph_widget.setTitle("Observed Image Rotation [deg]", **title_style)
-            self.af_graph_widget.setTitle("Auto-focusing curve", **title_style)
-            # axes labels for graphs
-            label_style = {"color": "#524f4f", "font-size": "10pt"}
-            self.alt_graph_widget.setLabel("left", "Altitude [deg]", **label_style)
-            self.alt_graph_widget.setLabel("right", "Altitude [deg]", **label_style)
-            self.alt_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.az_graph_widget.setLabel("left", "Azimuth [deg]", **label_style)
-            self.az_graph_widget.setLabel("right", "Azimuth [deg]", **label_style)
-            self.az_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.ra_graph_widget.setLabel("left", "RA [deg]", **label_style)
-            self.ra_graph_widget.setLabel("right", "RA [deg]", **label_style)
-            self.ra_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.dec_graph_widget.setLabel("left", "DEC [deg]", **label_style)
-            self.dec_graph_widget.setLabel("right", "DEC [deg]", **label_style)
-            self.dec_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.fr_graph_widget.setLabel("left", "FR [deg]", **label_style)
-            self.fr_graph_widget.setLabel("right", "FR [deg]", **label_style)
-            self.fr_graph_widget.setLabel("bottom", "Raw time (seconds)", **label_style)
-            self.ps_graph_widget.setLabel("left", "PS [arcsec/px]", **label_style)
-            self.ps_graph_widget.setLabel("right", "PS [arcsec/px]", **label_style)
-            self.ps_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.ir_graph_widget.setLabel("left", "IR [deg]", **label_style)
-            self.ir_graph_widget.setLabel("right", "IR [deg]", **label_style)
-            self.ir_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.af_graph_widget.setLabel("left", "Flux [raw pixel value]", **label_style)
-            self.af_graph_widget.setLabel("right", "Flux [raw pixel value]", **label_style)
-            self.af_graph_widget.setLabel("bottom", "Focus position [encoder counts]", **label_style)
-            # create a reference to the line of each graph for updating telemetry as it arrives
-            pen = pg.mkPen(color = "#524f4f", width = 3)
-            self.altitude_line = self.alt_graph_widget.plot(self.time, self.alt, pen = pen, symbol = "o", 
-                                                            symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.azimuth_line = self.az_graph_widget.plot(self.time, self.az, pen = pen, symbol = "o", 
-                                                          symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.ra_line = self.ra_graph_widget.plot(self.time, self.ra, pen = pen, symbol = "o", 
-                                                     symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.dec_line = self.dec_graph_widget.plot(self.time, self.dec, pen = pen, symbol = "o", 
-                                                       symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.fr_line = self.fr_graph_widget.plot(self.time, self.fr, pen = pen, symbol = "o", 
-                                                     symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.ps_line = self.ps_graph_widget.plot(self.time, self.ps, pen = pen, symbol = "o", 
-                                                     symbolSize = 9, symbolBrush = ("#524f4f")) 
-            self.ir_line = self.ir_graph_widget.plot(self.time, self.ir, pen = pen, symbol = "o", 
-                                                     symbolSize = 9, symbolBrush = ("#524f4f"))
-            self.af_line = self.af_graph_widget.plot(self.auto_focus, self.flux, pen = pen, symbol = "o", 
-                                                     symbolSize = 9, symbolBrush = ("#524f4f"))
+            # colors for all telemetry graphs in this color scheme
+            self.theme = {"background": "#ffffff", "text": "#524f4f", "line": "#524f4f", "symbol_size": 9}
         elif self.color_box.currentText() == "Dark":
             # define dark color palette
             self.dark_palette = QPalette()
@@ -814,71 +1748,42 @@ class GUI(QDialog):
             self.dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
             self.dark_palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
             self.dark_palette.setColor(QPalette.HighlightedText, Qt.black)
-            # background color for all telemetry graphs in this color scheme
-            self.image_widget.setBackground("#434343")
-            self.alt_graph_widget.setBackground("#434343")
-            self.az_graph_widget.setBackground("#434343")
-            self.ra_graph_widget.setBackground("#434343")
-            self.dec_graph_widget.setBackground("#434343")
-            self.fr_graph_widget.setBackground("#434343")
-            self.ps_graph_widget.setBackground("#434343")
-            self.ir_graph_widget.setBackground("#434343")
-            self.af_graph_widget.setBackground("#434343")
-            # titles of graphs
-            title_style = {"color": "#FFF", "font-size": "30pt"}
-            self.alt_graph_widget.setTitle("Observed  Altitude [deg]", **title_style)
-            self.az_graph_widget.setTitle("Observed Azimuth [deg]", **title_style)
-            self.ra_graph_widget.setTitle("Observed Right Ascension [deg]", **title_style)
-            self.dec_graph_widget.setTitle("Observed  Declination [deg]", **title_style)
-            self.fr_graph_widget.setTitle("Observed Field Rotation [deg]", **title_style)
-            self.ps_graph_widget.setTitle("Observed Pixel Scale [arcsec/px]", **title_style)
-            self.ir_graph_widget.setTitle("Observed Image Rotation [deg]", **title_style)
-            self.af_graph_widget.setTitle("Auto-focusing curve", **title_style)
-            # axes labels for graphs
-            label_style = {"color": "#FFF", "font-size": "10pt"}
-            self.alt_graph_widget.setLabel("left", "Altitude [deg]", **label_style)
-            self.alt_graph_widget.setLabel("right", "Altitude [deg]", **label_style)
-            self.alt_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.az_graph_widget.setLabel("left", "Azimuth [deg]", **label_style)
-            self.az_graph_widget.setLabel("right", "Azimuth [deg]", **label_style)
-            self.az_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.ra_graph_widget.setLabel("left", "RA [deg]", **label_style)
-            self.ra_graph_widget.setLabel("right", "RA [deg]", **label_style)
-            self.ra_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.dec_graph_widget.setLabel("left", "DEC [deg]", **label_style)
-            self.dec_graph_widget.setLabel("right", "DEC [deg]", **label_style)
-            self.dec_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.fr_graph_widget.setLabel("left", "FR [deg]", **label_style)
-            self.fr_graph_widget.setLabel("right", "FR [deg]", **label_style)
-            self.fr_graph_widget.setLabel("bottom", "Raw time (seconds)", **label_style)
-            self.ps_graph_widget.setLabel("left", "PS [arcsec/px]", **label_style)
-            self.ps_graph_widget.setLabel("right", "PS [arcsec/px]", **label_style)
-            self.ps_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.ir_graph_widget.setLabel("left", "IR [deg]", **label_style)
-            self.ir_graph_widget.setLabel("right", "IR [deg]", **label_style)
-            self.ir_graph_widget.setLabel("bottom", "Raw time [seconds]", **label_style)
-            self.af_graph_widget.setLabel("left", "Flux [raw pixel value]", **label_style)
-            self.af_graph_widget.setLabel("right", "Flux [raw pixel value]", **label_style)
-            self.af_graph_widget.setLabel("bottom", "Focus position [encoder counts]", **label_style)
-            # create a reference to the line of each graph for updating telemetry as it arrives
-            pen = pg.mkPen(color = "w", width = 3)
-            self.altitude_line = self.alt_graph_widget.plot(self.time, self.alt, pen = pen, symbol = "o", 
-                                                            symbolsize = 8, symbolBrush = ("w"))
-            self.azimuth_line = self.az_graph_widget.plot(self.time, self.az, pen = pen, symbol = "o", 
-                                                          symbolSize = 8, symbolBrush = ("w"))
-            self.ra_line = self.ra_graph_widget.plot(self.time, self.ra, pen = pen, symbol = "o", symbolSize = 8, 
-                                                     symbolBrush = ("w"))
-            self.dec_line = self.dec_graph_widget.plot(self.time, self.dec, pen = pen, symbol = "o", symbolSize = 8, 
-                                                       symbolBrush = ("w"))
-            self.fr_line = self.fr_graph_widget.plot(self.time, self.fr, pen = pen, symbol = "o", symbolSize = 8, 
-                                                     symbolBrush = ("w"))
-            self.ps_line = self.ps_graph_widget.plot(self.time, self.ps, pen = pen, symbol = "o", symbolSize = 8, 
-                                                     symbolBrush = ("w")) 
-            self.ir_line = self.ir_graph_widget.plot(self.time, self.ir, pen = pen, symbol = "o", symbolSize = 8, 
-                                                     symbolBrush = ("w"))
-            self.af_line = self.af_graph_widget.plot(self.auto_focus, self.flux, pen = pen, symbol = "o", 
-                                                     symbolSize = 8, symbolBrush = ("w"))
+            # colors for all telemetry graphs in this color scheme
+            self.theme = {"background": "#434343", "text": "#FFF", "line": "w", "symbol_size": 8}
             QApplication.setPalette(self.dark_palette)
+        # only the graphs whose tabs have been opened exist yet; the rest are styled when they are built
+        if self.image_widget is not None:
+            self.image_widget.setBackground(self.theme["background"])
+            self.histogram_widget.setBackground(self.theme["background"])
+        for key in self.plot_widgets:
+            self.stylePlot(key)
+
+    """
+    Apply the current color scheme to one of the graphs, restyling its title, labels and curves in place.
+    Inputs: key of the graph in GRAPHS.
+    Outputs: None.
+    """
+    def stylePlot(self, key):
+        (title, axis_label, bottom_label, curves) = GRAPHS[key]
+        plot_widget = self.plot_widgets[key]
+        plot_widget.setBackground(self.theme["background"])
+        # title and axes labels of graph
+        title_style = {"color": self.theme["text"], "font-size": "30pt"}
+        plot_widget.setTitle(title, **title_style)
+        label_style = {"color": self.theme["text"], "font-size": "10pt"}
+        plot_widget.setLabel("left", axis_label, **label_style)
+        plot_widget.setLabel("right", axis_label, **label_style)
+        plot_widget.setLabel("bottom", bottom_label, **label_style)
+        for curve in curves:
+            (color, width, line_style, symbol, symbol_size) = CURVE_STYLES[curve]
+            color = self.theme["line"] if color is None else color
+            line = self.curves[(key, curve)]
+            line.setPen(pg.mkPen(color = color, width = width, style = line_style))
+            line.setSymbol(symbol)
+            if symbol is not None:
+                line.setSymbolSize(self.theme["symbol_size"] if symbol_size is None else symbol_size)
+                line.setSymbolBrush(color)
+                line.setSymbolPen(color)
 
     """ 
     Activate connections when IP address is input and start button is clicked. 
@@ -891,8 +1796,13 @@ class GUI(QDialog):
             # after IP address is entered and 'start' button is clicked, 
             # establish socket with the StarCamera
             try:
-                self.socket_package = listening_final.establishStarCamSocket(self.ip_input.text(), 
-                                                                             int(self.port_input.text()))
+                if self.use_receiver_process:
+                    import receiver_process
+                    self.socket_package = receiver_process.establishReceiverProcess(self.ip_input.text(), 
+                                                                                    int(self.port_input.text()))
+                else:
+                    self.socket_package = listening_final.establishStarCamSocket(self.ip_input.text(), 
+                                                                                 int(self.port_input.text()))
                 self.main_socket = self.socket_package[0]
                 self.StarCam_IP = self.socket_package[1]
                 self.StarCam_PORT = self.socket_package[2]
@@ -939,12 +1849,18 @@ class GUI(QDialog):
     Outputs: None.
     """
     def displayTelemetryAndCameraSettings(self, data):
+        self.metrics.add(telemetry_handled = 1)
         # unpack the telemetry and camera settings
         unpacked_data = struct.unpack_from("d d d d d d d d d d d d d ii ii ii ii d d ii ii ii ii ii ii ii fi ii", data)
 
         # telemetry data parsing (always update for display, no matter what, since user is 
         # not interacting with this panel)
         self.time_box.setText(time.asctime(time.gmtime(unpacked_data[1])))
+        # the image that follows this telemetry is filed in the frame cache under this time
+        self.latest_camera_time = unpacked_data[1]
+        # latitude and longitude of the camera, for converting between RA/DEC and ALT/AZ
+        if (unpacked_data[3] != 0) or (unpacked_data[4] != 0):
+            self.site = (unpacked_data[3], unpacked_data[4])
         self.ra_box.setText(str(unpacked_data[6]))
         self.dec_box.setText(str(unpacked_data[7]))
         self.fr_box.setText(str(unpacked_data[8]))
@@ -953,14 +1869,20 @@ class GUI(QDialog):
         self.ir_box.setText(str(unpacked_data[10]))
         self.ps_box.setText(str(unpacked_data[9]))
         self.auto_focus_state = unpacked_data[24]
+        # zeros in the pointing telemetry mean the image could not be solved
+        solved = (unpacked_data[6] != 0 and unpacked_data[7] != 0 and unpacked_data[8] != 0 and 
+                  unpacked_data[9] != 0 and unpacked_data[10] != 0 and unpacked_data[11] != 0 and 
+                  unpacked_data[12] != 0)
+        # images taken while auto-focusing are not meant to be solved, so they do not count towards the solve rate
+        if not unpacked_data[24]:
+            self.recordSolve(unpacked_data[1], solved)
         # only add to auto-focusing data if we are in an auto-focusing process
         if (unpacked_data[24]) and (self.focus_slider.previous_value != unpacked_data[14]):
             self.auto_focus.append(unpacked_data[14])
             self.flux.append(unpacked_data[29])
         # if every single telemetry data point is 0, esp. pixel scale, that is before first solution of the run
         # (i.e. when camera is running for first time and auto-focusing by default)
-        elif (unpacked_data[6] != 0 and unpacked_data[7] != 0 and unpacked_data[8] != 0 and unpacked_data[9] != 0 and
-              unpacked_data[10] != 0 and unpacked_data[11] != 0 and unpacked_data[12] != 0):
+        elif solved:
             self.time.append(unpacked_data[1])
             self.ra.append(unpacked_data[6])
             self.dec.append(unpacked_data[7])
@@ -969,6 +1891,12 @@ class GUI(QDialog):
             self.alt.append(unpacked_data[11])
             self.ir.append(unpacked_data[10])
             self.ps.append(unpacked_data[9])
+            self.checkPrediction(unpacked_data[1], unpacked_data[6], unpacked_data[7])
+            self.pointing_stats.add(unpacked_data[1], {"ra": unpacked_data[6], "dec": unpacked_data[7], 
+                                                       "fr": unpacked_data[8], "ir": unpacked_data[10], 
+                                                       "alt": unpacked_data[11], "az": unpacked_data[12]})
+            if self.stability_table is not None:
+                self.updateStabilityTable()
 
         # if newly received logodds value is different from previous value, update logodds field
         # (and do the same for all following fields for camera settings)
@@ -1013,6 +1941,8 @@ class GUI(QDialog):
                 self.auto_focus_box.setChecked(True)
             else:
                 self.auto_focus_box.setChecked(False)
+            if self.focus_planner is not None:
+                self.focusSweepChanged(unpacked_data[24])
 
         if (self.prev_start_focus != unpacked_data[25]):
             self.prev_start_focus = unpacked_data[25]
@@ -1105,19 +2035,289 @@ class GUI(QDialog):
             self.use_staticHP.setChecked(bool(unpacked_data[40]))
             self.prev_useHP = unpacked_data[40]
 
+        # confirm the step of the running observing sequence, or count its images
+        if self.sequence_runner is not None:
+            self.sequence_runner.telemetry(unpacked_data, time.monotonic())
+            self.sequence_label.setText(self.sequence_runner.status())
+
     """ 
     Update StarCamera image data. 
     Inputs: Raw image bytes to display.
     Outputs: None.
     """
     def updateImageData(self, image_bytes):
+        self.memory_budget.frameDequeued()
+        decode_start = time.perf_counter()
         # convert bytearray to numpy array for manipulation
         image_bytes = np.array(image_bytes) 
         image_bytes = np.reshape(image_bytes, (CAMERA_HEIGHT, CAMERA_WIDTH))
+        # stack in the camera's own pixel coordinates, so exported maps match the camera's
+        if (self.stack_box is not None) and self.stack_box.isChecked():
+            if self.frame_stack is None:
+                self.frame_stack = frame_stack.FrameStack(image_bytes.shape)
+            self.frame_stack.add(image_bytes)
+            self.stack_count_label.setText("%d frames stacked" % self.frame_stack.count)
         # reverse array along vertical direction (flip y coordinates)
         image_bytes = image_bytes[::-1, ::-1]
         image_bytes = image_bytes[::, ::-1]
-        self.img_item.setImage(image_bytes)
+        # keep the image around in case the Images tab has not been built yet
+        self.latest_image = image_bytes
+        camera_time = self.latest_camera_time if self.latest_camera_time is not None else time.time()
+        self.latest_image_time = camera_time
+        self.frame_cache.add(image_bytes, camera_time)
+        self.metrics.observe("decode", time.perf_counter() - decode_start)
+        self.metrics.add(frames_handled = 1)
+        if self.img_item is None:
+            # nothing is drawn until the Images tab is opened, so the image is as far as it goes once decoded
+            self.latency.displayed(camera_time)
+        self.refreshFilmstrip()
+        self.showImage()
+        if (self.show_blobs_box is not None) and self.show_blobs_box.isChecked():
+            self.blob_thread.submit(image_bytes, self.blobParameters())
+        if not self.quality_thread.isRunning():
+            self.quality_thread.start()
+        self.quality_thread.submit(image_bytes, camera_time)
+
+    """
+    Show the latest image, or the product of the frame stack chosen in the Images tab.
+    Inputs: self (the argument of the combo box signal is unused).
+    Outputs: None.
+    """
+    def showImage(self, *args):
+        if self.img_item is None:
+            return
+        view = self.stack_view.currentText()
+        if (view == "Live image") or (self.frame_stack is None) or (self.frame_stack.count == 0):
+            (image, camera_time) = (self.latest_image, self.latest_image_time)
+            if self.viewed_frame is not None:
+                (image, camera_time) = (self.frame_cache.get(self.viewed_frame), None)
+                if image is None:
+                    # the frame has dropped out of the cache
+                    self.viewed_frame = None
+                    self.live_button.setEnabled(False)
+                    (image, camera_time) = (self.latest_image, self.latest_image_time)
+            if image is not None:
+                self.pyramid_thread.submit(image, self.pyramid_mode.currentText().lower(), camera_time)
+            return
+        if view == "Stack mean":
+            product = self.frame_stack.mean
+        elif view == "Stack median":
+            product = self.frame_stack.median()
+        elif view == "Stack variance":
+            product = self.frame_stack.variance()
+        else:
+            product = self.frame_stack.hotPixelMask().astype(np.uint8)
+        # same vertical flip as the live image
+        self.pyramid_thread.submit(product[::-1, :], self.pyramid_mode.currentText().lower())
+
+    """
+    Bring the filmstrip in the Images tab up to date with the frame cache: add thumbnails of new frames and remove
+    those of frames that have dropped out of the cache.
+    Inputs: self.
+    Outputs: None.
+    """
+    def refreshFilmstrip(self):
+        if self.filmstrip is None:
+            return
+        keys = self.frame_cache.keys()
+        cached = set(keys)
+        shown = set()
+        for row in reversed(range(self.filmstrip.count())):
+            key = self.filmstrip.item(row).data(Qt.UserRole)
+            if key in cached:
+                shown.add(key)
+            else:
+                self.filmstrip.takeItem(row)
+        # new frames go on the left, in time order
+        for key in reversed([key for key in keys if key not in shown]):
+            thumbnail = np.ascontiguousarray(self.frame_cache.thumbnail(key))
+            (height, width) = thumbnail.shape
+            thumbnail_image = QImage(thumbnail.data, width, height, width, QImage.Format_Grayscale8)
+            item = QListWidgetItem(QIcon(QPixmap.fromImage(thumbnail_image)), 
+                                   time.strftime("%H:%M:%S", time.gmtime(self.frame_cache.frameTime(key))))
+            item.setData(Qt.UserRole, key)
+            self.filmstrip.insertItem(0, item)
+
+    """
+    Show a frame from the filmstrip instead of the live image.
+    Inputs: the clicked filmstrip item.
+    Outputs: None.
+    """
+    def openCachedFrame(self, item):
+        self.viewed_frame = item.data(Qt.UserRole)
+        self.live_button.setEnabled(True)
+        # the cached frames are raw images, so show them as such rather than a stack product
+        self.stack_view.setCurrentIndex(0)
+        self.showImage()
+
+    """ Go back to showing the newest image. """
+    def showLiveImage(self):
+        self.viewed_frame = None
+        self.live_button.setEnabled(False)
+        self.filmstrip.clearSelection()
+        self.showImage()
+
+    """
+    Show a newly built image pyramid: update the histogram and levels, and display the level for the current zoom.
+    Inputs: the pyramid from buildTaggedPyramid().
+    Outputs: None.
+    """
+    def displayPyramid(self, pyramid):
+        render_start = time.perf_counter()
+        self.pyramid = pyramid
+        (counts, edges) = pyramid["histogram"]
+        self.histogram_curve.setData((edges[:-1] + edges[1:])/2.0, counts)
+        if self.auto_levels_box.isChecked() or (self.image_levels is None):
+            # the coarsest level is small, so this costs almost nothing
+            coarsest = pyramid["levels"][-1][1]
+            self.image_levels = (float(coarsest.min()), max(float(coarsest.max()), float(coarsest.min()) + 1.0))
+            self.levels_region.blockSignals(True)
+            self.levels_region.setRegion(self.image_levels)
+            self.levels_region.blockSignals(False)
+        self.showPyramidLevel(force = True)
+        self.metrics.observe("render", time.perf_counter() - render_start)
+        self.metrics.add(frames_displayed = 1)
+        if pyramid["camera_time"] is not None:
+            self.latency.displayed(pyramid["camera_time"])
+
+    """
+    Keep the process within its memory budget: thin out the telemetry history if it has outgrown its share (and
+    redraw the graphs), and show what each part of the budget uses.
+    Inputs: self.
+    Outputs: None.
+    """
+    def enforceMemoryBudget(self):
+        telemetry_lists = [self.time, self.alt, self.az, self.ra, self.dec, self.fr, self.ir, self.ps]
+        predicted_lists = [self.predicted_time, self.predicted_ra, self.predicted_dec]
+        quality_lists = [self.quality_time] + list(self.quality.values())
+        def telemetryBytes():
+            return memory_budget.BYTES_PER_VALUE*sum(len(values) for values in telemetry_lists + predicted_lists + 
+                                                     quality_lists + [self.auto_focus, self.flux])
+        decimated = False
+        while (telemetryBytes() > self.memory_budget.limit("telemetry")) and \
+              ((len(self.time) >= 4) or (len(self.quality_time) >= 4)):
+            for lists in (telemetry_lists, predicted_lists, quality_lists):
+                if len(lists[0]) >= 4:
+                    memory_budget.decimateLists(lists)
+            decimated = True
+        if decimated:
+            print("Telemetry history thinned out to %d points to stay within the memory budget" % len(self.time))
+            self.updatePlotData()
+            self.updateQualityPlots()
+        self.memory_budget.setUsage("telemetry", telemetryBytes())
+        self.memory_budget.setUsage("frames", self.frame_cache.memoryUsage())
+        self.memory_label.setText(", ".join("%s %.0f/%.0f" % (name, used/2**20, limit/2**20) for (name, (used, limit)) 
+                                            in self.memory_budget.usage().items()))
+
+    """
+    Count the images that were never drawn: those the image pyramid thread skipped to keep up with the newest one,
+    plus (with a receiver process) those the GUI skipped in the shared frame ring.
+    Inputs: self.
+    Outputs: Number of images.
+    """
+    def droppedFrames(self):
+        dropped = self.pyramid_thread.dropped + self.memory_budget.dropped_frames
+        if self.use_receiver_process and hasattr(self.GUItelemetry, "StarCam_socket"):
+            dropped += self.GUItelemetry.StarCam_socket.skipped_images
+        return dropped
+
+    """
+    Display the pyramid level that matches the zoom of the Images tab (called whenever the view range changes).
+    Inputs: whether to set the image even if the level has not changed (the signal arguments are unused).
+    Outputs: None.
+    """
+    def showPyramidLevel(self, *args, force = False):
+        if self.pyramid is None:
+            return
+        levels = self.pyramid["levels"]
+        (pixel_width, pixel_height) = self.image_view.viewPixelSize()
+        index = image_pyramid.levelForScale(levels, min(pixel_width, pixel_height))
+        if (index == self.pyramid_index) and (not force):
+            return
+        self.pyramid_index = index
+        self.img_item.setImage(levels[index][1], autoLevels = False, levels = self.image_levels)
+        # every level covers the full-resolution coordinates, so zooming and the star overlay are unaffected
+        (height, width) = levels[0][1].shape
+        self.img_item.setRect(QRectF(0, 0, width, height))
+
+    """ Use the levels chosen by dragging the region in the histogram, and stop setting them automatically. """
+    def levelsDragged(self):
+        self.image_levels = tuple(self.levels_region.getRegion())
+        self.auto_levels_box.blockSignals(True)
+        self.auto_levels_box.setChecked(False)
+        self.auto_levels_box.blockSignals(False)
+        if self.img_item is not None:
+            self.img_item.setLevels(self.image_levels)
+
+    """ Throw away the frames stacked so far. """
+    def resetStack(self):
+        if self.frame_stack is not None:
+            self.frame_stack.reset()
+        self.stack_count_label.setText("0 frames stacked")
+        self.showImage()
+
+    """ Save the frame stack and its hot pixel map to a file chosen by the user. """
+    def exportStack(self):
+        if (self.frame_stack is None) or (self.frame_stack.count == 0):
+            msg = QMessageBox()
+            msg.setWindowTitle("Star Camera")
+            msg.setWindowIcon(QIcon(script_dir + os.path.sep + "SO_icon.png"))
+            msg.setIcon(QMessageBox.Information)
+            msg.setText("No frames have been stacked yet. Tick Stack frames to start stacking received images.")
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.exec_()
+            return
+        (path, _) = QFileDialog.getSaveFileName(self, "Export Frame Stack", script_dir + os.path.sep + "stack.npz", 
+                                                "NumPy archive (*.npz)")
+        if path:
+            self.frame_stack.save(path)
+
+    """
+    Collect the blob-finding parameters currently entered in the Commands section.
+    Inputs: self.
+    Outputs: Dictionary of parameters for blob_finder.findBlobs(); fields that are blank or not numbers are left out
+    (so the finder's defaults are used for them).
+    """
+    def blobParameters(self):
+        parameters = {"dynamic_hot_pixels": int(self.new_dynamic_hot_pixels.currentText() == "On"), 
+                      "high_pass_filter": int(self.new_high_pass_filter.currentText() == "On")}
+        fields = {"spike_limit": self.new_spike_limit, "r_smooth": self.new_r_smooth, 
+                  "r_high_pass_filter": self.new_r_high_pass_filter, 
+                  "centroid_search_border": self.new_centroid_search_border, "n_sigma": self.new_n_sigma, 
+                  "unique_star_spacing": self.new_unique_star_spacing}
+        for (name, field) in fields.items():
+            try:
+                parameters[name] = float(field.text())
+            except ValueError:
+                pass
+        return parameters
+
+    """
+    Turn the detected-star overlay on the image on or off.
+    Inputs: state of the checkbox.
+    Outputs: None.
+    """
+    def toggleBlobOverlay(self, state):
+        if state == Qt.Checked:
+            if not self.blob_thread.isRunning():
+                self.blob_thread.start()
+            if self.latest_image is not None:
+                self.blob_thread.submit(self.latest_image, self.blobParameters())
+        else:
+            self.blob_overlay.setData([], [])
+            self.blob_count_label.setText("")
+
+    """
+    Draw the stars found by the blob thread over the image.
+    Inputs: array of (x, y, flux) rows.
+    Outputs: None.
+    """
+    def displayBlobs(self, blobs):
+        if not self.show_blobs_box.isChecked():
+            return
+        # centroids are in pixel indices; pixel i covers [i, i + 1) in the image view
+        self.blob_overlay.setData(blobs[:, 0] + 0.5, blobs[:, 1] + 0.5)
+        self.blob_count_label.setText("%d stars detected" % len(blobs))
 
     """ 
     Update telemetry plot data on GUI. 
@@ -1128,15 +2328,30 @@ class GUI(QDialog):
         if (not self.auto_focus_state):
             print("New data points, so updating graphs...")
             # update each telemetry plot with new time and respective data points (if not auto-focusing)
-            self.altitude_line.setData(self.time, self.alt) 
-            self.azimuth_line.setData(self.time, self.az)
-            self.ra_line.setData(self.time, self.ra)
-            self.dec_line.setData(self.time, self.dec)
-            self.fr_line.setData(self.time, self.fr)
-            self.ps_line.setData(self.time, self.ps)
-            self.ir_line.setData(self.time, self.ir)
-        else:
-            self.af_line.setData(self.auto_focus, self.flux)
+            for key in TELEMETRY_GRAPHS_BY_KEY:
+                if key in self.plot_widgets:
+                    self.curves[(key, "data")].setData(self.time, getattr(self, key))
+            self.updateOverlayLines()
+        elif "af" in self.plot_widgets:
+            self.curves[("af", "data")].setData(self.auto_focus, self.flux)
+
+    """
+    Update the predicted RA/DEC lines, and recompute ALT/AZ from the whole solved RA/DEC history (in one vectorized
+    call) for the ALT/AZ graphs.
+    Inputs: self.
+    Outputs: None.
+    """
+    def updateOverlayLines(self):
+        if ("ra", "overlay") in self.curves:
+            self.curves[("ra", "overlay")].setData(self.predicted_time, self.predicted_ra)
+        if ("dec", "overlay") in self.curves:
+            self.curves[("dec", "overlay")].setData(self.predicted_time, self.predicted_dec)
+        if ((("alt", "overlay") in self.curves) or (("az", "overlay") in self.curves)) and (self.site is not None) \
+           and self.time:
+            (altitude, azimuth) = coordinates.radecToAltaz(self.time, self.ra, self.dec, *self.site)
+            for (key, values) in (("alt", altitude), ("az", azimuth)):
+                if (key, "overlay") in self.curves:
+                    self.curves[(key, "overlay")].setData(self.time, values)
 
     """ 
     Perform a regression of user-specified degree on the auto-focusing data. 
@@ -1168,15 +2383,219 @@ class GUI(QDialog):
                             "the degree of the regression." % degree)
                 msg.exec_()
             else:
-                regression_pen = pg.mkPen(color = "#ADFF2F", width = 3)
-                threshold = (np.max(self.flux) + np.min(self.flux))/2.0
-                self.coefficients = np.polyfit(np.array(self.auto_focus)[self.flux > threshold], 
-                                               np.array(self.flux)[self.flux > threshold], degree)
+                flux = np.array(self.flux)
+                threshold = (np.max(flux) + np.min(flux))/2.0
+                self.coefficients = np.polyfit(np.array(self.auto_focus)[flux > threshold], flux[flux > threshold], 
+                                               degree)
                 self.polynomial = np.poly1d(self.coefficients)
-                self.regression = self.af_graph_widget.plot(self.auto_focus, self.polynomial(self.auto_focus), 
-                                                            pen = regression_pen, symbol = "+", symbolSize = 9, 
-                                                            symbolBrush = ("#524f4f"))
-                self.regression.setData(self.auto_focus, self.polynomial(self.auto_focus))
+                self.curves[("af", "regression")].setData(self.auto_focus, self.polynomial(self.auto_focus))
+
+    """
+    Start an adaptive focus search over the auto-focusing range entered (see focus_planner.py), or stop the running
+    one. The other commands entered are checked and sent with the first sweep as usual.
+    Inputs: self.
+    Outputs: None.
+    """
+    def toggleFocusPlan(self):
+        if self.focus_planner is not None:
+            self.finishFocusPlan("Adaptive focus search stopped")
+            return
+        if not self.checkConnected():
+            return
+        start_focus = int(self.start_focus_pos.value())
+        end_focus = int(self.end_focus_pos.value())
+        if end_focus <= start_focus:
+            self.displayWarning("end_focus", 0)
+            return
+        # the auto-focusing checks do not apply, since the planner chooses the sweeps itself
+        self.auto_focus_box.setChecked(False)
+        commands = self.collectCommands()
+        if commands is None:
+            return
+        import focus_planner
+        self.focus_planner = focus_planner.FocusPlanner(start_focus, end_focus, self.focus_tolerance.value())
+        # the sweeps after the first repeat the other commands, which must not step the aperture or re-make the hot 
+        # pixel map again
+        self.focus_plan_commands = dict(commands, set_aperture_steps = 0, make_HP = 0)
+        self.focus_plan_button.setText("Stop Adaptive Focus Search")
+        self.sendFocusSweep(self.focus_planner.firstSweep(), commands, confirm = True)
+
+    """
+    Send one sweep of the adaptive focus search to the camera as an auto-focusing command.
+    Inputs: (start, end, step) of the sweep, the commands to send it with (the adaptive search's by default) and 
+    whether to show the confirmation box (only for the first sweep, which the user started; the later ones are sent 
+    while telemetry is being handled, and must not wait on a modal box).
+    Outputs: None.
+    """
+    def sendFocusSweep(self, sweep, commands = None, confirm = False):
+        commands = self.focus_plan_commands if commands is None else commands
+        (start, end, step) = sweep
+        print("Adaptive focus search: sweeping %d to %d in steps of %d" % (start, end, step))
+        self.focus_sweep_running = False
+        self.dispatchCommands(dict(commands, auto_focus = 1, start_focus = start, end_focus = end, focus_step = step), 
+                              confirm = confirm)
+
+    """
+    Follow the camera into and out of the sweeps of the adaptive focus search: when one ends, fit its data and send
+    the next, or set the focus to the best position once it is known well enough.
+    Inputs: the auto-focusing state in the latest telemetry.
+    Outputs: None.
+    """
+    def focusSweepChanged(self, auto_focus_state):
+        if auto_focus_state:
+            self.focus_sweep_running = True
+            return
+        if not self.focus_sweep_running:
+            return
+        planner = self.focus_planner
+        sweep = planner.addSweep(self.auto_focus, self.flux)
+        if planner.model is not None:
+            self.polynomial = planner.model
+            if "af" in self.plot_widgets:
+                self.curves[("af", "regression")].setData(self.auto_focus, self.polynomial(self.auto_focus))
+        if sweep is not None:
+            self.sendFocusSweep(sweep)
+            return
+        best = planner.best()
+        if best is None:
+            self.finishFocusPlan("Adaptive focus search found no data")
+            return
+        self.dispatchCommands(dict(self.focus_plan_commands, auto_focus = 0, set_focus_to_amount = best), 
+                              confirm = False)
+        (taken, full_scan) = planner.exposures(self.focus_plan_commands["photos_per_focus"])
+        self.finishFocusPlan("Adaptive focus search: focus set to %d (+/- %.1f) after %d sweeps and %d images (a full " 
+                             "sweep at the finest step would take %d)" % (best, planner.uncertainty, 
+                                                                          len(planner.sweeps), taken, full_scan))
+
+    def finishFocusPlan(self, message):
+        self.focus_planner = None
+        self.focus_plan_commands = None
+        self.focus_sweep_running = False
+        self.focus_plan_button.setText("Adaptive Focus Search")
+        print(message)
+        if self.tray_icon is not None:
+            self.tray_icon.showMessage("Star Camera", message, QSystemTrayIcon.Information)
+
+    """
+    Load an observing sequence from a plan file, check every step and start sending them (or, if a sequence is 
+    running, stop it).
+    Inputs: self.
+    Outputs: None.
+    """
+    def toggleSequence(self):
+        if self.sequence_runner is not None:
+            self.sequence_runner.stop()
+            self.finishSequence(self.sequence_runner.status())
+            return
+        if not self.checkConnected():
+            return
+        if self.focus_planner is not None:
+            QMessageBox().critical(self, "Command Error", "Wait for the adaptive focus search to finish or stop it " \
+                                   "before running a sequence.", QMessageBox.Ok)
+            return
+        (path, _) = QFileDialog.getOpenFileName(self, "Run Observing Sequence", script_dir, 
+                                                "Sequence plans (*.json);;All files (*)")
+        if not path:
+            return
+        import sequence
+        try:
+            (steps, repeat) = sequence.loadPlan(path)
+        except (OSError, ValueError) as error:
+            self.displaySequenceWarning("Could not load a sequence from this file: %s" % error)
+            return
+        if not self.planSequence(steps):
+            return
+        self.sequence_runner = sequence.SequenceRunner(steps, self.sendSequenceStep, repeat)
+        self.sequence_runner.start(time.monotonic())
+        self.sequence_button.setText("Stop Sequence")
+        self.focus_plan_button.setEnabled(False)
+        self.sequence_timer.start(SEQUENCE_TICK_INTERVAL)
+        print("Running a sequence of %d steps from %s" % (len(steps), path))
+        self.tickSequence()
+
+    """
+    Work out the commands of every step of a sequence before it starts, and check them like the commands sent with 
+    the 'Send Commands' button. Each step starts from the commands of the step before (the first from the ones 
+    entered in the GUI), without repeating auto-focusing or making the hot pixel map unless it asks to.
+    Inputs: self, the steps loaded by sequence.loadPlan(). Each gets its "commands" and "aperture".
+    Outputs: True if every step can be sent, False if one cannot (the user is told which).
+    """
+    def planSequence(self, steps):
+        try:
+            commands = dict(self.readCommands(), set_aperture_steps = 0)
+        except ValueError as error:
+            self.displaySequenceWarning("The sequence was not started: a command entered is not a number (%s)" % error)
+            return False
+        aperture = self.aperture_menu.currentText()
+        for step in steps:
+            changes = step["changes"]
+            if changes.get("aperture", aperture) not in aperture_range:
+                QMessageBox().critical(self, "Command Error", "%s of the sequence: f/%s is not an aperture setting" % 
+                                       (step["name"], changes["aperture"]), QMessageBox.Ok)
+                return False
+            aperture = changes.get("aperture", aperture)
+            commands = dict(commands, auto_focus = 0, make_HP = 0)
+            commands.update((name, value) for (name, value) in changes.items() if name != "aperture")
+            if self.checkCommands(commands) is not None:
+                QMessageBox().critical(self, "Command Error", "The sequence was not started: the commands of %s " \
+                                       "were not accepted." % step["name"], QMessageBox.Ok)
+                return False
+            (step["commands"], step["aperture"]) = (dict(commands), aperture)
+        return True
+
+    # pop-up warning that a sequence could not be started
+    def displaySequenceWarning(self, text):
+        msg = QMessageBox()
+        msg.setWindowTitle("Star Camera")
+        msg.setWindowIcon(QIcon(script_dir + os.path.sep + "SO_icon.png"))
+        msg.setIcon(QMessageBox.Warning)
+        msg.setText(text)
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
+    """
+    Send a step of the running sequence, with the aperture stepped from where the camera is and the focus left where 
+    it is unless the step sets it.
+    Inputs: self, the step (see planSequence()).
+    Outputs: None.
+    """
+    def sendSequenceStep(self, step):
+        commands = dict(step["commands"])
+        if "set_focus_to_amount" not in step["changes"]:
+            commands["set_focus_to_amount"] = self.focus_slider.previous_value
+        commands["set_aperture_steps"] = (aperture_range.index(step["aperture"]) - 
+                                          aperture_range.index(self.aperture_menu.previous_value))
+        # show what is being sent, as if entered by hand
+        self.focus_slider.setValue(commands["set_focus_to_amount"])
+        self.aperture_menu.setCurrentText(step["aperture"])
+        print("Sequence: sending %s" % step["name"])
+        self.sequence_label.setText("Sending %s" % step["name"])
+        self.dispatchCommands(commands, confirm = False)
+
+    """
+    Send the step of the running sequence when it is due and check it has not timed out (called by the sequence 
+    timer).
+    Inputs: self.
+    Outputs: None.
+    """
+    def tickSequence(self):
+        runner = self.sequence_runner
+        runner.tick(time.monotonic())
+        if runner.running():
+            self.sequence_label.setText(runner.status())
+        else:
+            self.finishSequence(runner.status(), 
+                                QSystemTrayIcon.Information if runner.state == "done" else QSystemTrayIcon.Warning)
+
+    def finishSequence(self, message, icon = QSystemTrayIcon.Information):
+        self.sequence_timer.stop()
+        self.sequence_runner = None
+        self.sequence_button.setText("Run Sequence...")
+        self.focus_plan_button.setEnabled(True)
+        self.sequence_label.setText(message)
+        print(message)
+        if self.tray_icon is not None:
+            self.tray_icon.showMessage("Star Camera", message, icon)
 
     """ 
     Get user's desired degree for polynomial regression. 
@@ -1281,6 +2700,19 @@ class GUI(QDialog):
     or a command is a bad value. 
     """
     def commandButtonClicked(self):
+        if not self.checkConnected():
+            return
+        commands = self.collectCommands()
+        if commands is None:
+            return
+        self.dispatchCommands(commands)
+
+    """
+    Check that the GUI is connected to the camera before sending it commands, telling the user if it is not.
+    Inputs: self.
+    Outputs: True if connected.
+    """
+    def checkConnected(self):
         if not self.GUItelemetry.isRunning():
             msg = QMessageBox()
             msg.setWindowTitle("Star Camera")
@@ -1289,43 +2721,42 @@ class GUI(QDialog):
             msg.setIcon(QMessageBox.Warning)
             msg.setText("Connect to the Star Camera first before trying to send commands.")
             msg.exec_()
-            return
+            return False
+        return True
 
+    """
+    Read the commands entered in the commanding section, checking dubious values with the user (see 
+    displayWarning()).
+    Inputs: self.
+    Outputs: Dictionary of the command values by name (see listening_final.COMMAND_FIELDS), or None if a value is
+    invalid or the user chose not to send it (the entry is then reset to its previous value).
+    """
+    def collectCommands(self):
+        commands = self.readCommands()
+        rejected = self.checkCommands(commands)
+        if rejected is not None:
+            self.resetCommandEntries(rejected)
+            return None
+        return commands
+
+    """
+    Read the commands entered in the commanding section as they are.
+    Inputs: self.
+    Outputs: Dictionary of the command values by name (see listening_final.COMMAND_FIELDS).
+    """
+    def readCommands(self):
         # logodds parameter
         logodds = float(self.logodds.text())
-        if (logodds > 10**9) or (logodds < 10**6):
-            still_send = self.displayWarning("logodds", logodds)
-            if not still_send:
-                self.logodds.setText("{:.2e}".format(self.prev_logodds))
-                return
 
         # latitude (deg) and longitude (deg)
         latitude = float(self.latitude_box.text())
-        if (latitude > 90) or (latitude < -90):
-            self.displayWarning("latitude", latitude)
-            self.latitude_box.setText(str(self.latitude_box_prev_value))
-            return
-
         longitude = float(self.longitude_box.text())
-        if (longitude > 180) or (longitude < -180):
-            self.displayWarning("longitude", longitude)
-            self.longitude_box.setText(str(self.longitude_box_prev_value))
-            return
 
         # height above WGS84 ellipsoid
         height = float(self.height_box.text())
-        if (height > 8850) or (height < -10000):
-            self.displayWarning("height", height)
-            self.height_box.setText(str(self.height_box_prev_value))
-            return
 
         # exposure parameter
         exposure = float(self.exposure_box.text())
-        if exposure > 1000:
-            still_send = self.displayWarning("exposure", exposure)
-            if not still_send:
-                self.exposure_box.setText(str(self.exposure_box_prev_value))
-                return
 
         # Astrometry solving timeout
         timelimit = int(self.timelimit.value())
@@ -1340,30 +2771,7 @@ class GUI(QDialog):
 
         start_focus = int(self.start_focus_pos.value())
         end_focus = int(self.end_focus_pos.value())
-        if auto_focus_bool:
-            if start_focus == end_focus:
-                still_send = self.displayWarning("focus_range", 0)
-                if not still_send:
-                    self.start_focus_pos.setValue(self.prev_start_focus)
-                    self.end_focus_pos.setValue(self.prev_end_focus)
-                    self.focus_step.setValue(self.prev_focus_step)
-                    return
-            elif end_focus < start_focus:
-                self.displayWarning("end_focus", 0)
-                self.start_focus_pos.setValue(self.prev_start_focus)
-                self.end_focus_pos.setValue(self.prev_end_focus)
-                self.focus_step.setValue(self.prev_focus_step)
-                return
-
         step_size = int(self.focus_step.value())
-        if ((end_focus - start_focus) % step_size != 0) and auto_focus_bool:
-            still_send = self.displayWarning("auto-focusing", step_size)
-            if not still_send:
-                self.start_focus_pos.setValue(self.prev_start_focus)
-                self.end_focus_pos.setValue(self.prev_end_focus)
-                self.focus_step.setValue(self.prev_focus_step)
-                return
-
         photos_per_focus = int(self.photos_per_focus.value())
 
         infinity_focus_bool = self.infinity_focus_box.currentText()
@@ -1423,14 +2831,6 @@ class GUI(QDialog):
         else:
             r_high_pass_filter_value = -1
 
-        if (high_pass_filter_bool and r_smooth_value > r_high_pass_filter_value):
-            still_send = self.displayWarning("r_smooth", 0)
-            if not still_send:
-                self.new_high_pass_filter.setCurrentText(str(self.prev_high_pass_filter))
-                self.new_r_high_pass_filter.setText(str(self.prev_r_high_pass_filter))
-                self.new_r_smooth.setText(str(self.prev_r_smooth))
-                return
-        
         if self.new_centroid_search_border.text() != "":
             centroid_search_border_value = float(self.new_centroid_search_border.text())
         else: 
@@ -1452,24 +2852,107 @@ class GUI(QDialog):
         else:
             star_spacing_value = -1
 
-        # package commands to send to camera
-        cmds_for_camera = struct.pack('ddddddfiiiiiiiiiifffffffff', logodds, latitude, longitude, height, exposure, 
-                                       timelimit, set_focus_to_amount, auto_focus_bool, start_focus, end_focus, 
-                                       step_size, photos_per_focus, infinity_focus_bool, set_aperture_steps, 
-                                       max_aperture_bool, make_HP_bool, use_HP_bool, spike_limit_value, 
-                                       dynamic_hot_pixels_bool, r_smooth_value, high_pass_filter_bool, 
-                                       r_high_pass_filter_value, centroid_search_border_value, filter_return_image_bool,
-                                       n_sigma_value, star_spacing_value)
+        return {"logodds": logodds, "latitude": latitude, "longitude": longitude, "height": height, 
+                "exposure": exposure, "timelimit": timelimit, "set_focus_to_amount": set_focus_to_amount, 
+                "auto_focus": auto_focus_bool, "start_focus": start_focus, "end_focus": end_focus, 
+                "focus_step": step_size, "photos_per_focus": photos_per_focus, "infinity_focus": infinity_focus_bool, 
+                "set_aperture_steps": set_aperture_steps, "max_aperture": max_aperture_bool, "make_HP": make_HP_bool, 
+                "use_HP": use_HP_bool, "spike_limit": spike_limit_value, "dynamic_hot_pixels": dynamic_hot_pixels_bool,
+                "r_smooth": r_smooth_value, "high_pass_filter": high_pass_filter_bool, 
+                "r_high_pass_filter": r_high_pass_filter_value, 
+                "centroid_search_border": centroid_search_border_value, 
+                "filter_return_image": filter_return_image_bool, "n_sigma": n_sigma_value, 
+                "unique_star_spacing": star_spacing_value}
+
+    """
+    Check commands for invalid or dubious values, asking the user whether to send the dubious ones (see 
+    displayWarning()).
+    Inputs: self, dictionary of the command values by name.
+    Outputs: Name of the check the commands failed (as passed to displayWarning()), or None if they can be sent.
+    """
+    def checkCommands(self, commands):
+        logodds = commands["logodds"]
+        if (logodds > 10**9) or (logodds < 10**6):
+            if not self.displayWarning("logodds", logodds):
+                return "logodds"
+
+        for name in ("latitude", "longitude"):
+            limit = 90 if name == "latitude" else 180
+            if (commands[name] > limit) or (commands[name] < -limit):
+                self.displayWarning(name, commands[name])
+                return name
+
+        if (commands["height"] > 8850) or (commands["height"] < -10000):
+            self.displayWarning("height", commands["height"])
+            return "height"
+
+        if commands["exposure"] > 1000:
+            if not self.displayWarning("exposure", commands["exposure"]):
+                return "exposure"
+
+        (start_focus, end_focus, step_size) = (commands["start_focus"], commands["end_focus"], commands["focus_step"])
+        if commands["auto_focus"]:
+            if start_focus == end_focus:
+                if not self.displayWarning("focus_range", 0):
+                    return "focus_range"
+            elif end_focus < start_focus:
+                self.displayWarning("end_focus", 0)
+                return "end_focus"
+            if (end_focus - start_focus) % step_size != 0:
+                if not self.displayWarning("auto-focusing", step_size):
+                    return "auto-focusing"
+
+        if commands["high_pass_filter"] and (commands["r_smooth"] > commands["r_high_pass_filter"]):
+            if not self.displayWarning("r_smooth", 0):
+                return "r_smooth"
+        return None
+
+    """
+    Reset the entries of a failed check of checkCommands() to their previous values.
+    Inputs: self, name of the check.
+    Outputs: None.
+    """
+    def resetCommandEntries(self, rejected):
+        if rejected == "logodds":
+            self.logodds.setText("{:.2e}".format(self.prev_logodds))
+        elif rejected == "latitude":
+            self.latitude_box.setText(str(self.latitude_box_prev_value))
+        elif rejected == "longitude":
+            self.longitude_box.setText(str(self.longitude_box_prev_value))
+        elif rejected == "height":
+            self.height_box.setText(str(self.height_box_prev_value))
+        elif rejected == "exposure":
+            self.exposure_box.setText(str(self.exposure_box_prev_value))
+        elif rejected in ("focus_range", "end_focus", "auto-focusing"):
+            self.start_focus_pos.setValue(self.prev_start_focus)
+            self.end_focus_pos.setValue(self.prev_end_focus)
+            self.focus_step.setValue(self.prev_focus_step)
+        elif rejected == "r_smooth":
+            self.new_high_pass_filter.setCurrentText(str(self.prev_high_pass_filter))
+            self.new_r_high_pass_filter.setText(str(self.prev_r_high_pass_filter))
+            self.new_r_smooth.setText(str(self.prev_r_smooth))
+
+    """
+    Package commands and send them to the camera.
+    Inputs: dictionary of the command values (see collectCommands()), and whether to confirm they were sent with a
+    pop-up (False for commands sent automatically, which must not block).
+    Outputs: None.
+    """
+    def dispatchCommands(self, commands, confirm = True):
         # send these commands to things listening to the send_commands_signal
-        self.send_commands_signal.emit(cmds_for_camera)
+        if confirm:
+            self.send_commands_signal.emit(listening_final.packCommands(commands))
+        else:
+            self.send_commands_quietly_signal.emit(listening_final.packCommands(commands))
 
         # if this is the first iteration of the new auto-focusing process
-        if (auto_focus_bool):
+        if commands["auto_focus"]:
             self.auto_focus = []
             self.flux = []
             self.coefficients = []
-            self.af_line.setData(self.auto_focus, self.flux)
-            self.regression.setData(self.auto_focus, self.polynomial(self.coefficients))
+            if "af" in self.plot_widgets:
+                self.curves[("af", "data")].setData(self.auto_focus, self.flux)
+                self.curves[("af", "regression")].setData([], [])
 
         # update previous value attributes of the focus and aperture sliders
         self.focus_slider.updatePrevValue()
@@ -1511,6 +2994,33 @@ class GUI(QDialog):
         self.port_input.setText("")
         self.ip_button.setEnabled(True)
 
+    """
+    Start a profile capture of all threads for self.profile_seconds seconds, or stop the running one early, writing
+    the results next to data.txt (see profiler.py).
+    Inputs: self.
+    Outputs: None.
+    """
+    def toggleProfiling(self):
+        if self.profile_capture is None:
+            import profiler
+            seconds = self.profile_seconds if self.profile_seconds is not None else profiler.DEFAULT_DURATION
+            self.profile_capture = profiler.ProfileCapture(script_dir, use_cprofile = self.profile_cprofile)
+            self.profile_capture.start()
+            self.profile_timer.start(int(1000*seconds))
+            print("Profiling for %g seconds (Ctrl+Shift+P again to stop early)..." % seconds)
+            return
+        self.profile_timer.stop()
+        try:
+            paths = self.profile_capture.stop()
+        except OSError as error:
+            message = "Could not write the profile: %s" % error
+        else:
+            message = "Profile written to " + ", ".join(os.path.basename(path) for path in paths)
+        self.profile_capture = None
+        print(message)
+        if self.tray_icon is not None:
+            self.tray_icon.showMessage("Star Camera", message, QSystemTrayIcon.Information)
+
     """
     Override the closeEvent() method of the GUI window, built on the QDialog class.
     Inputs: self, the event (clicking the X button).
@@ -1521,13 +3031,76 @@ class GUI(QDialog):
         quit_window = QMessageBox()
         reply = quit_window.question(self, "Confirm Exit", quit_msg, QMessageBox.Yes, QMessageBox.No)
         if reply == QMessageBox.Yes:
+            for worker_thread in (self.blob_thread, self.pyramid_thread, self.quality_thread):
+                worker_thread.stop()
+                worker_thread.wait()
+            if self.export_thread is not None:
+                self.export_thread.requestInterruption()
+                self.export_thread.wait()
+            if self.history_thread is not None:
+                self.history_thread.wait()
+            self.frame_cache.close()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
+                self.metrics_server.server_close()
+            if self.profile_capture is not None:
+                self.toggleProfiling()
             event.accept()
         else:
             event.ignore()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    gallery = GUI()
+    # needed for the receiver process in the packaged (frozen) application
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description = "Star Camera GUI")
+    parser.add_argument("--startup-time", action = "store_true", 
+                        help = "print how long each stage of the GUI start-up takes")
+    parser.add_argument("--receiver-process", action = "store_true", 
+                        help = "receive and back up data in a separate process, handing frames over in shared memory")
+    parser.add_argument("--backup", choices = ["text", "columnar", "both", "none"], default = "both",
+                        help = "back the telemetry up to data.txt, the columnar telemetry log, both, or neither (when "
+                               "connected through a relay, which backs the telemetry up itself)")
+    parser.add_argument("--profile-seconds", type = float, 
+                        help = "length of the profile captures started with Ctrl+Shift+P or SIGUSR1 (default 30)")
+    parser.add_argument("--profile-cprofile", action = "store_true", 
+                        help = "also record cProfile statistics of the main thread in profile captures")
+    parser.add_argument("--memory-budget", type = int, default = memory_budget.DEFAULT_BUDGET_MB, 
+                        help = "megabytes of memory shared out between the telemetry history, the recent frames and "
+                               "the images waiting to be displayed (default: %(default)s)")
+    parser.add_argument("--metrics-port", type = int, 
+                        help = "serve health metrics (Prometheus text at /metrics, JSON at /metrics.json) on this "
+                               "localhost TCP port")
+    parser.add_argument("--metrics-socket", help = "serve health metrics on this Unix domain socket path instead")
+    parser.add_argument("--receive-buffer", type = listening_final.parseReceiveBuffer,
+                        help = "receive buffer of the camera socket in KB, or auto to tune it from the throughput "
+                               "(default: the system's)")
+    (args, qt_args) = parser.parse_known_args()
+    listening_final.setReceiveBuffer(args.receive_buffer)
+    listening_final.backup_text = args.backup in ("text", "both")
+    listening_final.backup_columnar = args.backup in ("columnar", "both")
+    if args.startup_time:
+        reportStartupTime("modules imported")
+    app = QApplication(sys.argv[:1] + qt_args)
+    gallery = GUI(use_receiver_process = args.receiver_process, memory_budget_mb = args.memory_budget)
+    gallery.profile_seconds = args.profile_seconds
+    gallery.profile_cprofile = args.profile_cprofile
+    listening_final.metrics = gallery.metrics
+    if (args.metrics_port is not None) or (args.metrics_socket is not None):
+        try:
+            gallery.metrics_server = metrics.startServer(gallery.metrics, args.metrics_port, args.metrics_socket)
+        except OSError as error:
+            print("Could not start the metrics server: %s" % error)
+    if hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> starts or stops a profile capture; the handler only runs when the interpreter does, so
+        # wake it up regularly, and leave the capture itself to the event loop
+        signal.signal(signal.SIGUSR1, lambda *args: QTimer.singleShot(0, gallery.toggleProfiling))
+        signal_timer = QTimer()
+        signal_timer.timeout.connect(lambda: None)
+        signal_timer.start(500)
+    if args.startup_time:
+        reportStartupTime("main window constructed")
+        # the first pass of the event loop happens once the window is shown and can take input
+        QTimer.singleShot(0, lambda: reportStartupTime("main window interactive"))
 
     tray_icon = QSystemTrayIcon(QIcon(script_dir + os.path.sep + "SO_icon.png"), app)
     tray_icon.show()
@@ -1535,5 +3108,6 @@ if __name__ == "__main__":
     exit_action = menu.addAction("Exit")
 
     tray_icon.setContextMenu(menu)
+    gallery.tray_icon = tray_icon
     gallery.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,148 @@
+import numpy as np
+
+"""
+Client-side star (blob) finder that mirrors the camera's blob-finding parameters, so their effect can be seen on the
+received images. Everything is whole-array NumPy: dynamic hot pixel removal against the four neighbours, boxcar
+smoothing and high-pass filtering with cumulative sums, an n-sigma threshold, connected components by label
+propagation over just the thresholded pixels, flux-weighted centroids and a minimum spacing between unique stars.
+"""
+
+# parameter names follow the fields of the commands packet (see listening_final.COMMAND_FIELDS)
+DEFAULT_PARAMETERS = {"spike_limit": 3.0, "dynamic_hot_pixels": 1, "r_smooth": 2.0, "high_pass_filter": 0,
+                      "r_high_pass_filter": 10.0, "centroid_search_border": 1.0, "n_sigma": 2.0,
+                      "unique_star_spacing": 15.0}
+# blobs with fewer pixels than this above the threshold are treated as noise
+MIN_BLOB_PIXELS = 2
+# only this many of the brightest blobs are returned
+MAX_BLOBS = 500
+# the background mean and noise are estimated on every SUBSAMPLE-th pixel in each direction
+SUBSAMPLE = 4
+
+"""
+Boxcar (moving average) filter of a square window, computed with cumulative sums so the cost does not depend on the
+radius.
+Inputs: 2D image and the radius of the window in pixels (window is 2*radius + 1 wide).
+Outputs: Filtered float32 image of the same shape.
+"""
+def boxFilter(image, radius):
+    radius = int(round(radius))
+    image = image.astype(np.float32, copy = False)
+    if radius < 1:
+        return image
+    size = 2*radius + 1
+    padded = np.pad(image, radius, mode = "edge").astype(np.float64)
+    # along the rows...
+    sums = np.cumsum(padded, axis = 0)
+    sums = np.concatenate((np.zeros((1, sums.shape[1])), sums), axis = 0)
+    padded = sums[size:] - sums[:-size]
+    # ...then along the columns
+    sums = np.cumsum(padded, axis = 1)
+    sums = np.concatenate((np.zeros((sums.shape[0], 1)), sums), axis = 1)
+    return ((sums[:, size:] - sums[:, :-size])/(size*size)).astype(np.float32)
+
+"""
+Replace dynamic hot pixels (pixels much brighter than the mean of their four neighbours) with that mean.
+Inputs: 2D image and the spike limit (a pixel is hot above spike_limit times its neighbours' mean; smaller is more
+aggressive).
+Outputs: Float32 image with the hot pixels replaced, and the number of hot pixels found.
+"""
+def removeHotPixels(image, spike_limit):
+    image = image.astype(np.float32)
+    padded = np.pad(image, 1, mode = "edge")
+    neighbours = (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:])/4.0
+    hot = image > spike_limit*np.maximum(neighbours, 1.0)
+    image[hot] = neighbours[hot]
+    return (image, int(np.count_nonzero(hot)))
+
+"""
+Label the 4-connected components of a sparse mask.
+Inputs: 2D boolean mask.
+Outputs: (flat indices of the mask pixels, component number of each of them, number of components).
+"""
+def connectedComponents(mask):
+    width = mask.shape[1]
+    pixels = np.flatnonzero(mask)
+    labels = np.arange(len(pixels))
+    if len(pixels) == 0:
+        return (pixels, labels, 0)
+    # pairs of neighbouring mask pixels (right and down neighbours; the pixels are sorted, so use searchsorted)
+    edges = []
+    for (offset, valid) in ((1, (pixels % width) != width - 1), (width, np.ones(len(pixels), dtype = bool))):
+        neighbour = pixels + offset
+        position = np.minimum(np.searchsorted(pixels, neighbour), len(pixels) - 1)
+        found = valid & (pixels[position] == neighbour)
+        edges.append((np.flatnonzero(found), position[found]))
+    first = np.concatenate([edge[0] for edge in edges])
+    second = np.concatenate([edge[1] for edge in edges])
+    # propagate the smallest label across every edge, with pointer jumping so long blobs converge quickly
+    while True:
+        smaller = np.minimum(labels[first], labels[second])
+        previous = labels.copy()
+        np.minimum.at(labels, first, smaller)
+        np.minimum.at(labels, second, smaller)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    (_, components) = np.unique(labels, return_inverse = True)
+    return (pixels, components, int(components.max()) + 1)
+
+"""
+Find the stars in an image.
+Inputs: 2D image (e.g. the uint8 frame shown in the Images tab) and a dictionary of blob-finding parameters (missing
+entries take the values in DEFAULT_PARAMETERS).
+Outputs: Array with one row (x, y, flux) per star, brightest first; x is the column and y the row of the centroid.
+"""
+def findBlobs(image, parameters = None):
+    settings = dict(DEFAULT_PARAMETERS)
+    settings.update(parameters or {})
+    if settings["dynamic_hot_pixels"] and (settings["spike_limit"] > 0):
+        (filtered, _) = removeHotPixels(image, settings["spike_limit"])
+    else:
+        filtered = image.astype(np.float32)
+    if settings["r_smooth"] > 0:
+        filtered = boxFilter(filtered, settings["r_smooth"])
+    if settings["high_pass_filter"] and (settings["r_high_pass_filter"] > 0):
+        filtered = filtered - boxFilter(filtered, settings["r_high_pass_filter"])
+
+    # threshold = n*sigma + mean, with the statistics of a subsample
+    sample = filtered[::SUBSAMPLE, ::SUBSAMPLE]
+    threshold = sample.mean() + settings["n_sigma"]*sample.std()
+    mask = filtered > threshold
+    border = int(np.ceil(max(settings["centroid_search_border"], 0)))
+    if border:
+        mask[:border, :] = False
+        mask[-border:, :] = False
+        mask[:, :border] = False
+        mask[:, -border:] = False
+
+    (pixels, components, count) = connectedComponents(mask)
+    if count == 0:
+        return np.zeros((0, 3))
+    sizes = np.bincount(components, minlength = count)
+    weights = filtered.ravel()[pixels] - threshold
+    flux = np.bincount(components, weights = weights, minlength = count)
+    (rows, columns) = np.divmod(pixels, mask.shape[1])
+    x = np.bincount(components, weights = weights*columns, minlength = count)/flux
+    y = np.bincount(components, weights = weights*rows, minlength = count)/flux
+    keep = sizes >= MIN_BLOB_PIXELS
+    blobs = np.column_stack((x[keep], y[keep], flux[keep]))
+    blobs = blobs[np.argsort(-blobs[:, 2])][:MAX_BLOBS]
+    return suppressNeighbours(blobs, settings["unique_star_spacing"])
+
+"""
+Keep only the brightest of any blobs closer together than the unique star spacing.
+Inputs: array of (x, y, flux) rows sorted brightest first, and the minimum spacing in pixels.
+Outputs: The remaining rows.
+"""
+def suppressNeighbours(blobs, spacing):
+    if (len(blobs) < 2) or (spacing <= 0):
+        return blobs
+    distances = np.hypot(blobs[:, 0, None] - blobs[None, :, 0], blobs[:, 1, None] - blobs[None, :, 1])
+    too_close = distances < spacing
+    keep = np.ones(len(blobs), dtype = bool)
+    for i in range(len(blobs)):
+        if keep[i]:
+            # everything dimmer than a kept blob and too close to it goes
+            too_close[i, :i + 1] = False
+            keep[too_close[i]] = False
+    return blobs[keep]
@@ -0,0 +1,206 @@
+import collections
+import math
+import numpy as np
+
+"""
+Vectorized coordinate transforms between equatorial (RA/DEC, J2000 as solved by Astrometry) and horizontal (ALT/AZ)
+coordinates for the camera's site, and a predictor of the next pointing from the recent solutions. Everything works
+on whole arrays, so the full telemetry history can be converted at once.
+
+The transform applies precession from J2000 to the date and Earth rotation (Greenwich mean sidereal time), but not
+nutation, aberration or atmospheric refraction, so it agrees with a full reduction to within about an arcminute
+above 15 degrees altitude - enough to compare against the camera's own ALT/AZ and to spot jumps. The sidereal time
+and precession terms only change slowly, so they are computed once per UTC day and reused (SiderealCache).
+"""
+
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
+# Greenwich mean sidereal time at J2000 and its rate, in degrees and degrees per day
+GMST_J2000 = 280.46061837
+GMST_RATE = 360.98564736629
+ARCSEC = 1.0/3600.0
+
+def julianDate(unix_time):
+    return UNIX_EPOCH_JD + np.asarray(unix_time, dtype = np.float64)/86400.0
+
+"""
+Precession matrix from J2000 to the mean equator and equinox of a date (IAU 1976 angles).
+Inputs: Julian date.
+Outputs: 3x3 rotation matrix.
+"""
+def precessionMatrix(jd):
+    T = (jd - J2000_JD)/36525.0
+    zeta = math.radians((2306.2181*T + 0.30188*T**2 + 0.017998*T**3)*ARCSEC)
+    z = math.radians((2306.2181*T + 1.09468*T**2 + 0.018203*T**3)*ARCSEC)
+    theta = math.radians((2004.3109*T - 0.42665*T**2 - 0.041833*T**3)*ARCSEC)
+    def rotationZ(angle):
+        (c, s) = (math.cos(angle), math.sin(angle))
+        return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    def rotationY(angle):
+        (c, s) = (math.cos(angle), math.sin(angle))
+        return np.array([[c, 0.0, -s], [0.0, 1.0, 0.0], [s, 0.0, c]])
+    return rotationZ(z) @ rotationY(theta) @ rotationZ(zeta)
+
+"""
+Class for the slowly changing terms of the transform, computed once per UTC day: the sidereal time at the start of
+the day (later times add the constant sidereal rate) and the precession matrix.
+Methods: gmst() - Greenwich mean sidereal time of an array of times; precession() - matrices for an array of times.
+"""
+class SiderealCache:
+    def __init__(self):
+        self.days = {}
+
+    def terms(self, day):
+        if day not in self.days:
+            jd = UNIX_EPOCH_JD + day
+            T = (jd - J2000_JD)/36525.0
+            gmst0 = GMST_J2000 + GMST_RATE*(jd - J2000_JD) + 0.000387933*T**2 - T**3/38710000.0
+            self.days[day] = (gmst0 % 360.0, precessionMatrix(jd + 0.5))
+        return self.days[day]
+
+    def dayTerms(self, unix_time):
+        days = np.floor(np.asarray(unix_time, dtype = np.float64)/86400.0).astype(np.int64)
+        unique_days = np.unique(days)
+        return (days, unique_days, [self.terms(int(day)) for day in unique_days])
+
+    """
+    Greenwich mean sidereal time.
+    Inputs: array of UNIX times.
+    Outputs: Array of sidereal times in degrees.
+    """
+    def gmst(self, unix_time):
+        unix_time = np.asarray(unix_time, dtype = np.float64)
+        (days, unique_days, terms) = self.dayTerms(unix_time)
+        gmst0 = np.array([term[0] for term in terms])[np.searchsorted(unique_days, days)]
+        return (gmst0 + GMST_RATE*(unix_time/86400.0 - days)) % 360.0
+
+    """
+    Apply precession from J2000 to the date (or back) to unit vectors.
+    Inputs: array of UNIX times, (3, N) array of unit vectors and whether to go from the date back to J2000.
+    Outputs: (3, N) array of unit vectors.
+    """
+    def precess(self, unix_time, vectors, inverse = False):
+        (days, unique_days, terms) = self.dayTerms(unix_time)
+        result = np.empty_like(vectors)
+        # one matrix product per day in the data
+        for (day, (_, matrix)) in zip(unique_days, terms):
+            selected = days == day
+            result[:, selected] = (matrix.T if inverse else matrix) @ vectors[:, selected]
+        return result
+
+# shared by all conversions in the process
+sidereal_cache = SiderealCache()
+
+def unitVectors(longitude, latitude):
+    (lon, lat) = (np.radians(longitude), np.radians(latitude))
+    return np.array([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+def angles(vectors):
+    longitude = np.degrees(np.arctan2(vectors[1], vectors[0])) % 360.0
+    latitude = np.degrees(np.arcsin(np.clip(vectors[2], -1.0, 1.0)))
+    return (longitude, latitude)
+
+"""
+Convert J2000 RA/DEC to ALT/AZ.
+Inputs: arrays (or scalars) of UNIX times, RA and DEC in degrees, and the site latitude and longitude (east
+positive) in degrees.
+Outputs: (altitude, azimuth) arrays in degrees, azimuth measured from north through east.
+"""
+def radecToAltaz(unix_time, ra, dec, latitude, longitude):
+    (unix_time, ra, dec) = np.broadcast_arrays(*(np.atleast_1d(np.asarray(value, dtype = np.float64))
+                                                 for value in (unix_time, ra, dec)))
+    (ra_date, dec_date) = angles(sidereal_cache.precess(unix_time, unitVectors(ra, dec)))
+    hour_angle = np.radians(sidereal_cache.gmst(unix_time) + longitude - ra_date)
+    (dec_date, lat) = (np.radians(dec_date), math.radians(latitude))
+    sin_alt = np.sin(dec_date)*math.sin(lat) + np.cos(dec_date)*math.cos(lat)*np.cos(hour_angle)
+    altitude = np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+    azimuth = np.degrees(np.arctan2(-np.sin(hour_angle)*np.cos(dec_date),
+                                    np.sin(dec_date)*math.cos(lat) - np.cos(dec_date)*math.sin(lat)*np.cos(hour_angle)))
+    return (altitude, azimuth % 360.0)
+
+"""
+Convert ALT/AZ to J2000 RA/DEC.
+Inputs: arrays (or scalars) of UNIX times, altitude and azimuth in degrees, and the site latitude and longitude (east
+positive) in degrees.
+Outputs: (RA, DEC) arrays in degrees.
+"""
+def altazToRadec(unix_time, altitude, azimuth, latitude, longitude):
+    (unix_time, altitude, azimuth) = np.broadcast_arrays(*(np.atleast_1d(np.asarray(value, dtype = np.float64))
+                                                           for value in (unix_time, altitude, azimuth)))
+    (alt, az, lat) = (np.radians(altitude), np.radians(azimuth), math.radians(latitude))
+    sin_dec = np.sin(alt)*math.sin(lat) + np.cos(alt)*math.cos(lat)*np.cos(az)
+    dec_date = np.arcsin(np.clip(sin_dec, -1.0, 1.0))
+    hour_angle = np.arctan2(-np.sin(az)*np.cos(alt), np.sin(alt)*math.cos(lat) - np.cos(alt)*math.sin(lat)*np.cos(az))
+    ra_date = sidereal_cache.gmst(unix_time) + longitude - np.degrees(hour_angle)
+    vectors = sidereal_cache.precess(unix_time, unitVectors(ra_date, np.degrees(dec_date)), inverse = True)
+    return angles(vectors)
+
+"""
+Angular distance between two sets of positions.
+Inputs: longitudes and latitudes (e.g. RA and DEC) of both, in degrees.
+Outputs: Separations in degrees.
+"""
+def separation(lon1, lat1, lon2, lat2):
+    (lon1, lat1, lon2, lat2) = (np.radians(value) for value in (lon1, lat1, lon2, lat2))
+    # haversine formula, accurate for small separations
+    a = np.sin((lat2 - lat1)/2.0)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2.0)**2
+    return np.degrees(2.0*np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+"""
+Class for predicting where the next solution should point, from a straight-line fit (in time) of the unit vectors of
+the most recent solutions, which follows both a tracking mount (fixed RA/DEC) and a fixed one (RA moving at the
+sidereal rate). A solution much further from its prediction than the recent scatter is flagged as a jump.
+Attributes: the recent solutions and the scatter of the fit.
+Methods: predict() - predicted RA/DEC at a time; add() - add a solution, returning its prediction error and whether
+it is a jump.
+"""
+class PointingPredictor:
+    def __init__(self, n_solutions = 8, jump_sigma = 5.0, minimum_jump = 60.0*ARCSEC):
+        self.solutions = collections.deque(maxlen = n_solutions)
+        self.jump_sigma = jump_sigma
+        self.minimum_jump = minimum_jump
+        self.scatter = 0.0
+
+    """
+    Predict the pointing at a time.
+    Inputs: UNIX time.
+    Outputs: (RA, DEC) in degrees, or None if there are fewer than two solutions.
+    """
+    def predict(self, t):
+        if len(self.solutions) < 2:
+            return None
+        (times, vectors) = self.fit()
+        t0 = times.mean()
+        # least-squares line through each coordinate of the unit vectors
+        slopes = ((times - t0) @ (vectors - vectors.mean(axis = 0)))/max(((times - t0)**2).sum(), 1e-9)
+        predicted = vectors.mean(axis = 0) + slopes*(t - t0)
+        (ra, dec) = angles(predicted[:, None]/np.linalg.norm(predicted))
+        return (float(ra[0]), float(dec[0]))
+
+    def fit(self):
+        times = np.array([solution[0] for solution in self.solutions])
+        vectors = unitVectors(np.array([solution[1] for solution in self.solutions]),
+                              np.array([solution[2] for solution in self.solutions])).T
+        return (times, vectors)
+
+    """
+    Add a solution.
+    Inputs: UNIX time, RA and DEC in degrees.
+    Outputs: (predicted (RA, DEC) or None, prediction error in degrees or NaN, whether the solution is a jump).
+    """
+    def add(self, t, ra, dec):
+        prediction = self.predict(t)
+        error = math.nan
+        jump = False
+        if prediction is not None:
+            error = float(separation(prediction[0], prediction[1], ra, dec))
+            jump = error > max(self.jump_sigma*self.scatter, self.minimum_jump)
+        if jump:
+            # start again from the new pointing rather than judging the next solutions against the old one
+            self.solutions.clear()
+            self.scatter = 0.0
+        elif not math.isnan(error):
+            # smoothed scatter of the prediction errors
+            self.scatter = error if self.scatter == 0.0 else 0.8*self.scatter + 0.2*error
+        self.solutions.append((t, ra, dec))
+        return (prediction, error, jump)
@@ -0,0 +1,236 @@
+import argparse
+import glob
+import os
+import re
+import sys
+import zipfile
+import numpy as np
+import telemetry_log
+
+"""
+Export of telemetry and images to HDF5, NPZ or FITS files, meant to run in a background thread (the GUI wraps it in
+a QThread) or from the command line. Frames are streamed into the output one at a time, so exporting hundreds of
+images never holds more than one of them in memory, and progress is reported after every frame. The file is written
+under a temporary name and only renamed once complete, so a cancelled or failed export never leaves a partial file
+behind.
+
+h5py (for HDF5) and astropy (for FITS) are only imported when those formats are used.
+
+Output layout:
+- HDF5: a telemetry group with one chunked dataset per column, a chunked frames dataset of shape (frames, rows,
+  columns) and a frame_times dataset.
+- NPZ: telemetry_<column> arrays, a frames array of shape (frames, rows, columns) and a frame_times array.
+- FITS: the frames as a 3D primary image, then TELEMETRY and FRAMES (frame times) binary tables.
+"""
+
+FORMATS = ("hdf5", "npz", "fits")
+EXTENSIONS = {"hdf5": ".h5", "npz": ".npz", "fits": ".fits"}
+# file names written by headless.py --record-dir: starcam_<camera time>.npy, with _<number> added for frames after
+# the first with the same time
+RECORDED_FRAME_PATTERN = re.compile(r"starcam_(\d+(?:\.\d*)?)(?:_(\d+))?\.npy$")
+
+"""
+Class for writing an HDF5 export with h5py.
+"""
+class HDF5Writer:
+    def __init__(self, path):
+        import h5py
+        self.file = h5py.File(path, "w")
+
+    def writeTelemetry(self, columns):
+        group = self.file.create_group("telemetry")
+        for (name, values) in columns.items():
+            group.create_dataset(name, data = values, chunks = True)
+
+    def beginFrames(self, n_frames, shape):
+        # one chunk per frame, so each frame is written (and can later be read) on its own
+        self.frames = self.file.create_dataset("frames", shape = (n_frames,) + shape, dtype = "u1",
+                                               chunks = (1,) + shape, compression = "lzf")
+        self.frame_times = self.file.create_dataset("frame_times", shape = (n_frames,), dtype = "f8")
+
+    def writeFrame(self, index, frame_time, image):
+        self.frames[index] = image
+        self.frame_times[index] = frame_time
+
+    def close(self):
+        self.file.close()
+
+"""
+Class for writing an NPZ export. Arrays are streamed straight into the zip file, so the frames array is written
+frame by frame instead of being assembled in memory first.
+"""
+class NPZWriter:
+    def __init__(self, path):
+        self.zip_file = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64 = True)
+        self.frames_file = None
+        self.frame_times = None
+
+    def writeArray(self, name, array):
+        with self.zip_file.open(name + ".npy", "w", force_zip64 = True) as array_file:
+            np.lib.format.write_array(array_file, np.asarray(array))
+
+    def writeTelemetry(self, columns):
+        for (name, values) in columns.items():
+            self.writeArray("telemetry_" + name, values)
+
+    def beginFrames(self, n_frames, shape):
+        self.frames_file = self.zip_file.open("frames.npy", "w", force_zip64 = True)
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype("u1")), "fortran_order": False,
+                  "shape": (n_frames,) + shape}
+        np.lib.format.write_array_header_2_0(self.frames_file, header)
+        self.frame_times = np.full(n_frames, np.nan)
+
+    def writeFrame(self, index, frame_time, image):
+        self.frames_file.write(np.ascontiguousarray(image, dtype = np.uint8).tobytes())
+        self.frame_times[index] = frame_time
+
+    def close(self):
+        if self.frames_file is not None:
+            self.frames_file.close()
+            self.writeArray("frame_times", self.frame_times)
+        self.zip_file.close()
+
+"""
+Class for writing a FITS export with astropy. The frames are streamed into the primary image; the tables are
+appended once the frames are done.
+"""
+class FITSWriter:
+    def __init__(self, path):
+        from astropy.io import fits
+        self.fits = fits
+        self.path = path
+        self.stream = None
+        self.tables = []
+
+    def writeTelemetry(self, columns):
+        self.tables.append(self.table("TELEMETRY", columns))
+
+    def beginFrames(self, n_frames, shape):
+        header = self.fits.PrimaryHDU().header
+        header["BITPIX"] = 8
+        header["NAXIS"] = 3
+        # FITS lists the fastest-varying axis first
+        header["NAXIS1"] = shape[1]
+        header["NAXIS2"] = shape[0]
+        header["NAXIS3"] = n_frames
+        self.stream = self.fits.StreamingHDU(self.path, header)
+        self.frame_times = np.full(n_frames, np.nan)
+
+    def writeFrame(self, index, frame_time, image):
+        self.stream.write(np.ascontiguousarray(image, dtype = np.uint8))
+        self.frame_times[index] = frame_time
+
+    def table(self, name, columns):
+        return self.fits.BinTableHDU.from_columns([self.fits.Column(name = column, format = "D", array = values)
+                                                   for (column, values) in columns.items()], name = name)
+
+    def close(self):
+        if self.stream is None:
+            hdus = self.fits.HDUList([self.fits.PrimaryHDU()] + self.tables)
+            hdus.writeto(self.path)
+            return
+        self.stream.close()
+        self.tables.append(self.table("FRAMES", {"TIME": self.frame_times}))
+        with self.fits.open(self.path, mode = "append") as hdus:
+            for table in self.tables:
+                hdus.append(table)
+
+WRITERS = {"hdf5": HDF5Writer, "npz": NPZWriter, "fits": FITSWriter}
+
+"""
+Find the frames recorded by headless.py in a time range.
+Inputs: the recording directory and the start and end C times (None for no limit).
+Outputs: List of (camera time, function returning the image) pairs in time order.
+"""
+def recordedFrames(directory, t0 = None, t1 = None):
+    frames = []
+    for path in glob.glob(os.path.join(directory, "starcam_*.npy")):
+        match = RECORDED_FRAME_PATTERN.search(os.path.basename(path))
+        if match is None:
+            continue
+        frame_time = float(match.group(1))
+        sequence = int(match.group(2) or 0)
+        if ((t0 is None) or (frame_time >= t0)) and ((t1 is None) or (frame_time <= t1)):
+            frames.append((frame_time, sequence, lambda path = path: np.load(path)))
+    return [(frame_time, load) for (frame_time, _, load) in sorted(frames, key = lambda frame: frame[:2])]
+
+"""
+Write an export.
+Inputs: output path, format (one of FORMATS), telemetry columns (dictionary of column name to array, or None), list of
+(camera time, function returning the image or None if it is no longer available) pairs, a function called with
+(steps done, total steps) after each step, and a function returning True if the export should be abandoned.
+Outputs: True if the export was written, False if it was cancelled. Raises ImportError if the format's library is
+not installed, and OSError/ValueError if writing fails.
+"""
+def runExport(path, export_format, telemetry = None, frames = (), progress = None, cancelled = None):
+    frames = list(frames)
+    total = len(frames) + 1
+    part_path = path + ".part" + EXTENSIONS[export_format]
+    writer = WRITERS[export_format](part_path)
+    completed = False
+    try:
+        if telemetry is not None:
+            writer.writeTelemetry({name: np.asarray(values, dtype = np.float64)
+                                   for (name, values) in telemetry.items()})
+        if progress is not None:
+            progress(1, total)
+        shape = None
+        for (i, (frame_time, loadFrame)) in enumerate(frames):
+            if (cancelled is not None) and cancelled():
+                return False
+            image = loadFrame()
+            if shape is None:
+                if image is None:
+                    continue
+                shape = image.shape
+                writer.beginFrames(len(frames), shape)
+                # frames skipped before the first available one are left empty
+                for j in range(i):
+                    writer.writeFrame(j, np.nan, np.zeros(shape, dtype = np.uint8))
+            if image is None:
+                # the frame was dropped from its cache since the export started
+                (frame_time, image) = (np.nan, np.zeros(shape, dtype = np.uint8))
+            writer.writeFrame(i, frame_time, image)
+            if progress is not None:
+                progress(i + 2, total)
+        completed = True
+    finally:
+        writer.close()
+        if completed:
+            os.replace(part_path, path)
+        elif os.path.exists(part_path):
+            os.remove(part_path)
+    return True
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Export recorded Star Camera telemetry and images")
+    parser.add_argument("output", help = "file to write")
+    parser.add_argument("--format", choices = FORMATS, help = "output format (default: from the file extension)")
+    parser.add_argument("--start", type = telemetry_log.parseTime, help = "start time (C time or UTC date/time)")
+    parser.add_argument("--end", type = telemetry_log.parseTime, help = "end time (C time or UTC date/time)")
+    parser.add_argument("--root", default = telemetry_log.DEFAULT_ROOT, help = "directory of the telemetry log")
+    parser.add_argument("--no-telemetry", action = "store_true", help = "do not export telemetry")
+    parser.add_argument("--frames-dir", help = "also export the frames recorded by headless.py in this directory")
+    args = parser.parse_args(argv)
+
+    export_format = args.format
+    if export_format is None:
+        extension = os.path.splitext(args.output)[1].lower()
+        export_format = {".h5": "hdf5", ".hdf5": "hdf5", ".npz": "npz", ".fits": "fits", ".fit": "fits"}.get(extension)
+        if export_format is None:
+            parser.error("cannot tell the format from the file name; use --format")
+    telemetry = None
+    if not args.no_telemetry:
+        # no limit means from the start of 1970 to the end of 2105
+        start = args.start if args.start is not None else 0.0
+        end = args.end if args.end is not None else float(2**32)
+        telemetry = telemetry_log.TelemetryLog(args.root).query(start, end)
+    frames = recordedFrames(args.frames_dir, args.start, args.end) if args.frames_dir is not None else []
+
+    def progress(done, total):
+        print("\r%d/%d" % (done, total), end = "", file = sys.stderr, flush = True)
+    runExport(args.output, export_format, telemetry, frames, progress)
+    print(file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import math
+import numpy as np
+
+"""
+Client-side adaptive auto-focusing. The camera's own auto-focusing is one linear sweep from a start to an end focus
+position in fixed steps, so most of its images are taken far from focus. The planner instead sends a coarse sweep over
+the range, fits the flux against focus position, and then sends successively narrower and finer sweeps around the
+estimated peak - each an ordinary auto-focusing command - until the uncertainty of the peak position is below a
+tolerance. The focus is then set to the best estimate.
+
+The peak is found by fitting a parabola to the brightest part of the curve (the points above the middle of its flux
+range), using the data of every sweep so far, and its uncertainty is that of the parabola's vertex, from the
+covariance of the fit. The covariance is only trusted with enough data to estimate the scatter - either enough
+distinct positions beyond the three the parabola needs, or repeated images at the same positions (photos per focus),
+which measure the noise directly - and when the curvature is clearly negative. Otherwise the peak is still used to
+centre the next sweep, but it does not end the search.
+
+Each narrower sweep spans a fixed fraction of the one before, centred on the peak. When the fit finds no peak, the
+next sweep is moved over at the same step if the brightest position is at the edge of the sweep (the peak lies beyond
+it). The search also stops before a sweep that would take the images past those of a single sweep over the whole range
+at that sweep's step, since that sweep would then have been cheaper.
+"""
+
+# focus positions in the first, coarse sweep over the whole range and in each narrower sweep after it
+COARSE_POSITIONS = 9
+FINE_POSITIONS = 7
+# each narrower sweep spans this fraction of the one before
+SPAN_FRACTION = 0.3
+# sweeps sent before giving up on reaching the tolerance (the focus is still set to the best estimate)
+MAX_SWEEPS = 6
+# degrees of freedom of the scatter about the fit needed before its uncertainty is trusted...
+MIN_DEGREES_OF_FREEDOM = 3
+# ...and standard errors the curvature of the fit must be below zero by (a flat fit has no meaningful peak)
+MIN_CURVATURE_SIGNIFICANCE = 3.0
+
+"""
+Fit a parabola to the peak of a focus curve.
+Inputs: focus positions and fluxes (any order, repeats allowed).
+Outputs: (peak position, its standard error, the fitted polynomial in the focus position or None). The position is
+that of the brightest point if the peak is not bracketed by the data, and the error is infinite then, or if there are
+too few points to estimate it (see MIN_DEGREES_OF_FREEDOM).
+"""
+def fitPeak(positions, fluxes):
+    (x, y) = (np.asarray(positions, dtype = np.float64), np.asarray(fluxes, dtype = np.float64))
+    (distinct, inverse, counts) = np.unique(x, return_inverse = True, return_counts = True)
+    # average the fluxes measured at the same position to find the bright part of the curve
+    means = np.bincount(inverse, weights = y)/counts
+    brightest = float(distinct[np.argmax(means)])
+    if len(distinct) < 4:
+        return (brightest, math.inf, None)
+    selected = means >= (means.max() + means.min())/2.0
+    if np.count_nonzero(selected) < 4:
+        # the peak is narrower than the sampling: use the points closest to the brightest one
+        selected = np.zeros(len(distinct), dtype = bool)
+        selected[np.argsort(np.abs(distinct - brightest), kind = "stable")[:4]] = True
+    # fit every image at the selected positions, so repeats weigh in
+    keep = selected[inverse]
+    (x, y, groups) = (x[keep], y[keep], inverse[keep])
+    # fit in centred, scaled units so the normal equations are well conditioned
+    (center, scale) = (x.mean(), max(np.ptp(x)/2.0, 1.0))
+    try:
+        (coefficients, covariance) = np.polyfit((x - center)/scale, y, 2, cov = "unscaled")
+    except (ValueError, np.linalg.LinAlgError):
+        return (brightest, math.inf, None)
+    (a, b, _) = coefficients
+    model = np.poly1d(coefficients)(np.poly1d([1.0/scale, -center/scale]))
+    if a >= 0:
+        # no maximum
+        return (brightest, math.inf, model)
+    vertex = -b/(2.0*a)
+    if not (-1.0 <= vertex <= 1.0):
+        # the maximum lies outside the points fitted
+        return (brightest, math.inf, model)
+    peak = center + scale*vertex
+    # scatter about the fit (noise and the curve not being a parabola), and between images at the same position
+    n_positions = np.count_nonzero(selected)
+    fit_dof = len(x) - 3
+    fit_variance = float(np.sum((y - np.polyval(coefficients, (x - center)/scale))**2))/fit_dof if fit_dof else 0.0
+    repeat_dof = len(x) - n_positions
+    if repeat_dof:
+        group_means = np.bincount(groups, weights = y, minlength = len(distinct))[groups]/counts[groups]
+        repeat_variance = float(np.sum((y - group_means)**2))/repeat_dof
+    else:
+        repeat_variance = 0.0
+    if max(n_positions - 3, repeat_dof) < MIN_DEGREES_OF_FREEDOM:
+        return (peak, math.inf, model)
+    noise_variance = max(fit_variance, repeat_variance)
+    if -a < MIN_CURVATURE_SIGNIFICANCE*math.sqrt(covariance[0, 0]*noise_variance):
+        return (peak, math.inf, model)
+    gradient = np.array([b/(2.0*a**2), -1.0/(2.0*a), 0.0])
+    variance = float(gradient @ covariance @ gradient)*noise_variance
+    error = scale*math.sqrt(variance) if (variance >= 0) and np.isfinite(variance) else math.inf
+    return (peak, error, model)
+
+"""
+Class for planning an adaptive focus search.
+Attributes: the focus range, tolerance and finest step, the sweeps sent so far, every (position, flux) measured, and
+the current estimate of the peak, its uncertainty and the fitted curve.
+Methods: firstSweep() - the coarse sweep to start with; addSweep() - add the data of the sweep that just ended and
+get the next sweep (None once done); best() - the focus position to finish at; exposures() - images taken so far and
+by a single sweep over the whole range at the finest step used.
+"""
+class FocusPlanner:
+    def __init__(self, lower, upper, tolerance, min_step = 1, coarse_positions = COARSE_POSITIONS,
+                 fine_positions = FINE_POSITIONS, span_fraction = SPAN_FRACTION, max_sweeps = MAX_SWEEPS):
+        (self.lower, self.upper) = (int(lower), int(upper))
+        self.tolerance = tolerance
+        self.min_step = max(int(min_step), 1)
+        self.coarse_positions = coarse_positions
+        self.fine_positions = fine_positions
+        self.span_fraction = span_fraction
+        self.max_sweeps = max_sweeps
+        # (start, end, step) of each sweep sent
+        self.sweeps = []
+        self.positions, self.fluxes = [], []
+        (self.peak, self.uncertainty, self.model) = (math.nan, math.inf, None)
+
+    """
+    Make a sweep that fits in the focus range, with the end a whole number of steps from the start (so the camera
+    does not have to jump to the end position).
+    Inputs: the centre, half-width and step of the sweep.
+    Outputs: (start, end, step).
+    """
+    def sweep(self, center, half_width, step):
+        step = max(int(step), self.min_step)
+        n_steps = max(int(math.ceil(2*half_width/step)), 2)
+        # keep the sweep within the range, shifting it inwards rather than cutting it short
+        n_steps = min(n_steps, (self.upper - self.lower)//step)
+        start = int(round(center - n_steps*step/2.0))
+        start = min(max(start, self.lower), self.upper - n_steps*step)
+        return (start, start + n_steps*step, step)
+
+    def firstSweep(self):
+        step = max((self.upper - self.lower)//(self.coarse_positions - 1), self.min_step)
+        self.sweeps.append(self.sweep((self.lower + self.upper)/2.0, (self.upper - self.lower)/2.0, step))
+        return self.sweeps[-1]
+
+    """
+    Add the data of the sweep that just ended, re-fit the peak and plan the next sweep.
+    Inputs: focus positions and fluxes measured in the sweep.
+    Outputs: (start, end, step) of the next sweep, or None if the peak is known well enough (or the sweeps have run
+    out, the step cannot get any finer, or one sweep over the whole range would have been cheaper) and the focus should
+    be set to best().
+    """
+    def addSweep(self, positions, fluxes):
+        self.positions.extend(positions)
+        self.fluxes.extend(fluxes)
+        if not self.positions:
+            return None
+        (start, end, step) = self.sweeps[-1]
+        # fit the data of every sweep, so the narrower sweeps add to the bright part of the curve rather than replace it
+        (peak, uncertainty, model) = fitPeak(self.positions, self.fluxes)
+        (self.peak, self.uncertainty, self.model) = (peak, uncertainty, model)
+        if (uncertainty <= self.tolerance) or (len(self.sweeps) >= self.max_sweeps):
+            return None
+        if step <= self.min_step:
+            return None
+        if math.isinf(uncertainty) and (peak in (start, end)) and (self.lower < peak < self.upper):
+            # the peak is beyond the edge of the sweep: move the sweep over at the same step
+            sweep = self.sweep(peak, (end - start)/2.0, step)
+        else:
+            half_width = self.span_fraction*(end - start)/2.0
+            next_step = max(int(math.ceil(2*half_width/(self.fine_positions - 1))), self.min_step)
+            if next_step >= step:
+                next_step = max(step - 1, self.min_step)
+            sweep = self.sweep(peak, half_width, next_step)
+        (taken, full_scan) = self.exposures(1, sweep)
+        if taken > full_scan:
+            return None
+        self.sweeps.append(sweep)
+        return sweep
+
+    def best(self):
+        if not math.isnan(self.peak):
+            return int(round(min(max(self.peak, self.lower), self.upper)))
+        return int(round(self.positions[int(np.argmax(self.fluxes))])) if self.positions else None
+
+    """
+    Count the images taken.
+    Inputs: pictures taken at each focus position, and a sweep to count as if taken too (None for none).
+    Outputs: (images taken by the sweeps so far, images a single sweep over the whole range at the finest step used
+    would take).
+    """
+    def exposures(self, photos_per_focus, planned = None):
+        sweeps = self.sweeps + ([planned] if planned is not None else [])
+        taken = sum((end - start)//step + 1 for (start, end, step) in sweeps)*photos_per_focus
+        finest = min(step for (_, _, step) in sweeps) if sweeps else 1
+        return (taken, ((self.upper - self.lower)//finest + 1)*photos_per_focus)
@@ -0,0 +1,155 @@
+import collections
+import os
+import tempfile
+import threading
+import numpy as np
+import image_pyramid
+
+"""
+Cache of recently received frames for flipping back through them in the GUI (e.g. to look at a satellite trail or a
+passing cloud). The newest frames are kept in memory up to a byte budget, least recently used first out; frames
+pushed out of memory are written to a fixed number of slots in a memory-mapped file, so older frames can still be
+opened without holding them in RAM. A small thumbnail of every cached frame is kept in memory for the filmstrip.
+The cache can be read from other threads (e.g. by an export) while the GUI keeps adding frames.
+"""
+
+# bytes of full frames kept in memory
+DEFAULT_MEMORY_BUDGET = 64*1024*1024
+# frames kept in the on-disk cache once they leave memory
+DEFAULT_DISK_FRAMES = 100
+# thumbnails are the frames downsampled by this factor (one of image_pyramid.FACTORS)
+THUMBNAIL_FACTOR = 8
+
+"""
+Class for the frame cache.
+Attributes: the in-memory frames (in least to most recently used order) and their total size, the memory-mapped
+file and which frame is in each of its slots, the thumbnails and the time of every cached frame.
+Methods: add() - cache a new frame; get() - a cached frame; thumbnail() - its thumbnail; frameTime() - its camera
+time; keys() - the cached frames, newest first; close() - remove the on-disk cache.
+"""
+class FrameCache:
+    def __init__(self, memory_budget = DEFAULT_MEMORY_BUDGET, disk_frames = DEFAULT_DISK_FRAMES, directory = None):
+        self.memory_budget = memory_budget
+        self.disk_frames = disk_frames
+        self.directory = directory
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.disk = None
+        self.disk_path = None
+        self.disk_slots = {}
+        self.slot_keys = [None]*disk_frames
+        self.next_slot = 0
+        self.thumbnails = {}
+        self.times = {}
+        self.next_key = 0
+        self.lock = threading.RLock()
+
+    """
+    Cache a new frame.
+    Inputs: 2D uint8 image and the camera time it was taken at.
+    Outputs: Key of the new frame (keys() shows which older frames are still cached).
+    """
+    def add(self, image, camera_time):
+        thumbnail = image
+        while image.shape[0]//thumbnail.shape[0] < THUMBNAIL_FACTOR:
+            thumbnail = image_pyramid.halve(thumbnail, "max")
+        with self.lock:
+            key = self.next_key
+            self.next_key += 1
+            self.memory[key] = image
+            self.memory_bytes += image.nbytes
+            self.times[key] = camera_time
+            self.thumbnails[key] = thumbnail
+            self.trimMemory()
+        return key
+
+    # spill the least recently used frames to disk until memory is back under budget (keeping the newest one)
+    def trimMemory(self):
+        while (self.memory_bytes > self.memory_budget) and (len(self.memory) > 1):
+            (old_key, old_image) = self.memory.popitem(last = False)
+            self.memory_bytes -= old_image.nbytes
+            if old_key not in self.disk_slots:
+                self.spill(old_key, old_image)
+
+    def spill(self, key, image):
+        if self.disk_frames == 0:
+            self.forget(key)
+            return
+        if self.disk is None:
+            (handle, self.disk_path) = tempfile.mkstemp(prefix = "starcam_frames_", suffix = ".u8",
+                                                        dir = self.directory)
+            os.close(handle)
+            self.disk = np.memmap(self.disk_path, dtype = np.uint8, mode = "w+",
+                                  shape = (self.disk_frames,) + image.shape)
+        # the slots are reused in order, so the oldest frame on disk is the one overwritten
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.disk_frames
+        old_key = self.slot_keys[slot]
+        if old_key is not None:
+            del self.disk_slots[old_key]
+            if old_key not in self.memory:
+                self.forget(old_key)
+        self.disk[slot] = image
+        self.disk_slots[key] = slot
+        self.slot_keys[slot] = key
+
+    def forget(self, key):
+        del self.thumbnails[key]
+        del self.times[key]
+
+    """
+    Get a cached frame.
+    Inputs: key of the frame, and whether to mark it as recently used (bringing it back into memory if it was on
+    disk); bulk readers such as exports should not, so they do not push the frames being looked at out of memory.
+    Outputs: The 2D image, or None if it is no longer cached.
+    """
+    def get(self, key, touch = True):
+        with self.lock:
+            if key in self.memory:
+                if touch:
+                    self.memory.move_to_end(key)
+                return self.memory[key]
+            if key not in self.disk_slots:
+                return None
+            image = np.array(self.disk[self.disk_slots[key]])
+            if touch:
+                # bring it back into memory, where it is also kept until it is pushed out again
+                self.memory[key] = image
+                self.memory_bytes += image.nbytes
+                self.trimMemory()
+            return image
+
+    """
+    Change the byte budget of the in-memory frames, spilling frames to disk straight away if it has shrunk.
+    Inputs: the new budget in bytes.
+    Outputs: None.
+    """
+    def setMemoryBudget(self, memory_budget):
+        with self.lock:
+            self.memory_budget = memory_budget
+            self.trimMemory()
+
+    # bytes of the in-memory frames and all the thumbnails
+    def memoryUsage(self):
+        with self.lock:
+            return self.memory_bytes + sum(thumbnail.nbytes for thumbnail in self.thumbnails.values())
+
+    def thumbnail(self, key):
+        with self.lock:
+            return self.thumbnails.get(key)
+
+    def frameTime(self, key):
+        with self.lock:
+            return self.times.get(key)
+
+    def keys(self):
+        with self.lock:
+            return sorted(self.times, reverse = True)
+
+    def close(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            if self.disk is not None:
+                self.disk = None
+                os.remove(self.disk_path)
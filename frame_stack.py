@@ -0,0 +1,108 @@
+import numpy as np
+
+"""
+Streaming stack of Star Camera frames for building dark frames and hot pixel maps on the client. Every frame updates
+a per-pixel running mean and variance (Welford's method) and a running median estimate (a stochastic approximation
+that moves towards each new value by a shrinking step), all in float32, so memory use is a few images no matter how
+many frames are stacked and no frame is kept.
+"""
+
+# robust sigma of a Gaussian from its median absolute deviation
+MAD_TO_SIGMA = 1.4826
+# the sensor-wide statistics used to find hot pixels are taken on every SUBSAMPLE-th pixel in each direction
+SUBSAMPLE = 4
+
+"""
+Class for accumulating frames.
+Attributes: number of frames stacked, and the per-pixel mean, sum of squared deviations and median estimate.
+Methods: add() - stack one frame; variance() - per-pixel variance; median() - per-pixel median estimate;
+hotPixelMask() - pixels that are much brighter or noisier than the rest of the sensor; save() - export everything to
+a .npz file; reset() - start again.
+"""
+class FrameStack:
+    def __init__(self, shape):
+        self.shape = shape
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = np.zeros(self.shape, dtype = np.float32)
+        self.m2 = np.zeros(self.shape, dtype = np.float32)
+        self.median_estimate = np.zeros(self.shape, dtype = np.float32)
+        # scratch space, so stacking a frame does not allocate image-sized temporaries
+        self.frame = np.zeros(self.shape, dtype = np.float32)
+        self.delta = np.zeros(self.shape, dtype = np.float32)
+
+    """
+    Stack one frame.
+    Inputs: 2D image of the stack's shape (any numeric type).
+    Outputs: None.
+    """
+    def add(self, image):
+        np.copyto(self.frame, image, casting = "unsafe")
+        self.count += 1
+        if self.count == 1:
+            np.copyto(self.mean, self.frame)
+            np.copyto(self.median_estimate, self.frame)
+            return
+        # Welford: delta = x - old mean, mean += delta/n, m2 += delta*(x - new mean)
+        np.subtract(self.frame, self.mean, out = self.delta)
+        self.mean += self.delta/np.float32(self.count)
+        np.subtract(self.frame, self.mean, out = self.frame)
+        self.frame *= self.delta
+        self.m2 += self.frame
+        # median: step towards the new value by a/n, with a = 1.25*sigma (the optimal gain for Gaussian noise) but
+        # at least 1/n, so pixels that have not varied yet can still move
+        np.copyto(self.frame, image, casting = "unsafe")
+        np.subtract(self.frame, self.median_estimate, out = self.delta)
+        np.sign(self.delta, out = self.delta)
+        step = np.sqrt(self.m2/np.float32(self.count - 1))
+        step *= np.float32(1.25)
+        np.maximum(step, np.float32(1.0), out = step)
+        step /= np.float32(self.count)
+        self.delta *= step
+        self.median_estimate += self.delta
+
+    def variance(self):
+        if self.count < 2:
+            return np.zeros(self.shape, dtype = np.float32)
+        return self.m2/np.float32(self.count - 1)
+
+    def median(self):
+        return self.median_estimate
+
+    """
+    Find hot pixels: pixels whose mean (or, optionally, standard deviation) is far above that of the rest of the
+    sensor, judged with the median and median absolute deviation so the hot pixels themselves do not skew the limit.
+    Inputs: how many robust sigmas above the sensor median a pixel has to be, and whether to also flag noisy
+    (flickering) pixels.
+    Outputs: Boolean array, True for hot pixels.
+    """
+    def hotPixelMask(self, n_sigma = 5.0, include_noisy = True):
+        mask = aboveRobustLimit(self.mean, n_sigma)
+        if include_noisy and (self.count >= 2):
+            mask |= aboveRobustLimit(np.sqrt(self.variance()), n_sigma)
+        return mask
+
+    """
+    Export the stack.
+    Inputs: path of the .npz file and the hot pixel threshold.
+    Outputs: None.
+    """
+    def save(self, path, n_sigma = 5.0):
+        hot_pixels = self.hotPixelMask(n_sigma)
+        np.savez_compressed(path, count = self.count, mean = self.mean, variance = self.variance(),
+                            median = self.median_estimate, hot_pixel_mask = hot_pixels,
+                            hot_pixels = np.argwhere(hot_pixels))
+
+"""
+Find the pixels of an image above median + n_sigma robust standard deviations of the whole image.
+Inputs: 2D image and the number of sigmas.
+Outputs: Boolean array.
+"""
+def aboveRobustLimit(image, n_sigma):
+    sample = image[::SUBSAMPLE, ::SUBSAMPLE]
+    median = np.median(sample)
+    sigma = MAD_TO_SIGMA*np.median(np.abs(sample - median))
+    # a perfectly flat image has no spread at all; still only flag pixels that actually stand out
+    return image > median + max(n_sigma*sigma, np.finfo(np.float32).eps*max(abs(median), 1.0))
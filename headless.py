@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+import listening_final
+
+"""
+Headless Star Camera client for unattended nights: receives telemetry and images with the same functions the GUI uses
+(establishStarCamSocket(), getStarCamData() and getStarCamImage()), backs the telemetry up to data.txt, optionally
+records every image to disk and reports throughput statistics on stdout and/or a local socket. Does not import Qt.
+"""
+
+# number of image buffers shared between the receiving and recording stages; if the recorder falls this far behind,
+# new images are dropped rather than queued so memory use stays fixed
+IMAGE_BUFFERS = 3
+
+"""
+Class holding the counters of a headless session, shared by the pipeline threads and the statistics reporters.
+Attributes: the counters themselves and a lock guarding them.
+Methods: add() - increment counters; snapshot() - return a dictionary of the counters and derived rates.
+"""
+class HeadlessStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = {"telemetry_received": 0, "images_received": 0, "images_recorded": 0, "images_dropped": 0,
+                         "bytes_received": 0, "solutions": 0, "connections": 0, "disconnects": 0}
+        self.last_camera_time = 0.0
+        self.last_snapshot = (self.start_time, dict(self.counters))
+
+    def add(self, **increments):
+        with self.lock:
+            for (name, value) in increments.items():
+                self.counters[name] += value
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            counters = dict(self.counters)
+            (previous_time, previous_counters) = self.last_snapshot
+            self.last_snapshot = (now, counters)
+        interval = max(now - previous_time, 1e-9)
+        stats = {"time": now, "uptime": now - self.start_time, "last_camera_time": self.last_camera_time}
+        stats.update(counters)
+        stats["telemetry_per_second"] = (counters["telemetry_received"] -
+                                         previous_counters["telemetry_received"])/interval
+        stats["images_per_second"] = (counters["images_received"] - previous_counters["images_received"])/interval
+        stats["megabytes_per_second"] = (counters["bytes_received"] - previous_counters["bytes_received"])/interval/1e6
+        return stats
+
+"""
+Class for the local statistics server: every client connecting to it is sent the latest statistics as one line of
+JSON and then disconnected (e.g. `nc localhost 8765` or `nc -U /tmp/starcam.sock`).
+"""
+class StatsRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write((json.dumps(self.server.latest_stats) + "\n").encode())
+
+class TCPStatsServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixStatsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+"""
+Class running the receive -> decode -> record pipeline without a GUI.
+Attributes: connection settings, recording directory, statistics and the buffers/queues between the pipeline stages.
+Methods: run() - connect (and re-connect) to the camera and receive until stopped; stop() - stop the pipeline;
+receiveLoop() - receive telemetry and images from one connection; recordLoop() - write images to disk.
+"""
+class HeadlessClient:
+    def __init__(self, StarCam_IP, user_port, record_dir = None, reconnect_delay = 5.0):
+        self.StarCam_IP = StarCam_IP
+        self.user_port = user_port
+        self.record_dir = record_dir
+        self.reconnect_delay = reconnect_delay
+        self.stats = HeadlessStats()
+        self.stopping = threading.Event()
+        self.StarCam_socket = None
+        # fixed pool of image buffers: free buffers wait in free_buffers, filled ones in recording_queue
+        self.free_buffers = queue.Queue()
+        for _ in range(IMAGE_BUFFERS):
+            self.free_buffers.put(bytearray(listening_final.IMAGE_SIZE))
+        self.recording_queue = queue.Queue()
+        # images that are dropped are still read off the socket, into this scratch buffer
+        self.drop_buffer = bytearray(listening_final.IMAGE_SIZE)
+        if self.record_dir is not None:
+            os.makedirs(self.record_dir, exist_ok = True)
+
+    def run(self):
+        listening_final.prepareBackupFile()
+        recorder = threading.Thread(target = self.recordLoop, name = "recorder", daemon = True)
+        recorder.start()
+        while not self.stopping.is_set():
+            try:
+                socket_bundle = listening_final.establishStarCamSocket(self.StarCam_IP, self.user_port)
+            except socket.error as error:
+                print("Could not connect to %s:%d (%s), retrying in %.0f seconds" % (self.StarCam_IP, self.user_port,
+                                                                                     error, self.reconnect_delay))
+                self.stopping.wait(self.reconnect_delay)
+                continue
+            self.StarCam_socket = socket_bundle[0]
+            self.stats.add(connections = 1)
+            self.receiveLoop(self.StarCam_socket)
+            self.StarCam_socket.close()
+            if not self.stopping.is_set():
+                self.stats.add(disconnects = 1)
+                print("Camera disconnected, reconnecting in %.0f seconds" % self.reconnect_delay)
+                self.stopping.wait(self.reconnect_delay)
+        self.recording_queue.put(None)
+        recorder.join()
+
+    def stop(self):
+        self.stopping.set()
+        # unblock a receive that is waiting on the camera
+        if self.StarCam_socket is not None:
+            try:
+                self.StarCam_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def receiveLoop(self, client_socket):
+        while not self.stopping.is_set():
+            telemetry = listening_final.getStarCamData(client_socket)
+            if telemetry is None:
+                return
+            # decode just what the statistics need (a solution is any packet with non-zero pointing)
+            unpacked_data = struct.unpack_from(listening_final.TELEMETRY_FORMAT, telemetry)
+            self.stats.last_camera_time = unpacked_data[1]
+            self.stats.add(telemetry_received = 1, bytes_received = len(telemetry), 
+                           solutions = int(all(unpacked_data[6:13])))
+            # take a free buffer, or drop this image if the recorder still holds all of them
+            try:
+                image_buffer = self.free_buffers.get_nowait()
+                dropped = False
+            except queue.Empty:
+                image_buffer = self.drop_buffer
+                dropped = True
+            image = listening_final.getStarCamImage(client_socket, image_buffer)
+            if image is None:
+                if not dropped:
+                    self.free_buffers.put(image_buffer)
+                return
+            self.stats.add(images_received = 1, bytes_received = len(image))
+            if (self.record_dir is not None) and (not dropped):
+                self.recording_queue.put((unpacked_data[1], image_buffer))
+            elif dropped:
+                self.stats.add(images_dropped = 1)
+            else:
+                self.free_buffers.put(image_buffer)
+
+    def recordLoop(self):
+        while True:
+            item = self.recording_queue.get()
+            if item is None:
+                return
+            (camera_time, image_buffer) = item
+            image = np.frombuffer(image_buffer, dtype = np.uint8).reshape((listening_final.IMAGE_HEIGHT,
+                                                                           listening_final.IMAGE_WIDTH))
+            part_name = os.path.join(self.record_dir, "starcam_%.3f.%d.part" % (camera_time, os.getpid()))
+            # write under a temporary name so readers never see a partial frame
+            with open(part_name, "wb") as frame_file:
+                np.save(frame_file, image)
+            self.free_buffers.put(image_buffer)
+            # frames can share a camera time (to the millisecond), so the frame only takes a name nobody has yet
+            # (linking fails if the name exists): starcam_<time>.npy, then starcam_<time>_1.npy and so on
+            sequence = 0
+            while True:
+                file_name = "starcam_%.3f%s.npy" % (camera_time, "_%d" % sequence if sequence else "")
+                try:
+                    os.link(part_name, os.path.join(self.record_dir, file_name))
+                    break
+                except FileExistsError:
+                    sequence += 1
+            os.remove(part_name)
+            self.stats.add(images_recorded = 1)
+
+"""
+Periodically print the statistics and publish them to the statistics servers.
+Inputs: the headless client, the reporting interval in seconds, whether to print to stdout, and the list of
+statistics servers (TCP and/or Unix domain socket, possibly none).
+Outputs: None. Runs until the client is stopped.
+"""
+def reportStats(client, interval, print_stats, stats_servers):
+    while not client.stopping.wait(interval):
+        stats = client.stats.snapshot()
+        for stats_server in stats_servers:
+            stats_server.latest_stats = stats
+        if print_stats:
+            print(json.dumps(stats), flush = True)
+
+"""
+Parse the command line and run the headless client until interrupted.
+Inputs: command-line arguments (defaults to sys.argv).
+Outputs: None.
+"""
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Receive, back up and record Star Camera data without the GUI")
+    parser.add_argument("ip", help = "IP address of the Star Camera computer")
+    parser.add_argument("port", type = int, help = "server port of the Star Camera")
+    parser.add_argument("--record-dir", help = "directory to save every received image to (as .npy files)")
+    parser.add_argument("--stats-interval", type = float, default = 10.0, help = "seconds between statistics reports")
+    parser.add_argument("--quiet", action = "store_true", help = "do not print the statistics to stdout")
+    parser.add_argument("--stats-port", type = int, help = "serve the statistics as JSON on this localhost TCP port")
+    parser.add_argument("--stats-socket", help = "serve the statistics as JSON on this Unix domain socket path")
+    parser.add_argument("--reconnect-delay", type = float, default = 5.0,
+                        help = "seconds to wait before re-connecting after a disconnect")
+    parser.add_argument("--backup", choices = ["text", "columnar", "both", "none"], default = "both",
+                        help = "back the telemetry up to data.txt, the columnar telemetry log, both, or neither (when "
+                               "connected through a relay, which backs the telemetry up itself)")
+    parser.add_argument("--receive-buffer", type = listening_final.parseReceiveBuffer,
+                        help = "receive buffer of the camera socket in KB, or auto to tune it from the throughput "
+                               "(default: the system's)")
+    args = parser.parse_args(argv)
+
+    listening_final.setReceiveBuffer(args.receive_buffer)
+    listening_final.backup_text = args.backup in ("text", "both")
+    listening_final.backup_columnar = args.backup in ("columnar", "both")
+    # one line per packet is too much for an unattended night
+    listening_final.verbose = False
+    client = HeadlessClient(args.ip, args.port, args.record_dir, args.reconnect_delay)
+
+    # both servers run if both a port and a socket are given
+    stats_servers = []
+    if args.stats_port is not None:
+        stats_servers.append(TCPStatsServer(("127.0.0.1", args.stats_port), StatsRequestHandler))
+    if args.stats_socket is not None:
+        if os.path.exists(args.stats_socket):
+            os.remove(args.stats_socket)
+        stats_servers.append(UnixStatsServer(args.stats_socket, StatsRequestHandler))
+    for stats_server in stats_servers:
+        stats_server.latest_stats = client.stats.snapshot()
+        threading.Thread(target = stats_server.serve_forever, name = "stats server", daemon = True).start()
+    threading.Thread(target = reportStats, args = (client, args.stats_interval, not args.quiet, stats_servers),
+                     name = "stats reporter", daemon = True).start()
+
+    signal.signal(signal.SIGINT, lambda signum, frame: client.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.stop())
+    client.run()
+    for stats_server in stats_servers:
+        stats_server.shutdown()
+        stats_server.server_close()
+
+if __name__ == "__main__":
+    main()
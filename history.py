@@ -0,0 +1,155 @@
+import math
+import os
+import numpy as np
+import telemetry_log
+
+"""
+Read-only view of a stored telemetry log (see telemetry_log) for browsing past nights in the GUI's graphs. Opening a
+log only lists its day directories and reads their small sparse indices; the columns are memory-mapped, and each
+request for the visible time window reads just the rows in that window, reduced to at most a few thousand points, so
+panning around a multi-gigabyte archive never parses or loads the whole thing.
+"""
+
+# when a window holds at most this many rows per output point, the points are a min/max envelope of every row;
+# beyond that, rows are sampled at a stride so only a bounded number of pages is touched
+ENVELOPE_MAX_STEP = 64
+
+"""
+Class for paging data out of a telemetry log.
+Attributes: the log and its time extent.
+Methods: extent() - first and last time in the log; window() - times and values of one column in a time range.
+"""
+class TelemetryHistory:
+    def __init__(self, root):
+        self.log = telemetry_log.TelemetryLog(root)
+        self.days = [day for day in self.log.days() if self.log.day(day).rows > 0]
+        if not self.days:
+            raise ValueError("No telemetry found in %s" % root)
+
+    def extent(self):
+        first = self.log.day(self.days[0]).column("ctime")
+        last = self.log.day(self.days[-1]).column("ctime")
+        return (float(first[0]), float(last[-1]))
+
+    """
+    Get one column's values in a time range, reduced to at most about max_points points.
+    Inputs: column name (one of telemetry_log.COLUMNS), start and end C times in seconds and the maximum number of
+    points to return.
+    Outputs: (times, values) arrays. Rows where the column is exactly 0 (no Astrometry solution) are left out, like
+    in the live graphs.
+    """
+    def window(self, column, t0, t1, max_points = 4000):
+        spans = []
+        for day in self.days:
+            if (day < telemetry_log.dayName(t0)) or (day > telemetry_log.dayName(t1)):
+                continue
+            reader = self.log.day(day)
+            (start, end) = reader.rowRange(t0, t1)
+            if end > start:
+                spans.append((reader, start, end))
+        total = sum(end - start for (_, start, end) in spans)
+        if total == 0:
+            return (np.zeros(0), np.zeros(0))
+        # the envelope gives two points per bucket of rows
+        step = 1 if total <= max_points else math.ceil(2*total/max_points)
+        (times, values) = ([], [])
+        for (reader, start, end) in spans:
+            (span_times, span_values) = reduceSpan(reader.column("ctime"), reader.column(column), start, end, step)
+            times.append(span_times)
+            values.append(span_values)
+        times = np.concatenate(times)
+        values = np.concatenate(values)
+        solved = (values != 0) & ~np.isnan(values)
+        return (times[solved], values[solved])
+
+"""
+Reduce rows [start, end) of a memory-mapped column to roughly (end - start)/step points.
+Inputs: the time and value columns, the row range and the reduction step.
+Outputs: (times, values) arrays. Rows that are exactly 0 (no solution) do not count towards the envelope of their
+bucket, and a bucket with no other rows gives NaN; like the rows left as they are, these are for the caller to drop.
+"""
+def reduceSpan(times, values, start, end, step):
+    if step == 1:
+        return (np.array(times[start:end]), np.array(values[start:end]))
+    if step > ENVELOPE_MAX_STEP:
+        return (np.array(times[start:end:step]), np.array(values[start:end:step]))
+    # min/max envelope of each bucket of step rows, so spikes stay visible when zoomed out
+    buckets = (end - start)//step
+    stop = start + buckets*step
+    bucket_values = np.array(values[start:stop], dtype = np.float64).reshape(buckets, step)
+    bucket_values[bucket_values == 0] = np.nan
+    bucket_times = np.array(times[start:stop:step])
+    envelope_times = np.repeat(bucket_times, 2)
+    # fmin and fmax skip the NaNs of the unsolved rows (and give NaN, without a warning, if the whole bucket is)
+    envelope_values = np.column_stack((np.fmin.reduce(bucket_values, axis = 1),
+                                       np.fmax.reduce(bucket_values, axis = 1))).ravel()
+    # keep the partial bucket at the end as it is
+    return (np.concatenate((envelope_times, times[stop:end])), np.concatenate((envelope_values, values[stop:end])))
+
+"""
+Find the size of the whole lines of a text file, leaving out a line still being written.
+Inputs: path of the file.
+Outputs: Offset just past the last newline (0 if there is none).
+"""
+def completeLength(path):
+    with open(path, "rb") as text_file:
+        size = text_file.seek(0, os.SEEK_END)
+        # lines of data.txt are about a hundred bytes long
+        tail_start = max(size - 65536, 0)
+        text_file.seek(tail_start)
+        last_newline = text_file.read().rfind(b"\n")
+    return tail_start + last_newline + 1 if last_newline >= 0 else 0
+
+"""
+Find how much of a data.txt file an earlier import covered, checking the file was only appended to since.
+Inputs: path of the file and of the stamp the import left (the offset it reached and the line just before it).
+Outputs: The offset to import from, or None if the file was never imported or has been rewritten.
+"""
+def importedLength(path, stamp_path):
+    try:
+        with open(stamp_path) as stamp_file:
+            (offset, last_line) = stamp_file.read().split("\n", 1)
+        offset = int(offset)
+        with open(path, "rb") as text_file:
+            text_file.seek(max(offset - len(last_line), 0))
+            if text_file.read(len(last_line)).decode("ascii", "replace") != last_line:
+                return None
+    except (OSError, ValueError):
+        return None
+    return offset
+
+"""
+Find (or create) the telemetry log to browse for a file chosen by the user: any file inside a log opens that log, and
+a data.txt backup file is imported into a log next to it - in full the first time (or if the file has been rewritten),
+and afterwards only the rows appended since the last import.
+Inputs: path of the chosen file, and a function called with the bytes imported and the total after each chunk (None
+for no progress).
+Outputs: The root directory of the log.
+"""
+def logRootFor(path, progress = None):
+    if path.endswith(".f64"):
+        return os.path.dirname(os.path.dirname(os.path.abspath(path)))
+    root = os.path.abspath(path) + "_log"
+    stamp_path = os.path.join(root, "imported_from.txt")
+    start = importedLength(path, stamp_path)
+    if (start is None) and os.path.isdir(root):
+        for day in os.listdir(root):
+            day_dir = os.path.join(root, day)
+            if os.path.isdir(day_dir):
+                for name in os.listdir(day_dir):
+                    os.remove(os.path.join(day_dir, name))
+                os.rmdir(day_dir)
+    start = 0 if start is None else start
+    # whole lines only, since the GUI may be half way through appending one
+    end = completeLength(path)
+    if end > start:
+        telemetry_log.importBackupFile(path, root, start = start, end = end, progress = progress)
+    os.makedirs(root, exist_ok = True)
+    with open(path, "rb") as text_file:
+        text_file.seek(max(end - 4096, 0))
+        tail = text_file.read(end - max(end - 4096, 0)).decode("ascii", "replace")
+    # the last line imported (with its newline), to check the file is only appended to next time
+    last_line = tail[tail.rfind("\n", 0, len(tail) - 1) + 1:] if tail else ""
+    with open(stamp_path, "w", newline = "") as stamp_file:
+        stamp_file.write("%d\n%s" % (end, last_line))
+    return root
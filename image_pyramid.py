@@ -0,0 +1,65 @@
+import numpy as np
+
+"""
+Downsampled copies of an image (an image pyramid) for the Images tab, so a zoomed-out view draws a small image instead
+of resampling the full 1936x1216 frame on every pan or zoom. Each level is built from the one before it by combining
+2x2 blocks, so building all of them costs little more than the first.
+"""
+
+# downsampling factors of the levels after the full-resolution image
+FACTORS = (2, 4, 8)
+# number of bins in the histogram of the coarsest level
+HISTOGRAM_BINS = 256
+
+"""
+Halve an image in both directions.
+Inputs: 2D image and how to combine each 2x2 block ("max" keeps stars and hot pixels visible when zoomed out,
+"mean" gives a smoother picture). Odd last rows/columns are dropped.
+Outputs: The half-size image (same type as the input for "max", float32 for "mean").
+"""
+def halve(image, mode = "max"):
+    height = image.shape[0]//2
+    width = image.shape[1]//2
+    # the four pixels of every block, as strided views (faster than reducing over a reshaped array)
+    corners = [image[i:2*height:2, j:2*width:2] for i in (0, 1) for j in (0, 1)]
+    if mode == "max":
+        return np.maximum(np.maximum(corners[0], corners[1]), np.maximum(corners[2], corners[3]))
+    total = corners[0].astype(np.float32)
+    for corner in corners[1:]:
+        total += corner
+    total *= np.float32(0.25)
+    return total
+
+"""
+Build the pyramid of an image.
+Inputs: 2D image and the downsampling mode (see halve()).
+Outputs: Dictionary with "levels" (list of (factor, image) pairs starting with (1, the image itself)) and
+"histogram" ((counts, bin edges) of the coarsest level, for setting the display levels).
+"""
+def buildPyramid(image, mode = "max"):
+    levels = [(1, image)]
+    # each level is halved from the one before it
+    while levels[-1][0] < FACTORS[-1]:
+        levels.append((2*levels[-1][0], halve(levels[-1][1], mode)))
+    levels = [(factor, level) for (factor, level) in levels if (factor == 1) or (factor in FACTORS)]
+    coarsest = levels[-1][1]
+    if coarsest.dtype == np.uint8:
+        # bincount is much faster than histogram for 8-bit images
+        histogram = (np.bincount(coarsest.ravel(), minlength = 256), np.arange(257, dtype = np.float64))
+    else:
+        low = float(coarsest.min())
+        high = max(float(coarsest.max()), low + 1e-6)
+        histogram = np.histogram(coarsest, bins = HISTOGRAM_BINS, range = (low, high))
+    return {"levels": levels, "histogram": histogram}
+
+"""
+Choose the level to display at the current zoom: the coarsest one that still has at least one pixel per screen pixel.
+Inputs: list of (factor, image) levels and the number of full-resolution image pixels per screen pixel.
+Outputs: Index of the level in the list.
+"""
+def levelForScale(levels, pixels_per_screen_pixel):
+    index = 0
+    for (i, (factor, _)) in enumerate(levels):
+        if factor <= pixels_per_screen_pixel:
+            index = i
+    return index
@@ -0,0 +1,122 @@
+import math
+import numpy as np
+import blob_finder
+
+"""
+Image quality metrics of every received frame, for following focus drift and cloud cover between auto-focusing
+sweeps without taking extra exposures:
+- background: sky level, the median of a subsample of the pixels;
+- noise: spread of the sky, from the distance between the median and the 15.87th percentile of the subsample (one
+  sigma for Gaussian noise, and below the median, so stars do not inflate it);
+- saturation: fraction of pixels at the top of the 8-bit range;
+- sources and HFD: number of bright point sources found, and their median half-flux diameter (the diameter of the
+  circle holding half of a source's flux above the background, which equals the FWHM for a Gaussian profile and grows
+  as the image goes out of focus).
+Everything is whole-array NumPy: the percentiles use np.partition on the subsample, sources are the local maxima among
+the pixels above a threshold, and the half-flux diameters of all sources are found at once from a stack of cutouts.
+"""
+
+# the background and noise are estimated on every SUBSAMPLE-th pixel in each direction
+SUBSAMPLE = 4
+# pixel value of a saturated pixel
+SATURATION = 255
+# sources are peaks this many sigma above the background...
+SOURCE_SIGMA = 10.0
+# ...at most this many of the brightest are measured...
+MAX_SOURCES = 50
+# ...within cutouts of this radius in pixels, which also sets the minimum distance between two sources
+CUTOUT_RADIUS = 10
+# metrics of a frame: key -> (graph title, axis label)
+METRICS = {"background": ("Sky Background", "Background [pixel value]"),
+           "noise": ("Sky Noise", "Noise [pixel value]"),
+           "saturation": ("Saturated Pixels", "Saturated pixels [%]"),
+           "hfd": ("Median Half-Flux Diameter", "HFD [pixels]"),
+           "sources": ("Bright Sources", "Sources")}
+
+"""
+Estimate the sky background and noise of an image.
+Inputs: 2D image.
+Outputs: (background, noise) in pixel values.
+"""
+def skyLevels(image):
+    sample = image[::SUBSAMPLE, ::SUBSAMPLE].ravel()
+    # the two order statistics needed, without sorting the whole sample
+    indices = [int(0.1587*(len(sample) - 1)), (len(sample) - 1)//2]
+    (low, median) = np.partition(sample, indices)[indices].astype(np.float64)
+    # 8-bit pixel values can make the two equal on a flat sky; the noise is at least the quantisation step
+    return (float(median), max(float(median - low), 1.0/math.sqrt(12.0)))
+
+"""
+Find the bright point sources of an image: local maxima above a threshold that are not saturated, not single hot
+pixels and not too close to the edge or to a brighter source.
+Inputs: 2D image, background and noise.
+Outputs: Array of (row, column) pixel positions, brightest first.
+"""
+def findSources(image, background, noise):
+    (height, width) = image.shape
+    threshold = background + SOURCE_SIGMA*noise
+    candidates = np.flatnonzero(image > threshold)
+    (rows, columns) = np.divmod(candidates, width)
+    inside = ((rows >= CUTOUT_RADIUS) & (rows < height - CUTOUT_RADIUS) &
+              (columns >= CUTOUT_RADIUS) & (columns < width - CUTOUT_RADIUS))
+    (rows, columns) = (rows[inside], columns[inside])
+    peaks = image[rows, columns].astype(np.float64)
+    # local maxima of their 3x3 neighbourhoods
+    neighbours = np.stack([image[rows + dy, columns + dx] for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                           if dy or dx]).astype(np.float64)
+    keep = (peaks >= neighbours.max(axis = 0)) & (peaks < SATURATION)
+    # a hot pixel stands alone, a star spreads over its neighbours
+    keep &= neighbours[[1, 3, 4, 6]].mean(axis = 0) - background > (peaks - background)/4.0
+    (rows, columns, peaks) = (rows[keep], columns[keep], peaks[keep])
+    order = np.argsort(-peaks, kind = "stable")[:4*MAX_SOURCES]
+    sources = blob_finder.suppressNeighbours(np.column_stack((columns[order], rows[order], peaks[order])),
+                                             CUTOUT_RADIUS)[:MAX_SOURCES]
+    return sources[:, [1, 0]].astype(np.intp)
+
+"""
+Measure the half-flux diameters of sources.
+Inputs: 2D image, background and (row, column) positions of the sources.
+Outputs: Array of diameters in pixels.
+"""
+def halfFluxDiameters(image, background, sources):
+    if len(sources) == 0:
+        return np.zeros(0)
+    offsets = np.arange(-CUTOUT_RADIUS, CUTOUT_RADIUS + 1)
+    # (sources, rows, columns) stack of cutouts around the peaks, background subtracted
+    cutouts = image[sources[:, 0, None, None] + offsets[None, :, None],
+                    sources[:, 1, None, None] + offsets[None, None, :]].astype(np.float64) - background
+    cutouts = np.clip(cutouts, 0.0, None)
+    total = cutouts.sum(axis = (1, 2))
+    # flux-weighted centroids within the cutouts
+    y = (cutouts.sum(axis = 2)*offsets).sum(axis = 1)/total
+    x = (cutouts.sum(axis = 1)*offsets).sum(axis = 1)/total
+    radii = np.hypot(offsets[None, :, None] - y[:, None, None], offsets[None, None, :] - x[:, None, None])
+    radii = radii.reshape(len(sources), -1)
+    # only the circle inside the cutout, so every direction counts equally
+    weights = np.where(radii <= CUTOUT_RADIUS, cutouts.reshape(len(sources), -1), 0.0)
+    order = np.argsort(radii, axis = 1)
+    radii = np.take_along_axis(radii, order, axis = 1)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis = 1), axis = 1)
+    half = cumulative[:, -1]/2.0
+    index = np.argmax(cumulative >= half[:, None], axis = 1)
+    # interpolate between the pixel radii on either side of half the flux
+    previous = np.maximum(index - 1, 0)
+    rows = np.arange(len(sources))
+    (r0, r1) = (radii[rows, previous], radii[rows, index])
+    (c0, c1) = (cumulative[rows, previous], cumulative[rows, index])
+    fraction = np.where(c1 > c0, (half - c0)/np.where(c1 > c0, c1 - c0, 1.0), 0.0)
+    return 2.0*(r0 + np.clip(fraction, 0.0, 1.0)*(r1 - r0))
+
+"""
+Measure the quality metrics of a frame (the work function of the GUI's image quality thread).
+Inputs: 2D 8-bit image and its camera time.
+Outputs: Dictionary with "camera_time" and a value for each key of METRICS (NaN for the HFD if no bright source was
+found).
+"""
+def measureFrame(image, camera_time):
+    (background, noise) = skyLevels(image)
+    sources = findSources(image, background, noise)
+    diameters = halfFluxDiameters(image, background, sources)
+    return {"camera_time": camera_time, "background": background, "noise": noise,
+            "saturation": float(100.0*np.count_nonzero(image >= SATURATION)/image.size),
+            "hfd": float(np.median(diameters)) if len(diameters) else math.nan, "sources": len(sources)}
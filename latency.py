@@ -0,0 +1,142 @@
+import collections
+import math
+import threading
+import time
+import numpy as np
+
+"""
+Latency of the images from the camera to the screen, from the camera's timestamp in each telemetry packet (the C time
+shown as GMT in the telemetry section). Each packet is stamped with the local monotonic and UTC clocks when it
+arrives, again when its image has been received, and when that image is drawn, so every frame is split into:
+- camera: local UTC arrival time minus the camera timestamp, i.e. the camera's exposure, solving and sending, the
+  network and the difference between the two clocks;
+- transfer: telemetry arrival to the end of the image's transfer;
+- display: image received to image drawn (the GUI's decoding, queueing and rendering - our pipeline).
+Only the camera stage compares the two clocks; the others use the local monotonic clock.
+
+The clocks of the camera and of this computer are not assumed to agree. The clock offset (camera to local, plus the
+fastest time the camera takes from timestamp to packet) is estimated with a running low quantile of the camera stage
+over the recent packets, which follows slow drift and steps of either clock but is not pulled down by one packet with
+a bad timestamp. Exposure-to-display latency is reported both as measured (correct if both clocks are synchronized,
+e.g. with NTP) and as the excess over the offset, which does not depend on the clocks.
+
+The pipeline is flagged as the bottleneck when the GUI's display stage takes more than a fraction of the time between
+images at its median: from there on frames queue up behind each other (and are dropped), whatever the camera does.
+"""
+
+# packets the clock offset is estimated over, and the quantile of their camera stage taken as the offset
+OFFSET_WINDOW = 120
+OFFSET_QUANTILE = 0.05
+# frames the latency distributions are kept for
+DEFAULT_HISTORY = 1000
+# the pipeline is the bottleneck once its median time per image is more than this fraction of the time between images
+BOTTLENECK_FRACTION = 0.5
+# frames received but not yet drawn that are remembered (older ones were dropped on the way to the screen)
+MAX_PENDING = 64
+# latency distributions kept for each frame
+STAGES = ("camera", "transfer", "display", "total", "excess")
+# percentiles reported for each distribution
+PERCENTILES = (50, 90, 99)
+
+"""
+Class for the latency estimator, shared by the receiving thread (which stamps arrivals) and the GUI thread (which
+stamps the drawing of each image).
+Attributes: the recent camera stages and the clock offset estimated from them, the time between images, the frames
+waiting to be drawn and the latency of each stage of the recent frames.
+Methods: received() - a telemetry packet arrived; imageReceived() - its image arrived; displayed() - the image taken
+at a camera time was drawn; statistics() - offset, time between images, latency percentiles and whether the pipeline
+is the bottleneck; histogram() - distribution of one stage.
+"""
+class LatencyEstimator:
+    def __init__(self, history = DEFAULT_HISTORY, offset_window = OFFSET_WINDOW):
+        self.lock = threading.Lock()
+        self.transits = collections.deque(maxlen = offset_window)
+        self.periods = collections.deque(maxlen = offset_window)
+        self.offset = math.nan
+        self.last_camera_time = None
+        # camera time -> [monotonic arrival, UTC arrival, monotonic end of the image transfer or None]
+        self.pending = collections.OrderedDict()
+        self.latencies = {stage: collections.deque(maxlen = history) for stage in STAGES}
+
+    """
+    Stamp the arrival of a telemetry packet.
+    Inputs: the packet's camera time (UNIX seconds).
+    Outputs: None.
+    """
+    def received(self, camera_time):
+        (monotonic, utc) = (time.monotonic(), time.time())
+        with self.lock:
+            self.transits.append(utc - camera_time)
+            self.offset = float(np.quantile(self.transits, OFFSET_QUANTILE))
+            if (self.last_camera_time is not None) and (camera_time > self.last_camera_time):
+                self.periods.append(camera_time - self.last_camera_time)
+            self.last_camera_time = camera_time
+            self.pending[camera_time] = [monotonic, utc, None]
+            while len(self.pending) > MAX_PENDING:
+                self.pending.popitem(last = False)
+
+    """ Stamp the end of the transfer of the image that follows the latest telemetry packet. """
+    def imageReceived(self):
+        monotonic = time.monotonic()
+        with self.lock:
+            if (self.last_camera_time is not None) and (self.last_camera_time in self.pending):
+                self.pending[self.last_camera_time][2] = monotonic
+
+    """
+    Stamp the drawing of an image. Only the first drawing of each image counts (not redrawing it, e.g. on zooming).
+    Inputs: the image's camera time.
+    Outputs: None.
+    """
+    def displayed(self, camera_time):
+        monotonic = time.monotonic()
+        with self.lock:
+            stamps = self.pending.pop(camera_time, None)
+            if (stamps is None) or (stamps[2] is None):
+                return
+            (received, utc, image_received) = stamps
+            camera = utc - camera_time
+            total = camera + (monotonic - received)
+            self.latencies["camera"].append(camera)
+            self.latencies["transfer"].append(image_received - received)
+            self.latencies["display"].append(monotonic - image_received)
+            self.latencies["total"].append(total)
+            self.latencies["excess"].append(total - self.offset)
+
+    """
+    Get the current estimates.
+    Inputs: self.
+    Outputs: Dictionary with "offset" (seconds), "period" (median seconds between images), "frames" (frames measured),
+    "bottleneck" (True if the pipeline is the bottleneck), "pipeline_share" (fraction of the time between images the
+    display stage takes) and, for each stage, {"p50": ..., "p90": ..., "p99": ..., "max": ...} in seconds (NaN while
+    there are no frames).
+    """
+    def statistics(self):
+        with self.lock:
+            latencies = {stage: np.array(values) for (stage, values) in self.latencies.items()}
+            periods = np.array(self.periods)
+            offset = self.offset
+        stats = {"offset": offset, "period": float(np.median(periods)) if len(periods) else math.nan,
+                 "frames": len(latencies["total"])}
+        for (stage, values) in latencies.items():
+            if len(values):
+                stats[stage] = dict(zip(["p%d" % p for p in PERCENTILES] + ["max"],
+                                        [float(value) for value in np.percentile(values, PERCENTILES)] +
+                                        [float(values.max())]))
+            else:
+                stats[stage] = dict.fromkeys(["p%d" % p for p in PERCENTILES] + ["max"], math.nan)
+        stats["pipeline_share"] = stats["display"]["p50"]/stats["period"] if stats["period"] > 0 else math.nan
+        stats["bottleneck"] = bool(stats["pipeline_share"] > BOTTLENECK_FRACTION)
+        return stats
+
+    """
+    Get the distribution of one stage.
+    Inputs: the stage (see STAGES) and the number of bins.
+    Outputs: (bin centres, counts), empty while there are no frames.
+    """
+    def histogram(self, stage, bins = 50):
+        with self.lock:
+            values = np.array(self.latencies[stage])
+        if len(values) == 0:
+            return (np.array([]), np.array([]))
+        (counts, edges) = np.histogram(values, bins = bins)
+        return ((edges[:-1] + edges[1:])/2.0, counts)
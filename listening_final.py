@@ -3,6 +3,54 @@ import time
 import socket
 import struct
 import os
+import re
+import glob
+import argparse
+import telemetry_log
+
+# telemetry and camera settings packet sent by the Star Camera before every image
+TELEMETRY_FORMAT = "dddddddddddddiiiiiiiiddiiiiiiiiiiiiiifiii"
+TELEMETRY_SIZE = struct.calcsize(TELEMETRY_FORMAT)
+# commands packet sent to the Star Camera by the GUI
+COMMAND_FORMAT = "ddddddfiiiiiiiiiifffffffff"
+COMMAND_SIZE = struct.calcsize(COMMAND_FORMAT)
+# names of the fields of the commands packet, in order (see packCommands() and GUI.collectCommands())
+COMMAND_FIELDS = ("logodds", "latitude", "longitude", "height", "exposure", "timelimit", "set_focus_to_amount", 
+                  "auto_focus", "start_focus", "end_focus", "focus_step", "photos_per_focus", "infinity_focus", 
+                  "set_aperture_steps", "max_aperture", "make_HP", "use_HP", "spike_limit", "dynamic_hot_pixels", 
+                  "r_smooth", "high_pass_filter", "r_high_pass_filter", "centroid_search_border", 
+                  "filter_return_image", "n_sigma", "unique_star_spacing")
+# image dimensions in pixels (one byte per pixel)
+IMAGE_WIDTH = 1936
+IMAGE_HEIGHT = 1216
+IMAGE_SIZE = IMAGE_WIDTH*IMAGE_HEIGHT
+# set to False to stop printing a line for every packet received (e.g. when running headless)
+verbose = True
+# formats the telemetry is backed up in: the data.txt text file and/or the indexed columnar log (see telemetry_log)
+backup_text = True
+backup_columnar = True
+# writer for the columnar log, opened on the first backup, and whether it is leaving out packets whose camera time
+# went backwards (reported once per run of them)
+telemetry_log_writer = None
+columnar_out_of_order = False
+# metrics.Metrics object the receive functions count into (set by the GUI), or None
+metrics = None
+# options of the socket to the camera (see configureSocket()): receive buffer in bytes (None keeps the system
+# default), whether to tune it automatically instead (see ReceiveBufferTuner), sending commands without Nagle's delay,
+# seconds of silence before keepalive probes check the camera is still there (None to turn them off) and seconds
+# unacknowledged data may wait before the connection counts as lost (Linux only, None for the system default)
+receive_buffer_size = None
+autotune_receive_buffer = False
+tcp_nodelay = True
+keepalive_idle = 10
+user_timeout = 30
+# tuner of the current connection's receive buffer, if autotuning
+receive_buffer_tuner = None
+# columns of data.txt read by loadBackupFile() (all but the GMT string, which gmtStrings() derives from the C time)
+BACKUP_COLUMNS = (0, 2, 3, 4, 5, 6, 7, 8)
+BACKUP_DTYPE = np.dtype([(name, "<f8") for name in telemetry_log.COLUMNS])
+# sidecar cache of a loaded backup file, named after the size and modification time of the file it was loaded from
+BACKUP_CACHE_PATTERN = re.compile(r"\.\d+-\d+\.npy$")
 
 """ 
 Creates and writs information header to the Star Camera data file if it does not already exist. If it does,
@@ -11,6 +59,8 @@ Inputs: None.
 Outputs: None. Writes information to the file and closes file.
 """
 def prepareBackupFile():
+    if not backup_text:
+        return
     script_dir = os.path.dirname(os.path.realpath(__file__))
     try:
         data_file = open(script_dir + os.path.sep + "data.txt", "x")
@@ -26,16 +76,34 @@ Inputs: Raw, unpacked Star Camera data.
 Outputs: None. Writes information to file and closes.
 """
 def backupStarCamData(StarCam_data):
+    global telemetry_log_writer, backup_columnar, columnar_out_of_order
     script_dir = os.path.dirname(os.path.realpath(__file__))
-    # write this data to a .txt file (always updating)
-    data_file = open(script_dir + os.path.sep + "data.txt", "a+")
-    unpacked_data = struct.unpack_from("dddddddddddddiiiiiiiiddiiiiiiiiiiiiiifiii", StarCam_data)
-    text = ["%s," % str(unpacked_data[1]), "%s," % str(time.asctime(time.gmtime(unpacked_data[1]))), 
-            "%s," % str(unpacked_data[6]), "%s," % str(unpacked_data[7]), "%s," % str(unpacked_data[8]), 
-            "%s," % str(unpacked_data[9]), "%s," % str(unpacked_data[10]), "%s," % str(unpacked_data[11]),
-            "%s\n" % str(unpacked_data[12])]
-    data_file.writelines(text)
-    data_file.close()
+    unpacked_data = struct.unpack_from(TELEMETRY_FORMAT, StarCam_data)
+    if backup_text:
+        # write this data to a .txt file (always updating)
+        data_file = open(script_dir + os.path.sep + "data.txt", "a+")
+        text = ["%s," % str(unpacked_data[1]), "%s," % str(time.asctime(time.gmtime(unpacked_data[1]))), 
+                "%s," % str(unpacked_data[6]), "%s," % str(unpacked_data[7]), "%s," % str(unpacked_data[8]), 
+                "%s," % str(unpacked_data[9]), "%s," % str(unpacked_data[10]), "%s," % str(unpacked_data[11]),
+                "%s\n" % str(unpacked_data[12])]
+        data_file.writelines(text)
+        data_file.close()
+    if backup_columnar:
+        if telemetry_log_writer is None:
+            telemetry_log_writer = telemetry_log.TelemetryLogWriter(script_dir + os.path.sep + "telemetry_log")
+        # same columns as data.txt, in the order of telemetry_log.COLUMNS
+        try:
+            left_out = telemetry_log_writer.append((unpacked_data[1],) + unpacked_data[6:13])
+            if left_out and not columnar_out_of_order:
+                print("The camera time went back to %s: leaving packets out of the columnar telemetry log until it " 
+                      "passes the last one logged." % unpacked_data[1])
+            columnar_out_of_order = bool(left_out)
+        except telemetry_log.LogLockedError as error:
+            # another process already logs this camera (e.g. the relay this GUI is connected through)
+            print("Not writing the columnar telemetry log: %s. Backing up to data.txt only." % error)
+            telemetry_log_writer.close()
+            telemetry_log_writer = None
+            backup_columnar = False
 
 """
 Create a socket with the Star Camera server on which to receive telemetry and send commands.
@@ -47,10 +115,144 @@ def establishStarCamSocket(StarCam_IP, user_port):
     server_addr = (StarCam_IP, user_port)
     # TCP socket
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    configureSocket(s)
     s.connect(server_addr)
     print("Connected to %s" % repr(server_addr))
     return (s, StarCam_IP, user_port)
 
+"""
+Pack commands into the commands packet.
+Inputs: dictionary with a value for each name in COMMAND_FIELDS.
+Outputs: COMMAND_SIZE bytes.
+"""
+def packCommands(commands):
+    return struct.pack(COMMAND_FORMAT, *(commands[name] for name in COMMAND_FIELDS))
+
+"""
+Apply the module's socket options to a new camera socket, before it connects (the receive buffer size at connection
+time sets the largest TCP window the connection can use).
+Inputs: the socket.
+Outputs: None.
+"""
+def configureSocket(s):
+    global receive_buffer_tuner
+    buffer_size = receive_buffer_size
+    if autotune_receive_buffer:
+        receive_buffer_tuner = ReceiveBufferTuner()
+        # connect with the largest size tried, so the window can grow to any of them
+        buffer_size = ReceiveBufferTuner.SIZES[-1]
+    if buffer_size is not None:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    if tcp_nodelay:
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if keepalive_idle is not None:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle = max(int(keepalive_idle), 1)
+        interval = max(idle//3, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        elif hasattr(socket, "TCP_KEEPALIVE"):
+            # macOS
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        elif hasattr(socket, "SIO_KEEPALIVE_VALS"):
+            # Windows
+            s.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 1000*idle, 1000*interval))
+    if (user_timeout is not None) and hasattr(socket, "TCP_USER_TIMEOUT"):
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(1000*user_timeout))
+
+"""
+Class for tuning the receive buffer of a connection from the throughput it achieves: each size in SIZES is used for a
+few images, then the smallest size within a few percent of the best throughput is kept. A larger buffer lets more
+data be in flight on a link with a long round trip (up to the bandwidth-delay product), but past that only uses memory.
+Attributes: the size being tried, the image throughputs measured with each size, and the chosen size once done.
+Methods: frameReceived() - record the transfer of one image and move on to the next size when it is time.
+"""
+class ReceiveBufferTuner:
+    # receive buffer sizes tried, in bytes
+    SIZES = (128*1024, 256*1024, 512*1024, 1024*1024, 2*1024*1024, 4*1024*1024, 8*1024*1024)
+
+    def __init__(self, frames_per_size = 5, tolerance = 0.05):
+        self.frames_per_size = frames_per_size
+        self.tolerance = tolerance
+        self.index = None
+        self.throughputs = {size: [] for size in self.SIZES}
+        self.chosen = None
+        # images to leave out after changing size, since they were partly received with the previous one
+        self.skip = 0
+
+    """
+    Record the transfer of one image.
+    Inputs: the socket, the bytes received and the seconds the transfer took.
+    Outputs: None. Changes the socket's receive buffer size as the tuning goes on.
+    """
+    def frameReceived(self, s, n_bytes, seconds):
+        if self.chosen is not None:
+            return
+        if self.index is None:
+            self.setSize(s, 0)
+            return
+        if self.skip > 0:
+            self.skip -= 1
+            return
+        size = self.SIZES[self.index]
+        self.throughputs[size].append(n_bytes/max(seconds, 1e-9))
+        if len(self.throughputs[size]) < self.frames_per_size:
+            return
+        if self.index + 1 < len(self.SIZES):
+            self.setSize(s, self.index + 1)
+            return
+        medians = {size: float(np.median(values)) for (size, values) in self.throughputs.items()}
+        best = max(medians.values())
+        self.chosen = min(size for (size, throughput) in medians.items() if throughput >= (1 - self.tolerance)*best)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.chosen)
+        print("Receive buffer tuned to %d KB (%.1f MB/s)" % (self.chosen//1024, medians[self.chosen]/1e6))
+
+    def setSize(self, s, index):
+        self.index = index
+        self.skip = 1
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SIZES[index])
+
+"""
+Parse the receive buffer size given on the command line: "auto" to tune it, or a size in kilobytes.
+Inputs: the text.
+Outputs: "auto" or the size in bytes.
+"""
+def parseReceiveBuffer(text):
+    if text == "auto":
+        return text
+    try:
+        return 1024*int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid receive buffer size: %s (use kilobytes or auto)" % text)
+
+"""
+Set the receive buffer options from a value returned by parseReceiveBuffer() (or None for the system default).
+"""
+def setReceiveBuffer(value):
+    global receive_buffer_size, autotune_receive_buffer
+    autotune_receive_buffer = value == "auto"
+    receive_buffer_size = None if value in (None, "auto") else value
+
+"""
+Receive an exact number of bytes from the camera, since TCP may split a packet across several reads.
+Inputs: The socket to communicate with the camera, the number of bytes and optionally a writable buffer of at least
+that size to receive into (avoids allocating a new buffer for every image).
+Outputs: The received bytes (the buffer itself if one was given), or None if the camera closed the connection.
+"""
+def receiveExactly(client_socket, n, buffer = None):
+    if buffer is None:
+        buffer = bytearray(n)
+    view = memoryview(buffer)[:n]
+    received = 0
+    while received < n:
+        count = client_socket.recv_into(view[received:], n - received)
+        if not count:
+            return None
+        received += count
+    return buffer
+
 """
 Receive telemetry and camera settings from Star Camera.
 Inputs: The socket to communicate with the camera.
@@ -59,29 +261,153 @@ Outputs: Raw, unpacked Star Camera data.
 def getStarCamData(client_socket):
     # number of expected bytes is hard-coded
     try: 
-        (StarCam_data, _) = client_socket.recvfrom(224)   
+        StarCam_data = receiveExactly(client_socket, TELEMETRY_SIZE)
+        if StarCam_data is None:
+            return None
+        StarCam_data = bytes(StarCam_data)
+        backup_start = time.perf_counter()
         backupStarCamData(StarCam_data)
-        print("Received Star Camera data.")
+        if metrics is not None:
+            metrics.observe("backup", time.perf_counter() - backup_start)
+            metrics.add(telemetry_received = 1, bytes_received = TELEMETRY_SIZE)
+        if verbose:
+            print("Received Star Camera data.")
         return StarCam_data
-    except ConnectionResetError:
+    except (ConnectionResetError, TimeoutError):
+        # reset by the camera, or lost (keepalive probes or sent data unanswered for too long)
         return None
     except struct.error:
         return None
 
 """
 Receive image bytes from camera.
-Inputs: The socket to communicate with the camera.
+Inputs: The socket to communicate with the camera and optionally a bytearray of IMAGE_SIZE bytes to reuse.
 Outputs: Raw image bytes.
 """
-def getStarCamImage(client_socket):
-    image_bytes = bytearray()
-    # image dimensions
-    n = 1936*1216
-    while (len(image_bytes) < n):
-        packet = client_socket.recv(n - len(image_bytes)) 
-        if not packet:
-            return None
-        image_bytes.extend(packet)
-    print("Received Star Camera image bytes. Total number is bytes is:", 
-          len(image_bytes))
-    return image_bytes
\ No newline at end of file
+def getStarCamImage(client_socket, image_buffer = None):
+    # the image follows its telemetry packet straight away, so this is close to the time the transfer takes
+    receive_start = time.perf_counter()
+    try:
+        image_bytes = receiveExactly(client_socket, IMAGE_SIZE, image_buffer)
+    except (ConnectionResetError, TimeoutError):
+        return None
+    if image_bytes is None:
+        return None
+    receive_seconds = time.perf_counter() - receive_start
+    if receive_buffer_tuner is not None:
+        receive_buffer_tuner.frameReceived(client_socket, IMAGE_SIZE, receive_seconds)
+    if metrics is not None:
+        metrics.observe("receive", receive_seconds)
+        metrics.add(frames_received = 1, bytes_received = IMAGE_SIZE)
+    if verbose:
+        print("Received Star Camera image bytes. Total number is bytes is:", len(image_bytes))
+    return image_bytes
+
+"""
+Parse one line of a data.txt backup file.
+Inputs: the line.
+Outputs: List of the values of the columns of telemetry_log.COLUMNS, or None if the line is not a complete row (e.g. 
+the header, or a line cut short by a crash).
+"""
+def parseBackupLine(line):
+    fields = line.split(",")
+    if len(fields) != 9:
+        return None
+    try:
+        return [float(fields[i]) for i in BACKUP_COLUMNS]
+    except ValueError:
+        return None
+
+"""
+Read a data.txt backup file in chunks with NumPy's delimited-text parser, leaving out the GMT string column.
+Inputs: path of the file, the number of rows to read at a time, the byte offsets of the part of the file to read (at
+the start of a line; by default all of it, and only whole lines up to the end are read) and a function called with 
+the bytes read and the total after each chunk (None for no progress).
+Outputs: Generator of (rows, 8) float64 arrays with the columns of telemetry_log.COLUMNS, in file order. The header
+and any line that is not a complete row (e.g. one cut short by a crash) are skipped.
+"""
+def iterBackupChunks(data_path, chunk_rows = 65536, start = 0, end = None, progress = None):
+    end = os.path.getsize(data_path) if end is None else end
+    # line endings are kept as they are, so the lengths of the lines are their sizes in the (ASCII) file
+    with open(data_path, newline = "") as data_file:
+        data_file.seek(start)
+        # skip the header here, so the first chunk can take the fast path too
+        first_line = data_file.readline() if start < end else ""
+        position = start + len(first_line)
+        pending = [first_line] if (position <= end) and (parseBackupLine(first_line) is not None) else []
+        while True:
+            lines = data_file.readlines(chunk_rows*96) if position < end else []
+            # leave out the lines past the end
+            sizes = np.cumsum([len(line) for line in lines])
+            n_lines = int(np.searchsorted(sizes, end - position, side = "right"))
+            position += int(sizes[n_lines - 1]) if n_lines else 0
+            lines = pending + lines[:n_lines]
+            pending = []
+            if not lines:
+                return
+            if progress is not None:
+                progress(position - start, end - start)
+            try:
+                yield np.loadtxt(lines, delimiter = ",", usecols = BACKUP_COLUMNS, comments = None, quotechar = None,
+                                 ndmin = 2)
+            except ValueError:
+                # slow path for a chunk with a damaged row
+                rows = [row for row in map(parseBackupLine, lines) if row is not None]
+                yield np.array(rows, dtype = np.float64).reshape(-1, len(BACKUP_COLUMNS))
+
+"""
+Load a data.txt backup file into a structured array.
+Inputs: path of the file, whether to use a .npy sidecar cache next to it (<file>.<size>-<mtime>.npy, written on the
+first load and reused until the file changes) and the number of rows to parse at a time.
+Outputs: Structured array with a float64 field per column of telemetry_log.COLUMNS (ctime, ra, dec, fr, ps, ir, alt,
+az), in file order.
+"""
+def loadBackupFile(data_path, cache = False, chunk_rows = 65536):
+    status = os.stat(data_path)
+    cache_path = "%s.%d-%d.npy" % (data_path, status.st_size, status.st_mtime_ns)
+    if cache and os.path.exists(cache_path):
+        return np.load(cache_path)
+    chunks = list(iterBackupChunks(data_path, chunk_rows))
+    values = np.concatenate(chunks) if chunks else np.empty((0, len(BACKUP_COLUMNS)))
+    table = np.ascontiguousarray(values, dtype = "<f8").view(BACKUP_DTYPE)[:, 0]
+    if cache:
+        # replace the caches of earlier versions of the file
+        for old_path in glob.glob(glob.escape(data_path) + ".*.npy"):
+            if BACKUP_CACHE_PATTERN.search(old_path[len(data_path):]):
+                os.remove(old_path)
+        try:
+            with open(cache_path + ".part", "wb") as cache_file:
+                np.save(cache_file, table)
+            os.replace(cache_path + ".part", cache_path)
+        except OSError as error:
+            print("Could not write the cache %s: %s" % (cache_path, error))
+    return table
+
+"""
+Derive the GMT strings of data.txt from C times, for the rows that need them.
+Inputs: array of C times.
+Outputs: List of strings as written by backupStarCamData() (e.g. "Sat Feb  1 02:00:00 2020").
+"""
+def gmtStrings(ctime):
+    return [time.asctime(time.gmtime(t)) for t in np.atleast_1d(ctime)]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Load a Star Camera data.txt backup file into a NumPy array")
+    parser.add_argument("data_file", nargs = "?", 
+                        default = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data.txt"),
+                        help = "backup file to load (default: data.txt next to this script)")
+    parser.add_argument("--cache", action = "store_true", 
+                        help = "reuse a .npy cache of the file if it has not changed since, or write one")
+    parser.add_argument("--output", help = "save the structured array to this .npy file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    table = loadBackupFile(args.data_file, args.cache)
+    print("Loaded %d rows in %.2f seconds" % (len(table), time.perf_counter() - start))
+    if len(table):
+        print("From %s to %s (GMT)" % tuple(gmtStrings([table["ctime"].min(), table["ctime"].max()])))
+    if args.output is not None:
+        np.save(args.output, table)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
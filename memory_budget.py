@@ -0,0 +1,80 @@
+import threading
+
+"""
+Process-wide memory budget of the GUI, so a night-long session stays flat in memory instead of growing until the
+computer swaps. One total is configured at start-up and split between the components that grow with time:
+- telemetry: the telemetry history kept for the graphs, which is decimated (older points thinned out, recent ones
+  kept at full resolution) when it outgrows its share;
+- frames: the in-memory frame cache (frame_cache.FrameCache), whose byte budget is set to its share, so it evicts
+  (spills to disk) the least recently used frames;
+- queues: images received but still waiting in the Qt signal queue for the GUI thread, which are dropped on arrival
+  while their share is used up.
+"""
+
+# default total in megabytes
+DEFAULT_BUDGET_MB = 256
+# fraction of the total given to each component
+SHARES = {"telemetry": 0.25, "frames": 0.5, "queues": 0.25}
+# approximate bytes used by each float kept in a Python list (the float object and the list's pointer to it)
+BYTES_PER_VALUE = 32
+
+"""
+Thin out the older half of some lists of the same length, keeping every second point, so repeated calls leave the
+history at decreasing resolution further back in time and the most recent points untouched.
+Inputs: list of lists of equal length (changed in place).
+Outputs: Number of points removed from each list.
+"""
+def decimateLists(lists):
+    length = len(lists[0])
+    half = length//2
+    for values in lists:
+        values[:half] = values[:half:2]
+    return length - len(lists[0])
+
+"""
+Class for the memory budget.
+Attributes: the total, the limit and the current use of each component, and the count of images waiting in the
+signal queue and of those dropped.
+Methods: limit() - bytes allowed for a component; setUsage() - record what a component uses; usage() - use and limit
+of every component; queueFrame() - ask to queue an image (False if it has to be dropped); frameDequeued() - an image
+left the queue.
+"""
+class MemoryBudget:
+    def __init__(self, total_bytes = DEFAULT_BUDGET_MB*1024*1024, shares = SHARES):
+        self.total_bytes = total_bytes
+        self.limits = {name: int(share*total_bytes) for (name, share) in shares.items()}
+        self.used = dict.fromkeys(shares, 0)
+        self.lock = threading.Lock()
+        self.queued_frames = 0
+        self.frame_bytes = 0
+        self.dropped_frames = 0
+
+    def limit(self, name):
+        return self.limits[name]
+
+    def setUsage(self, name, used_bytes):
+        self.used[name] = used_bytes
+
+    def usage(self):
+        with self.lock:
+            self.used["queues"] = self.queued_frames*self.frame_bytes
+        return {name: (self.used[name], self.limits[name]) for name in self.limits}
+
+    """
+    Ask to queue an image for the GUI thread (called by the receiving thread).
+    Inputs: size of the image in bytes.
+    Outputs: True if it fits in the queues' share and was counted as queued, False if it should be dropped.
+    """
+    def queueFrame(self, frame_bytes):
+        with self.lock:
+            self.frame_bytes = frame_bytes
+            # always let one image through, so a budget smaller than an image does not stop the display
+            if (self.queued_frames > 0) and ((self.queued_frames + 1)*frame_bytes > self.limits["queues"]):
+                self.dropped_frames += 1
+                return False
+            self.queued_frames += 1
+            return True
+
+    def frameDequeued(self):
+        with self.lock:
+            self.queued_frames = max(self.queued_frames - 1, 0)
@@ -0,0 +1,191 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+"""
+Health metrics of a running GUI, for watching it from a monitoring computer: counters of what was received and
+shown, latency histograms of the receive -> decode -> render path and of the backup writes, queue depths, dropped
+frames and the memory used by the process. The receive functions in listening_final.py and the GUI's display slots
+count into a Metrics object (a few microseconds per packet); an optional local HTTP server (TCP on localhost or a
+Unix domain socket) serves them in the Prometheus text format at /metrics and as JSON at /metrics.json, e.g.
+
+    curl localhost:9108/metrics
+    curl --unix-socket /tmp/starcam_metrics.sock localhost/metrics.json
+"""
+
+# counters: name -> help text (served as starcam_<name>_total)
+COUNTERS = {"telemetry_received": "Telemetry packets received from the camera",
+            "frames_received": "Images received from the camera",
+            "bytes_received": "Bytes received from the camera",
+            "telemetry_handled": "Telemetry packets handled by the GUI",
+            "frames_handled": "Images decoded by the GUI",
+            "frames_discarded": "Images dropped before reaching the GUI to stay within the memory budget",
+            "frames_displayed": "Images drawn in the Images tab"}
+# latency histograms: name -> help text (served as starcam_<name>_seconds)
+HISTOGRAMS = {"receive": "Time to read an image off the socket",
+              "decode": "Time to decode a received image in the GUI",
+              "render": "Time to draw an image in the Images tab",
+              "backup": "Time to write a telemetry packet to the backups (backup-write lag)"}
+# upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# rates are taken over about this many seconds of the most recent requests
+RATE_WINDOW = 10.0
+
+"""
+Resident memory of this process.
+Inputs: None.
+Outputs: Bytes, or None if the platform does not say (the peak is used where only that is available).
+"""
+def residentBytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else 1024*peak
+
+"""
+Class for a latency histogram with cumulative buckets, as in Prometheus.
+"""
+class Histogram:
+    def __init__(self, bounds = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # (upper bound, observations up to it) pairs, ending with infinity
+    def cumulative(self):
+        totals = []
+        total = 0
+        for (bound, count) in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            totals.append((bound, total))
+        return totals
+
+"""
+Class holding the metrics of a GUI session, shared by the receiving thread, the GUI thread and the metrics server.
+Attributes: the counters, histograms and gauges, and a lock guarding them.
+Methods: add() - increment counters; observe() - add a latency to a histogram; addGauge() - register a function
+reporting a current value; snapshot() - dictionary of all metrics and the recent rates; prometheusText() - the same
+in the Prometheus text format.
+"""
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {name: Histogram() for name in HISTOGRAMS}
+        self.gauges = collections.OrderedDict()
+        # (time, counters) at recent requests, for the rates
+        self.history = collections.deque([(self.start_time, dict(self.counters))])
+        self.addGauge("telemetry_queue_depth", "Telemetry packets received but not yet handled by the GUI",
+                      lambda: self.counters["telemetry_received"] - self.counters["telemetry_handled"])
+        self.addGauge("frame_queue_depth", "Images received but not yet decoded by the GUI",
+                      lambda: self.counters["frames_received"] - self.counters["frames_handled"] - 
+                              self.counters["frames_discarded"])
+        self.addGauge("resident_bytes", "Resident memory of the process", residentBytes)
+
+    def add(self, **increments):
+        with self.lock:
+            for (name, value) in increments.items():
+                self.counters[name] += value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms[name].observe(seconds)
+
+    """
+    Register a value that is read when the metrics are requested.
+    Inputs: name, help text, a function returning the current value (or None if unknown) and the Prometheus type
+    ("gauge", or "counter" for totals kept elsewhere). The function is called from the metrics server's thread, so it
+    should only read simple attributes.
+    Outputs: None.
+    """
+    def addGauge(self, name, help_text, function, kind = "gauge"):
+        self.gauges[name] = (help_text, function, kind)
+
+    """
+    Get all metrics.
+    Inputs: self.
+    Outputs: Dictionary of the counters, gauges, per-second rates (over the last RATE_WINDOW seconds of requests)
+    and histograms ({"buckets": [[upper bound, cumulative count], ...], "sum": seconds, "count": observations}).
+    """
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: {"buckets": [list(bucket) for bucket in histogram.cumulative()],
+                                 "sum": histogram.sum, "count": histogram.count}
+                          for (name, histogram) in self.histograms.items()}
+            self.history.append((now, counters))
+            while (len(self.history) > 2) and (self.history[1][0] <= now - RATE_WINDOW):
+                self.history.popleft()
+            (previous_time, previous_counters) = self.history[0]
+        interval = max(now - previous_time, 1e-9)
+        stats = {"time": now, "uptime": now - self.start_time}
+        stats.update(counters)
+        stats["frames_per_second"] = (counters["frames_received"] - previous_counters["frames_received"])/interval
+        stats["telemetry_per_second"] = (counters["telemetry_received"] -
+                                         previous_counters["telemetry_received"])/interval
+        stats["bytes_per_second"] = (counters["bytes_received"] - previous_counters["bytes_received"])/interval
+        for (name, (_, function, _)) in self.gauges.items():
+            stats[name] = function()
+        stats["latency"] = histograms
+        return stats
+
+    def prometheusText(self):
+        stats = self.snapshot()
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP starcam_%s %s" % (name, help_text))
+            lines.append("# TYPE starcam_%s %s" % (name, kind))
+            for (suffix, value) in samples:
+                lines.append("starcam_%s%s %s" % (name, suffix, repr(float(value))))
+        for (name, help_text) in COUNTERS.items():
+            metric(name + "_total", "counter", help_text, [("", stats[name])])
+        for name in ("frames_per_second", "telemetry_per_second", "bytes_per_second"):
+            metric(name, "gauge", name.replace("_", " ").capitalize() + " over the last %g seconds" % RATE_WINDOW,
+                   [("", stats[name])])
+        for (name, (help_text, _, kind)) in self.gauges.items():
+            if stats[name] is not None:
+                metric(name, kind, help_text, [("", stats[name])])
+        for (name, help_text) in HISTOGRAMS.items():
+            histogram = stats["latency"][name]
+            samples = [('_bucket{le="%s"}' % ("+Inf" if bound == float("inf") else repr(bound)), count)
+                       for (bound, count) in histogram["buckets"]]
+            samples += [("_sum", histogram["sum"]), ("_count", histogram["count"])]
+            metric(name + "_seconds", "histogram", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+"""
+Start serving metrics in a background thread.
+Inputs: the Metrics object, and a localhost TCP port or a Unix domain socket path.
+Outputs: The server (call shutdown() and server_close() to stop it). Raises OSError if it cannot listen.
+"""
+def startServer(metrics, port = None, socket_path = None):
+    # http.server is slow to import, so it is only imported when metrics are served
+    import metrics_server
+    if port is not None:
+        server = metrics_server.TCPMetricsServer(("127.0.0.1", port), metrics_server.MetricsRequestHandler)
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = metrics_server.UnixMetricsServer(socket_path, metrics_server.MetricsRequestHandler)
+    server.metrics = metrics
+    threading.Thread(target = server.serve_forever, name = "metrics server", daemon = True).start()
+    return server
@@ -0,0 +1,45 @@
+import http.server
+import json
+import socketserver
+
+"""
+HTTP server for the health metrics of metrics.py, kept apart so the GUI only imports http.server when it serves them
+(see metrics.startServer()).
+"""
+
+"""
+Class answering requests to the metrics server: /metrics in the Prometheus text format, /metrics.json as JSON.
+"""
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in ("/", "/metrics"):
+            (body, content_type) = (self.server.metrics.prometheusText(), "text/plain; version=0.0.4")
+        elif path == "/metrics.json":
+            (body, content_type) = (json.dumps(self.server.metrics.snapshot()), "application/json")
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # no line on the console for every request
+    def log_message(self, *args):
+        pass
+
+class TCPMetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        # HTTP handlers expect a (host, port) client address, which Unix domain sockets do not have
+        def get_request(self):
+            (request, _) = super(UnixMetricsServer, self).get_request()
+            return (request, ("localhost", 0))
@@ -0,0 +1,150 @@
+import argparse
+import csv
+import glob
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import blob_finder
+
+"""
+Offline sweep of blob-finding settings over recorded frames (e.g. the .npy files written by headless.py --record-dir),
+so spike_limit, n_sigma, the smoothing and high-pass radii etc. can be chosen without commanding the live camera.
+The frames are loaded once into a shared memory block that the worker processes map read-only; each task sends just
+a dictionary of settings and gets back the star count of every frame and the time taken, so nothing image-sized is
+pickled between processes.
+"""
+
+# the parameters that can be swept, in the order of the commands packet (see listening_final.COMMAND_FIELDS), with the
+# type of their values
+SWEEP_PARAMETERS = (("spike_limit", float), ("dynamic_hot_pixels", int), ("r_smooth", float),
+                    ("high_pass_filter", int), ("r_high_pass_filter", float), ("centroid_search_border", float),
+                    ("n_sigma", float), ("unique_star_spacing", float))
+
+# frames seen by a worker process, set up by attachFrames()
+worker_shm = None
+worker_frames = None
+
+"""
+Find the recorded frames to sweep over.
+Inputs: list of .npy files and/or directories of them.
+Outputs: Sorted list of file paths.
+"""
+def findFrameFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "*.npy")))
+        else:
+            files.append(path)
+    return sorted(files)
+
+"""
+Load the frames into a new shared memory block.
+Inputs: list of .npy file paths (all frames must have the same shape).
+Outputs: (shared memory block, shape of the frame stack).
+"""
+def loadFrames(files):
+    first = np.load(files[0], mmap_mode = "r")
+    shape = (len(files),) + first.shape
+    shm = shared_memory.SharedMemory(create = True, size = max(int(np.prod(shape)), 1))
+    frames = np.ndarray(shape, dtype = np.uint8, buffer = shm.buf)
+    for (i, path) in enumerate(files):
+        frame = np.load(path, mmap_mode = "r")
+        if frame.shape != first.shape:
+            del frames
+            shm.close()
+            shm.unlink()
+            raise ValueError("%s has shape %s, expected %s" % (path, frame.shape, first.shape))
+        frames[i] = frame
+    del frames
+    return (shm, shape)
+
+"""
+Worker process initializer: map the shared frame stack read-only.
+Inputs: name of the shared memory block and the shape of the frame stack.
+Outputs: None.
+"""
+def attachFrames(name, shape):
+    global worker_shm, worker_frames
+    # the workers are children of the creator and share its resource tracker, so they must not unregister the block
+    worker_shm = shared_memory.SharedMemory(name = name)
+    worker_frames = np.ndarray(shape, dtype = np.uint8, buffer = worker_shm.buf)
+    worker_frames.flags.writeable = False
+
+"""
+Run the blob finder with one combination of settings on every frame (in a worker process).
+Inputs: dictionary of blob-finding parameters.
+Outputs: (the parameters, number of stars found in each frame, seconds per frame).
+"""
+def evaluateSetting(parameters):
+    counts = np.zeros(len(worker_frames), dtype = np.int64)
+    start = time.perf_counter()
+    for (i, frame) in enumerate(worker_frames):
+        counts[i] = len(blob_finder.findBlobs(frame, parameters))
+    return (parameters, counts, (time.perf_counter() - start)/len(worker_frames))
+
+"""
+Build the grid of settings to try.
+Inputs: dictionary of parameter name to the list of values to try (parameters not given keep their default).
+Outputs: List of parameter dictionaries, one per combination.
+"""
+def parameterGrid(values):
+    names = [name for (name, _) in SWEEP_PARAMETERS if name in values]
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+"""
+Evaluate every combination of settings over the frames.
+Inputs: list of .npy file paths, the grid of parameter dictionaries and the number of worker processes (None for one
+per core).
+Outputs: List of (parameters, star counts per frame, seconds per frame), in the order of the grid.
+"""
+def sweep(files, grid, workers = None):
+    (shm, shape) = loadFrames(files)
+    try:
+        with ProcessPoolExecutor(max_workers = workers, initializer = attachFrames,
+                                 initargs = (shm.name, shape)) as executor:
+            return list(executor.map(evaluateSetting, grid))
+    finally:
+        shm.close()
+        shm.unlink()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Sweep blob-finding settings over recorded Star Camera frames")
+    parser.add_argument("frames", nargs = "+", help = ".npy frame files or directories of them")
+    for (name, value_type) in SWEEP_PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), dest = name, type = value_type, nargs = "+",
+                            help = "values of %s to try (default %s)" % (name, blob_finder.DEFAULT_PARAMETERS[name]))
+    parser.add_argument("--workers", type = int, help = "number of worker processes (default: one per core)")
+    parser.add_argument("--csv", help = "also write the results to this CSV file")
+    args = parser.parse_args(argv)
+
+    files = findFrameFiles(args.frames)
+    if not files:
+        parser.error("no frames found")
+    values = {name: getattr(args, name) for (name, _) in SWEEP_PARAMETERS if getattr(args, name) is not None}
+    grid = parameterGrid(values)
+    print("Evaluating %d settings on %d frames..." % (len(grid), len(files)), file = sys.stderr)
+    start = time.perf_counter()
+    results = sweep(files, grid, args.workers)
+    print("Done in %.1f s" % (time.perf_counter() - start), file = sys.stderr)
+
+    names = [name for (name, _) in SWEEP_PARAMETERS if name in values]
+    header = names + ["mean_stars", "min_stars", "max_stars", "ms_per_frame"]
+    rows = [[parameters[name] for name in names] +
+            ["%.1f" % counts.mean(), int(counts.min()), int(counts.max()), "%.1f" % (1000*seconds)]
+            for (parameters, counts, seconds) in results]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(cell).rjust(width) for (cell, width) in zip(row, widths)))
+    if args.csv is not None:
+        with open(args.csv, "w", newline = "") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
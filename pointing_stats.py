@@ -0,0 +1,175 @@
+import collections
+import math
+import numpy as np
+
+"""
+Rolling pointing-stability statistics for the telemetry channels, updated in constant time per packet so the GUI never
+re-scans the history: mean, standard deviation, minimum and maximum, the linear drift rate (least-squares slope
+against time) and the Allan deviation at a few averaging times, all over the most recent packets.
+
+Sums are kept relative to a reference sample near the start of the window (and angles that wrap, like RA, are
+unwrapped against it), so the small jitter of a large angle is not lost to rounding. Once per window length the
+reference is moved to the oldest sample and the sums are recomputed, so rounding errors cannot build up and a channel
+that keeps moving (e.g. AZ while slewing) stays unwrapped; that costs one pass over the window per window of updates,
+so still constant time per packet on average.
+"""
+
+# number of packets in the rolling window by default
+DEFAULT_WINDOW = 200
+# averaging times of the Allan deviation, in packets
+ALLAN_TAUS = (1, 2, 4, 8)
+
+"""
+Class for the rolling statistics of one channel.
+Attributes: the window of (time, value) samples, running sums over it, monotonic queues for the minimum and maximum,
+and the Allan deviation accumulators.
+Methods: add() - add a sample (dropping the oldest once the window is full); statistics() - the current statistics.
+"""
+class RollingStatistics:
+    def __init__(self, window = DEFAULT_WINDOW, wrap = None, taus = ALLAN_TAUS):
+        self.window = window
+        # (lowest value, period) of angles that wrap around, or None
+        (self.lowest, self.wrap) = wrap if wrap is not None else (None, None)
+        self.samples = collections.deque()
+        self.reference = None
+        self.sums = np.zeros(6)
+        self.updates = 0
+        self.index = 0
+        # (index, value) pairs with increasing values (for the minimum) and decreasing values (for the maximum)
+        self.minima = collections.deque()
+        self.maxima = collections.deque()
+        # per tau: the block being averaged, the last complete block mean and a window of squared differences
+        self.allan = {tau: {"block": [], "previous": None, "squares": collections.deque(), "sum": 0.0}
+                      for tau in taus}
+
+    """
+    Add one sample.
+    Inputs: time in seconds and value.
+    Outputs: None.
+    """
+    def add(self, t, value):
+        if self.reference is None:
+            self.reference = (t, value)
+        t = t - self.reference[0]
+        x = value - self.reference[1]
+        if self.wrap is not None:
+            # unwrap against the reference, e.g. RA 359.9 next to 0.1
+            x = (x + self.wrap/2.0) % self.wrap - self.wrap/2.0
+        self.samples.append((t, x))
+        self.sums += (1.0, t, x, t*t, x*x, t*x)
+        if len(self.samples) > self.window:
+            (old_t, old_x) = self.samples.popleft()
+            self.sums -= (1.0, old_t, old_x, old_t*old_t, old_x*old_x, old_t*old_x)
+        self.updates += 1
+
+        # monotonic queues: the front is the minimum (maximum) of the window
+        self.index += 1
+        for (queue, worse) in ((self.minima, lambda a, b: a >= b), (self.maxima, lambda a, b: a <= b)):
+            while queue and worse(queue[-1][1], x):
+                queue.pop()
+            queue.append((self.index, x))
+            while queue[0][0] <= self.index - self.window:
+                queue.popleft()
+
+        # Allan deviation: half the mean squared difference of consecutive tau-sample block means
+        for (tau, allan) in self.allan.items():
+            allan["block"].append(x)
+            if len(allan["block"]) < tau:
+                continue
+            mean = sum(allan["block"])/tau
+            allan["block"] = []
+            if allan["previous"] is not None:
+                square = (mean - allan["previous"])**2
+                allan["squares"].append(square)
+                allan["sum"] += square
+                # keep the differences that fit in the window
+                if len(allan["squares"]) > max(self.window//tau - 1, 1):
+                    allan["sum"] -= allan["squares"].popleft()
+            allan["previous"] = mean
+
+        if self.updates % self.window == 0:
+            self.rebase()
+
+    # move the reference to the oldest sample in the window and recompute the sums
+    def rebase(self):
+        (shift_t, shift_x) = self.samples[0]
+        self.reference = (self.reference[0] + shift_t, self.reference[1] + shift_x)
+        (t, x) = np.array(self.samples).T
+        t -= shift_t
+        x -= shift_x
+        if self.wrap is not None:
+            x = (x + self.wrap/2.0) % self.wrap - self.wrap/2.0
+        self.samples = collections.deque(zip(t.tolist(), x.tolist()))
+        self.sums = np.array([len(t), t.sum(), x.sum(), (t*t).sum(), (x*x).sum(), (t*x).sum()])
+        # the extremes and block means are only ever compared or differenced, so shifting them is enough
+        self.minima = collections.deque((index, value - shift_x) for (index, value) in self.minima)
+        self.maxima = collections.deque((index, value - shift_x) for (index, value) in self.maxima)
+        for allan in self.allan.values():
+            allan["block"] = [value - shift_x for value in allan["block"]]
+            if allan["previous"] is not None:
+                allan["previous"] -= shift_x
+            allan["sum"] = math.fsum(allan["squares"])
+
+    """
+    Get the statistics of the window.
+    Inputs: self.
+    Outputs: Dictionary with count, mean, std, min, max, drift (value per second), interval (mean seconds between
+    samples) and allan (dictionary of averaging time in seconds to Allan deviation); values that need more samples
+    are NaN.
+    """
+    def statistics(self):
+        (n, sum_t, sum_x, sum_tt, sum_xx, sum_tx) = self.sums
+        result = {"count": int(round(n)), "mean": math.nan, "std": math.nan, "min": math.nan, "max": math.nan,
+                  "drift": math.nan, "interval": math.nan, "allan": {}}
+        if n < 1:
+            return result
+        offset = self.reference[1]
+        mean = sum_x/n
+        result["mean"] = self.unwrapped(mean + offset)
+        result["min"] = self.unwrapped(self.minima[0][1] + offset)
+        result["max"] = self.unwrapped(self.maxima[0][1] + offset)
+        if n >= 2:
+            result["std"] = math.sqrt(max(sum_xx - n*mean*mean, 0.0)/(n - 1))
+            denominator = n*sum_tt - sum_t*sum_t
+            if denominator > 0:
+                result["drift"] = (n*sum_tx - sum_t*sum_x)/denominator
+            result["interval"] = (self.samples[-1][0] - self.samples[0][0])/(n - 1)
+        for (tau, allan) in self.allan.items():
+            if allan["squares"]:
+                allan_variance = max(allan["sum"], 0.0)/(2*len(allan["squares"]))
+                result["allan"][tau*result["interval"]] = math.sqrt(allan_variance)
+        return result
+
+    def unwrapped(self, value):
+        return (value - self.lowest) % self.wrap + self.lowest if self.wrap is not None else value
+
+"""
+Class for the statistics of all the pointing channels.
+Attributes: the statistics of each channel and the window length.
+Methods: add() - add one telemetry packet's values; statistics() - the statistics of every channel; reset() - start
+again (e.g. with a new window length).
+"""
+class PointingStatistics:
+    # channel keys (as in the GUI's TELEMETRY_GRAPHS) and the (lowest value, period) of those that wrap around
+    CHANNELS = (("ra", (0.0, 360.0)), ("dec", None), ("fr", (-180.0, 360.0)), ("ir", (-180.0, 360.0)), ("alt", None),
+                ("az", (0.0, 360.0)))
+
+    def __init__(self, window = DEFAULT_WINDOW):
+        self.reset(window)
+
+    def reset(self, window = None):
+        if window is not None:
+            self.window = window
+        self.channels = {key: RollingStatistics(self.window, wrap) for (key, wrap) in self.CHANNELS}
+
+    """
+    Add one telemetry packet.
+    Inputs: camera time in seconds and a dictionary of channel key to value.
+    Outputs: None.
+    """
+    def add(self, t, values):
+        for (key, channel) in self.channels.items():
+            channel.add(t, values[key])
+
+    def statistics(self):
+        return {key: channel.statistics() for (key, channel) in self.channels.items()}
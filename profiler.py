@@ -0,0 +1,139 @@
+import cProfile
+import collections
+import os
+import sys
+import threading
+import time
+
+"""
+Profile capture for a running program, to find out why it has become slow without restarting it under a profiler.
+A sampling profiler looks at the stack of every thread (the Qt main thread, QThreads such as the telemetry and image
+worker threads, and Python threads) at a fixed interval from a thread of its own, so it costs little and does not
+need the other threads to co-operate. Samples are wall-clock, so a thread waiting on its socket shows up in recv.
+Optionally cProfile also records exact call counts and times, but only for the thread that started the capture
+(cProfile cannot follow threads that were already running), i.e. the GUI's main thread.
+
+Results are written as a folded stacks file (one line per distinct stack, "thread;outer;...;inner count", as read by
+flamegraph.pl, speedscope and inferno), a pstats file for cProfile (python -m pstats <file>) and a text summary of
+the functions the samples were taken in.
+"""
+
+# seconds between samples
+DEFAULT_INTERVAL = 0.005
+# seconds a capture runs for unless stopped earlier
+DEFAULT_DURATION = 30.0
+# functions listed in the text summary
+SUMMARY_LENGTH = 30
+
+"""
+Class for the sampling profiler.
+Attributes: the sampling interval, the number of samples of each (thread, stack) and the sampling thread.
+Methods: start() - start sampling; stop() - stop sampling; writeFolded() - write the folded stacks file; summary() -
+the functions the most samples were taken in.
+"""
+class SamplingProfiler:
+    def __init__(self, interval = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.labels = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run, name = "SamplingProfiler", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for (ident, frame) in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                # threads started by Qt are not known to threading, so they are named after their run() method
+                name = names.get(ident, "")
+                if (not name) or name.startswith("Dummy"):
+                    name = stack[0].split(" (")[0]
+                self.stacks[(name,) + tuple(stack)] += 1
+            self.samples += 1
+
+    # label of a function in the output, e.g. "TelemetryThread.run (StarCameraGUI_v3.py:280)", cached per code object
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = "%s (%s:%d)" % (name, os.path.basename(code.co_filename), code.co_firstlineno)
+            self.labels[code] = label.replace(";", ",")
+        return self.labels[code]
+
+    def writeFolded(self, path):
+        with open(path, "w") as folded_file:
+            for (stack, count) in sorted(self.stacks.items()):
+                folded_file.write("%s %d\n" % (";".join(stack), count))
+
+    """
+    Count the samples taken in each function.
+    Inputs: whether to count only the innermost function of each sample (self time) instead of every function on the
+    stack (total time).
+    Outputs: List of (function label, samples) pairs, most samples first.
+    """
+    def summary(self, innermost = True):
+        counts = collections.Counter()
+        for (stack, count) in self.stacks.items():
+            for label in (stack[-1:] if innermost else set(stack[1:])):
+                counts[label] += count
+        return counts.most_common()
+
+"""
+Class for one profile capture: the sampling profiler and, optionally, cProfile of the calling thread.
+Attributes: the profilers, the output directory and when the capture started.
+Methods: start() - start profiling; stop() - stop profiling and write the results.
+"""
+class ProfileCapture:
+    def __init__(self, directory, interval = DEFAULT_INTERVAL, use_cprofile = False):
+        self.directory = directory
+        self.sampler = SamplingProfiler(interval)
+        self.cprofile = cProfile.Profile() if use_cprofile else None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.sampler.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    """
+    Stop profiling and write profile_<UTC start time>.folded, .txt (summary) and, with cProfile, .pstats files.
+    Inputs: self.
+    Outputs: List of the paths written.
+    """
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.sampler.stop()
+        duration = time.time() - self.start_time
+        base = os.path.join(self.directory, "profile_" + time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.start_time)))
+        paths = [base + ".folded", base + ".txt"]
+        self.sampler.writeFolded(paths[0])
+        with open(paths[1], "w") as summary_file:
+            summary_file.write("%d samples every %.1f ms over %.1f seconds\n" % (self.sampler.samples,
+                                                                              1000*self.sampler.interval, duration))
+            for (title, innermost) in (("Self", True), ("Total", False)):
+                summary_file.write("\n%s samples  function\n" % title)
+                for (label, count) in self.sampler.summary(innermost)[:SUMMARY_LENGTH]:
+                    summary_file.write("%12d  %s\n" % (count, label))
+        if self.cprofile is not None:
+            paths.append(base + ".pstats")
+            self.cprofile.dump_stats(paths[2])
+        return paths
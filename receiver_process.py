@@ -0,0 +1,270 @@
+import multiprocessing
+import socket
+import struct
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import listening_final
+import shared_frames
+
+"""
+Runs the network side of the GUI (socket reads, packet parsing and the data.txt backup) in a separate process, so it
+has a core of its own instead of sharing the GUI interpreter's lock with Qt rendering. Frames are handed over through
+a shared_frames.SharedFrameRing (latest frame wins if the GUI falls behind) and every telemetry packet through a
+TelemetryQueue, a single-producer/single-consumer ring of fixed-size records in shared memory that needs no locks:
+only the receiver moves the head and only the GUI moves the tail. Does not import Qt.
+"""
+
+# how long the GUI waits for the receiver process to report whether it could connect to the camera
+CONNECT_TIMEOUT = 15
+
+"""
+Class for a lock-free single-producer/single-consumer queue of telemetry packets in shared memory.
+Attributes: the shared memory segment, the capacity in records and whether this process created the segment.
+Methods: create() / attach() - open a queue; put() - append a packet (producer only); get() - take the oldest packet
+(consumer only); close() - detach, and remove the segment if this process owns it.
+"""
+class TelemetryQueue:
+    # head (records written), tail (records read), capacity, records dropped because the queue was full
+    HEADER = struct.Struct("QQQQ")
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((4,), dtype = np.uint64, buffer = shm.buf)
+        self.capacity = int(self.header[2])
+
+    """
+    Create a new queue.
+    Inputs: the capacity in telemetry packets.
+    Outputs: The queue.
+    """
+    @classmethod
+    def create(cls, capacity = 256):
+        shm = shared_memory.SharedMemory(create = True,
+                                         size = cls.HEADER.size + capacity*listening_final.TELEMETRY_SIZE)
+        cls.HEADER.pack_into(shm.buf, 0, 0, 0, capacity, 0)
+        return cls(shm, True)
+
+    """
+    Attach to a queue created by another process.
+    Inputs: name of the shared memory segment, and whether this process was started by the creator through
+    multiprocessing (and so shares its resource tracker).
+    Outputs: The queue.
+    """
+    @classmethod
+    def attach(cls, name, child_process = False):
+        shm = shared_memory.SharedMemory(name = name)
+        # only the creator should remove the segment; otherwise Python removes it when an unrelated reader exits
+        if not child_process:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def put(self, telemetry):
+        head = int(self.header[0])
+        if head - int(self.header[1]) >= self.capacity:
+            self.header[3] += 1
+            return False
+        offset = self.HEADER.size + (head % self.capacity)*listening_final.TELEMETRY_SIZE
+        self.shm.buf[offset:offset + listening_final.TELEMETRY_SIZE] = telemetry
+        # publish the record only once it is completely written
+        self.header[0] = head + 1
+        return True
+
+    def get(self):
+        tail = int(self.header[1])
+        if tail == int(self.header[0]):
+            return None
+        offset = self.HEADER.size + (tail % self.capacity)*listening_final.TELEMETRY_SIZE
+        telemetry = bytes(self.shm.buf[offset:offset + listening_final.TELEMETRY_SIZE])
+        # free the record only once it has been copied out
+        self.header[1] = tail + 1
+        return telemetry
+
+    def dropped(self):
+        return int(self.header[3])
+
+    def close(self):
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+"""
+Entry point of the receiver process: connect to the camera, then receive telemetry and images into shared memory
+until the connection drops or the GUI asks it to stop.
+Inputs: camera IP and port, names of the frame ring and telemetry queue, the pipe to the GUI (used to report the
+connection status and to receive commands to send to the camera) and the GUI's listening_final settings (which a
+spawned process does not inherit).
+Outputs: None.
+"""
+def receiverMain(StarCam_IP, user_port, ring_name, queue_name, gui_pipe, settings):
+    for (name, value) in settings.items():
+        setattr(listening_final, name, value)
+    ring = shared_frames.SharedFrameRing.attach(ring_name, child_process = True)
+    telemetry_queue = TelemetryQueue.attach(queue_name, child_process = True)
+    try:
+        (StarCam_socket, _, _) = listening_final.establishStarCamSocket(StarCam_IP, user_port)
+    except socket.error as error:
+        gui_pipe.send(("error", str(error)))
+        return
+    gui_pipe.send(("connected", None))
+    stopping = threading.Event()
+
+    # forward commands from the GUI to the camera until the GUI says to stop
+    def commandLoop():
+        while True:
+            try:
+                (kind, payload) = gui_pipe.recv()
+            except EOFError:
+                kind = "stop"
+            if kind == "stop":
+                stopping.set()
+                try:
+                    StarCam_socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+            try:
+                StarCam_socket.sendall(payload)
+            except OSError as error:
+                # the camera dropped; the receive loop below notices it too and reports the disconnection
+                print("Dropping commands, could not send them to the camera (%s)" % error)
+    threading.Thread(target = commandLoop, name = "commands", daemon = True).start()
+
+    image_buffer = bytearray(listening_final.IMAGE_SIZE)
+    while not stopping.is_set():
+        telemetry = listening_final.getStarCamData(StarCam_socket)
+        if telemetry is None:
+            break
+        telemetry_queue.put(telemetry)
+        image = listening_final.getStarCamImage(StarCam_socket, image_buffer)
+        if image is None:
+            break
+        ring.publish(telemetry, image)
+    StarCam_socket.close()
+    if not stopping.is_set():
+        gui_pipe.send(("disconnected", None))
+    ring.close()
+    telemetry_queue.close()
+
+"""
+Class owning the receiver process and its shared memory, seen by the GUI in place of the camera socket: sendto()
+forwards commands, and shutdown()/close() stop the process, so the commanding thread and the connection buttons work
+unchanged.
+Attributes: the process, the pipe to it, the frame ring and the telemetry queue.
+Methods: sendto() - send commands to the camera; nextTelemetry() - oldest unread telemetry packet; nextImage() - the
+newest image not yet read; isDisconnected() - whether the camera connection was lost; shutdown()/close() - stop.
+"""
+class ReceiverProcess:
+    def __init__(self, StarCam_IP, user_port, n_slots = 4):
+        self.ring = shared_frames.SharedFrameRing.create(n_slots = n_slots)
+        self.telemetry_queue = TelemetryQueue.create()
+        (self.gui_pipe, child_pipe) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target = receiverMain, name = "Star Camera receiver", daemon = True,
+                                               args = (StarCam_IP, user_port, self.ring.name,
+                                                       self.telemetry_queue.name, child_pipe, 
+                                                       {"verbose": listening_final.verbose, 
+                                                        "backup_text": listening_final.backup_text, 
+                                                        "backup_columnar": listening_final.backup_columnar,
+                                                        "receive_buffer_size": listening_final.receive_buffer_size,
+                                                        "autotune_receive_buffer":
+                                                            listening_final.autotune_receive_buffer,
+                                                        "tcp_nodelay": listening_final.tcp_nodelay,
+                                                        "keepalive_idle": listening_final.keepalive_idle,
+                                                        "user_timeout": listening_final.user_timeout}))
+        self.last_image_index = -1
+        # images overwritten in the frame ring or skipped because the GUI read a newer one first
+        self.skipped_images = 0
+        self.image_buffer = bytearray(listening_final.IMAGE_SIZE)
+        self.disconnected = False
+        self.closed = False
+        self.pipe_lock = threading.Lock()
+        # keeps close() from releasing the shared memory while the GUI's thread is reading from it
+        self.read_lock = threading.Lock()
+
+    """
+    Start the process and wait for it to connect to the camera.
+    Inputs: self.
+    Outputs: None. Raises socket.error if the camera could not be reached, like establishStarCamSocket().
+    """
+    def start(self):
+        self.process.start()
+        if not self.gui_pipe.poll(CONNECT_TIMEOUT):
+            self.close()
+            raise socket.timeout("Receiver process did not connect in time")
+        (status, error) = self.gui_pipe.recv()
+        if status != "connected":
+            self.close()
+            raise socket.error(error)
+
+    def sendto(self, data, address = None):
+        with self.pipe_lock:
+            self.gui_pipe.send(("commands", bytes(data)))
+
+    def nextTelemetry(self):
+        with self.read_lock:
+            if self.closed:
+                return None
+            return self.telemetry_queue.get()
+
+    def nextImage(self):
+        with self.read_lock:
+            if self.closed:
+                return None
+            written = self.ring.framesWritten()
+            if written - 1 <= self.last_image_index:
+                return None
+            frame = self.ring.read(written - 1, self.image_buffer)
+            if frame is None:
+                return None
+            self.skipped_images += max(written - 2 - self.last_image_index, 0)
+            self.last_image_index = written - 1
+            # hand out a copy, since the buffer is reused for the next image
+            return bytearray(frame[1])
+
+    def isDisconnected(self):
+        if (not self.disconnected) and (not self.closed):
+            with self.pipe_lock:
+                if self.gui_pipe.poll():
+                    self.disconnected = (self.gui_pipe.recv()[0] == "disconnected")
+            if not self.process.is_alive():
+                self.disconnected = True
+        return self.disconnected or self.closed
+
+    def shutdown(self, how = None):
+        if self.process.is_alive():
+            with self.pipe_lock:
+                try:
+                    self.gui_pipe.send(("stop", None))
+                except OSError:
+                    pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.shutdown()
+        with self.read_lock:
+            self.closed = True
+        if self.process.pid is not None:
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.gui_pipe.close()
+        self.ring.close()
+        self.telemetry_queue.close()
+
+"""
+Create and start a receiver process, returning it in the same bundle format as
+listening_final.establishStarCamSocket().
+Inputs: camera IP and port.
+Outputs: (receiver process, camera IP, camera port).
+"""
+def establishReceiverProcess(StarCam_IP, user_port):
+    receiver = ReceiverProcess(StarCam_IP, user_port)
+    receiver.start()
+    return (receiver, StarCam_IP, user_port)
@@ -0,0 +1,241 @@
+import argparse
+import signal
+import socket
+import threading
+import listening_final
+import shared_frames
+
+"""
+Fan-out relay: holds the single connection to the Star Camera and re-broadcasts its telemetry and images to any
+number of local clients. Clients connect to the relay exactly as they would to the camera (same port protocol), so
+the GUI works unchanged - enter the relay computer's address and port instead of the camera's. Each frame is received
+once into one buffer and the same read-only view of it is sent to every client, so adding a viewer costs no extra
+copies and nothing on the camera's uplink. Commands from any client are forwarded to the camera one whole packet at a
+time, so packets from different clients never interleave. Optionally every frame is also published to a shared
+memory ring (see shared_frames) for readers on the same computer.
+
+The relay backs up the telemetry it receives (data.txt and the columnar log, see --backup), so viewers connected
+through it should be started with --backup none rather than write every packet a second time.
+"""
+
+"""
+Class for one downstream client of the relay.
+Attributes: the client socket, its address, the next frame waiting to be sent and counters.
+Methods: queueFrame() - hand the client a new frame (replacing an unsent one if the client is slow); sendLoop() - send
+frames to the client; commandLoop() - forward the client's commands to the camera; close() - disconnect.
+"""
+class RelayClient:
+    def __init__(self, relay, client_socket, address):
+        self.relay = relay
+        self.client_socket = client_socket
+        self.address = address
+        self.condition = threading.Condition()
+        self.pending_frame = None
+        self.closed = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def queueFrame(self, frame):
+        with self.condition:
+            # a slow client skips frames rather than building up a backlog
+            if self.pending_frame is not None:
+                self.frames_dropped += 1
+            self.pending_frame = frame
+            self.condition.notify()
+
+    def sendLoop(self):
+        try:
+            while True:
+                with self.condition:
+                    while (self.pending_frame is None) and (not self.closed):
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    (telemetry, image) = self.pending_frame
+                    self.pending_frame = None
+                self.client_socket.sendall(telemetry)
+                self.client_socket.sendall(image)
+                self.frames_sent += 1
+        except OSError:
+            pass
+        finally:
+            self.relay.removeClient(self)
+
+    def commandLoop(self):
+        while not self.closed:
+            try:
+                commands = listening_final.receiveExactly(self.client_socket, listening_final.COMMAND_SIZE)
+            except OSError:
+                commands = None
+            if commands is None:
+                break
+            self.relay.forwardCommands(bytes(commands), self)
+        self.relay.removeClient(self)
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client_socket.close()
+
+"""
+Class for the relay itself.
+Attributes: camera connection settings, the listening socket, the connected clients and the optional shared memory
+ring.
+Methods: run() - accept clients and relay frames until stopped; acceptLoop() - accept new clients; upstreamLoop() -
+receive frames from the camera and hand them to every client; forwardCommands() - send a client's commands to the
+camera; removeClient() - forget a disconnected client; stop() - shut everything down.
+"""
+class StarCamRelay:
+    def __init__(self, StarCam_IP, StarCam_port, listen_address, shm_name = None, reconnect_delay = 5.0):
+        self.StarCam_IP = StarCam_IP
+        self.StarCam_port = StarCam_port
+        self.listen_address = listen_address
+        self.reconnect_delay = reconnect_delay
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        # serializes whole command packets going upstream
+        self.upstream_lock = threading.Lock()
+        self.upstream_socket = None
+        self.stopping = threading.Event()
+        self.frames_relayed = 0
+        self.commands_forwarded = 0
+        self.ring = None
+        if shm_name is not None:
+            self.ring = shared_frames.SharedFrameRing.create(shm_name)
+
+    def run(self):
+        listening_final.prepareBackupFile()
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(self.listen_address)
+        self.server_socket.listen()
+        print("Relaying Star Camera %s:%d on %s:%d" % ((self.StarCam_IP, self.StarCam_port) + self.listen_address))
+        threading.Thread(target = self.acceptLoop, name = "relay accept", daemon = True).start()
+        while not self.stopping.is_set():
+            try:
+                (self.upstream_socket, _, _) = listening_final.establishStarCamSocket(self.StarCam_IP,
+                                                                                    self.StarCam_port)
+            except socket.error as error:
+                print("Could not connect to the camera (%s), retrying in %.0f seconds" % (error,
+                                                                                         self.reconnect_delay))
+                self.stopping.wait(self.reconnect_delay)
+                continue
+            self.upstreamLoop()
+            with self.upstream_lock:
+                self.upstream_socket.close()
+                self.upstream_socket = None
+            if not self.stopping.is_set():
+                print("Camera disconnected, reconnecting in %.0f seconds" % self.reconnect_delay)
+                self.stopping.wait(self.reconnect_delay)
+        self.server_socket.close()
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+        if self.ring is not None:
+            self.ring.close()
+
+    def acceptLoop(self):
+        while not self.stopping.is_set():
+            try:
+                (client_socket, address) = self.server_socket.accept()
+            except OSError:
+                return
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = RelayClient(self, client_socket, address)
+            with self.clients_lock:
+                self.clients.append(client)
+            print("Viewer connected from %s:%d (%d connected)" % (address + (len(self.clients),)))
+            threading.Thread(target = client.sendLoop, name = "relay send", daemon = True).start()
+            threading.Thread(target = client.commandLoop, name = "relay commands", daemon = True).start()
+
+    def upstreamLoop(self):
+        while not self.stopping.is_set():
+            telemetry = listening_final.getStarCamData(self.upstream_socket)
+            if telemetry is None:
+                return
+            # a fresh buffer per frame, since clients may still be sending the previous one
+            image = listening_final.getStarCamImage(self.upstream_socket)
+            if image is None:
+                return
+            frame = (telemetry, memoryview(image).toreadonly())
+            with self.clients_lock:
+                clients = list(self.clients)
+            for client in clients:
+                client.queueFrame(frame)
+            if self.ring is not None:
+                self.ring.publish(telemetry, image)
+            self.frames_relayed += 1
+
+    def forwardCommands(self, commands, client):
+        with self.upstream_lock:
+            if self.upstream_socket is None:
+                print("Dropping commands from %s:%d, camera is not connected" % client.address)
+                return
+            try:
+                self.upstream_socket.sendall(commands)
+            except OSError as error:
+                # the camera dropped; upstreamLoop() notices it too and reconnects
+                print("Dropping commands from %s:%d, could not send them to the camera (%s)" % (client.address + 
+                                                                                               (error,)))
+                return
+            self.commands_forwarded += 1
+        print("Forwarded commands from %s:%d to the camera" % client.address)
+
+    def removeClient(self, client):
+        with self.clients_lock:
+            if client not in self.clients:
+                return
+            self.clients.remove(client)
+            remaining = len(self.clients)
+        client.close()
+        print("Viewer %s:%d disconnected (%d connected, %d frames sent, %d skipped)" % (client.address +
+              (remaining, client.frames_sent, client.frames_dropped)))
+
+    def stop(self):
+        self.stopping.set()
+        try:
+            self.server_socket.close()
+        except (OSError, AttributeError):
+            pass
+        with self.upstream_lock:
+            if self.upstream_socket is not None:
+                try:
+                    self.upstream_socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+"""
+Parse the command line and run the relay until interrupted.
+Inputs: command-line arguments (defaults to sys.argv).
+Outputs: None.
+"""
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Share one Star Camera connection between many viewers")
+    parser.add_argument("ip", help = "IP address of the Star Camera computer")
+    parser.add_argument("port", type = int, help = "server port of the Star Camera")
+    parser.add_argument("--listen-port", type = int, default = 8000, help = "port viewers connect to")
+    parser.add_argument("--listen-address", default = "127.0.0.1",
+                        help = "address to accept viewers on (0.0.0.0 to accept other computers)")
+    parser.add_argument("--shm", help = "also publish frames to a shared memory ring with this name")
+    parser.add_argument("--backup", choices = ["text", "columnar", "both", "none"], default = "both",
+                        help = "back the telemetry up to data.txt, the columnar telemetry log, both, or neither")
+    args = parser.parse_args(argv)
+
+    listening_final.verbose = False
+    listening_final.backup_text = args.backup in ("text", "both")
+    listening_final.backup_columnar = args.backup in ("columnar", "both")
+    relay = StarCamRelay(args.ip, args.port, (args.listen_address, args.listen_port), args.shm)
+    signal.signal(signal.SIGINT, lambda signum, frame: relay.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: relay.stop())
+    relay.run()
+
+if __name__ == "__main__":
+    main()
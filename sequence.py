@@ -0,0 +1,258 @@
+import json
+import math
+import listening_final
+
+"""
+Scripted observing sequences: a plan file lists steps of camera commands (e.g. an exposure ladder, an aperture sweep
+or a periodic re-focus), and the runner sends them on schedule. Each step only moves on once the telemetry shows the
+camera has taken the new settings, instead of after a fixed sleep.
+
+A plan is a JSON file, either a list of steps or {"repeat": times to go through the steps, "steps": [...]}. A step is
+an object with:
+- "commands": values to change, by the names in listening_final.COMMAND_FIELDS, plus "aperture" for an f-number
+  (converted to aperture steps from the camera's aperture when the step is sent). A step keeps the values of the steps
+  before it and starts from the commands entered in the GUI, so each step only lists what it changes.
+- "delay": seconds to wait before sending the step, counted from the end of the step before (default 0).
+- "images": telemetry packets to wait for after the step is confirmed before moving on (default 0).
+- "timeout": seconds to wait for the telemetry to confirm the step before the sequence is stopped (default 60).
+- "name": shown while the step runs (optional).
+A step that starts auto-focusing is confirmed when the camera has been through the sweep and left auto-focusing. Once
+the camera reports it has started, the sweep gets as long as its images should take (see focusingTime()), or the
+step's timeout if that is longer.
+For example, a ladder of three exposures with 10 images each:
+
+    {"steps": [{"commands": {"exposure": 100}, "images": 10},
+               {"commands": {"exposure": 300}, "images": 10},
+               {"commands": {"exposure": 1000}, "images": 10}]}
+"""
+
+# seconds allowed for the telemetry to confirm a step unless the step says otherwise
+DEFAULT_TIMEOUT = 60.0
+# commands echoed in the telemetry packet: name -> index in the unpacked telemetry (see listening_final.TELEMETRY_FORMAT)
+TELEMETRY_FIELDS = {"timelimit": 0, "logodds": 2, "latitude": 3, "longitude": 4, "height": 5,
+                    "set_focus_to_amount": 14, "infinity_focus": 15, "max_aperture": 17, "exposure": 21,
+                    "auto_focus": 24, "start_focus": 25, "end_focus": 26, "focus_step": 27, "photos_per_focus": 28,
+                    "spike_limit": 30, "dynamic_hot_pixels": 31, "r_smooth": 32, "high_pass_filter": 33,
+                    "r_high_pass_filter": 34, "centroid_search_border": 35, "filter_return_image": 36, "n_sigma": 37,
+                    "unique_star_spacing": 38, "use_HP": 40}
+# index of the aperture (f-number times ten) in the unpacked telemetry
+APERTURE_FIELD = 20
+# blob parameters sent as this value are left unchanged by the camera, so there is nothing to confirm
+UNCHANGED = -1
+# the camera reports the values it applied, rounded to its own precision, so each echoed command is confirmed within
+# (absolute, relative) tolerances: the exposure to the millisecond or 1%, the focus within a few motor counts of the
+# position asked for, and other floats to about the precision they are shown with (integers must match, see matches())
+TOLERANCES = {"exposure": (1.0, 0.01), "set_focus_to_amount": (3, 0.0)}
+FLOAT_TOLERANCE = (1e-3, 1e-3)
+# seconds each auto-focusing image is allowed on top of its exposure (moving the focus, reading out and sending it)...
+FOCUS_IMAGE_OVERHEAD = 5.0
+# ...and the factor of safety on the time the whole sweep should take
+FOCUS_TIME_MARGIN = 2.0
+# commands packed as integers, which a plan must give as whole numbers
+INTEGER_FIELDS = {name for (name, code) in zip(listening_final.COMMAND_FIELDS, listening_final.COMMAND_FORMAT)
+                  if code == "i"}
+
+"""
+Read a plan file and check its structure (the command values themselves are checked by the GUI).
+Inputs: path of the plan file.
+Outputs: (list of steps as dictionaries with "name", "changes" (the commands of the step), "delay", "images" and
+"timeout", number of times to go through them). The aperture is given as an f-number string like the GUI's menu.
+Raises OSError if the file cannot be read and ValueError, naming the step, if it is not a valid plan.
+"""
+def loadPlan(path):
+    with open(path) as plan_file:
+        plan = json.load(plan_file)
+    repeat = 1
+    if isinstance(plan, dict):
+        repeat = plan.get("repeat", 1)
+        plan = plan.get("steps")
+    if (not isinstance(plan, list)) or (not plan):
+        raise ValueError("the plan has no steps")
+    if (not isinstance(repeat, int)) or (repeat < 1):
+        raise ValueError("repeat must be a positive whole number")
+    steps = []
+    for (number, step) in enumerate(plan, 1):
+        if not isinstance(step, dict):
+            raise ValueError("step %d is not an object" % number)
+        unknown = set(step) - {"name", "commands", "delay", "images", "timeout"}
+        if unknown:
+            raise ValueError("step %d: unknown keys %s" % (number, ", ".join(sorted(unknown))))
+        commands = step.get("commands", {})
+        if not isinstance(commands, dict):
+            raise ValueError("step %d: commands must be an object" % number)
+        unknown = set(commands) - set(listening_final.COMMAND_FIELDS) - {"aperture"}
+        if unknown:
+            raise ValueError("step %d: unknown commands %s" % (number, ", ".join(sorted(unknown))))
+        if "set_aperture_steps" in commands:
+            raise ValueError("step %d: give the aperture as an f-number with \"aperture\"" % number)
+        for (name, value) in commands.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError("step %d: %s must be a number" % (number, name))
+            if (name in INTEGER_FIELDS) and (value != int(value)):
+                raise ValueError("step %d: %s must be a whole number" % (number, name))
+        if commands.get("focus_step", 1) < 1:
+            raise ValueError("step %d: focus_step must be at least 1" % number)
+        changes = {name: (int(value) if name in INTEGER_FIELDS else value) for (name, value) in commands.items()}
+        if "aperture" in changes:
+            changes["aperture"] = "%.1f" % changes["aperture"]
+        for key in ("delay", "images", "timeout"):
+            value = step.get(key, 0)
+            if isinstance(value, bool) or (not isinstance(value, (int, float))) or (value < 0):
+                raise ValueError("step %d: %s must be a number of at least 0" % (number, key))
+        steps.append({"name": str(step.get("name", "step %d" % number)), "changes": changes,
+                      "delay": float(step.get("delay", 0)), "images": int(step.get("images", 0)),
+                      "timeout": float(step.get("timeout", DEFAULT_TIMEOUT))})
+    return (steps, repeat)
+
+"""
+Check whether a value reported in the telemetry matches the one commanded, within the tolerance of the command (see
+TOLERANCES). Integer fields of the telemetry may hold a truncated copy of a value sent as a float.
+Inputs: the name of the command, the value reported and the value commanded.
+Outputs: True if they match.
+"""
+def matches(name, reported, commanded):
+    if name in TOLERANCES:
+        (absolute, relative) = TOLERANCES[name]
+    elif isinstance(reported, int):
+        return abs(reported - commanded) < 1
+    else:
+        (absolute, relative) = FLOAT_TOLERANCE
+    return abs(reported - commanded) <= max(absolute, relative*abs(commanded))
+
+"""
+Estimate how long an auto-focusing sweep takes, from the sweep the camera reports it is running.
+Inputs: the unpacked telemetry packet.
+Outputs: Seconds, with a margin (see FOCUS_TIME_MARGIN).
+"""
+def focusingTime(values):
+    (start, end, step) = (values[TELEMETRY_FIELDS[name]] for name in ("start_focus", "end_focus", "focus_step"))
+    positions = abs(end - start)//max(step, 1) + 1
+    photos = max(values[TELEMETRY_FIELDS["photos_per_focus"]], 1)
+    exposure = values[TELEMETRY_FIELDS["exposure"]]/1000.0
+    return FOCUS_TIME_MARGIN*positions*photos*(exposure + FOCUS_IMAGE_OVERHEAD)
+
+"""
+Class for running a sequence: sends each step when it is due and follows the telemetry to confirm it.
+Attributes: the steps (see loadPlan()), the function sending a step, the index of the current
+step and pass through the plan, and the state of the current step ("waiting" to be sent, "confirming", "focusing"
+while an auto-focusing sweep runs, "holding" for its images, or "done"/"failed" for the whole sequence).
+Methods: start() - start at the first step; tick() - send the current step when it is due and time out its
+confirmation (call it regularly from a timer); telemetry() - follow a telemetry packet; stop() - stop the sequence;
+status() - a line describing where the sequence is.
+"""
+class SequenceRunner:
+    def __init__(self, steps, send, repeat = 1):
+        self.steps = steps
+        self.send = send
+        self.repeat = repeat
+        self.index = 0
+        self.lap = 0
+        self.state = "waiting"
+        self.message = ""
+        self.due = 0.0
+        self.deadline = 0.0
+        self.waited_for = ""
+        self.images = 0
+        self.packets_since_sent = 0
+
+    def start(self, now):
+        self.index = 0
+        self.lap = 0
+        self.enterStep(now)
+
+    def enterStep(self, now):
+        self.state = "waiting"
+        self.due = now + self.steps[self.index]["delay"]
+
+    def stop(self, message = "stopped"):
+        self.state = "failed"
+        self.message = message
+
+    def running(self):
+        return self.state not in ("done", "failed")
+
+    """
+    Send the current step if it is due, or stop the sequence if its confirmation has timed out.
+    Inputs: the current monotonic time in seconds.
+    Outputs: None.
+    """
+    def tick(self, now):
+        step = self.steps[self.index] if self.running() else None
+        if (self.state == "waiting") and (now >= self.due):
+            # move on before sending, so the step is not sent again if sending lets the timer tick meanwhile
+            self.state = "confirming"
+            self.deadline = now + step["timeout"]
+            self.waited_for = "was not confirmed by the telemetry within %g seconds" % step["timeout"]
+            self.packets_since_sent = 0
+            self.send(step)
+        elif (self.state in ("confirming", "focusing")) and (now > self.deadline):
+            self.stop("%s %s" % (step["name"], self.waited_for))
+
+    """
+    Follow a telemetry packet: confirm the current step once the camera reports its settings, then count its images.
+    Inputs: the unpacked telemetry packet and the current monotonic time in seconds.
+    Outputs: None.
+    """
+    def telemetry(self, values, now):
+        if not self.running():
+            return
+        step = self.steps[self.index]
+        if self.state == "confirming":
+            self.packets_since_sent += 1
+            # the first packet may have been sent by the camera before it got the commands
+            if (self.packets_since_sent < 2) or (not self.confirmed(step, values)):
+                return
+            if step["changes"].get("auto_focus"):
+                self.state = "focusing"
+                # the sweep has only just started, so it gets its own time
+                focusing_time = max(focusingTime(values), step["timeout"])
+                self.deadline = now + focusing_time
+                self.waited_for = "did not finish auto-focusing within %.0f seconds" % focusing_time
+                return
+            self.startHolding(now)
+        elif self.state == "focusing":
+            if not values[TELEMETRY_FIELDS["auto_focus"]]:
+                self.startHolding(now)
+        elif self.state == "holding":
+            self.images += 1
+            if self.images >= step["images"]:
+                self.nextStep(now)
+
+    def startHolding(self, now):
+        self.state = "holding"
+        self.images = 0
+        if self.steps[self.index]["images"] == 0:
+            self.nextStep(now)
+
+    def nextStep(self, now):
+        self.index += 1
+        if self.index == len(self.steps):
+            self.index = 0
+            self.lap += 1
+            if self.lap == self.repeat:
+                self.state = "done"
+                self.message = "finished"
+                return
+        self.enterStep(now)
+
+    """
+    Check the telemetry against the commands the current step changes.
+    Inputs: the step and the unpacked telemetry packet.
+    Outputs: True if every echoed value matches.
+    """
+    def confirmed(self, step, values):
+        for (name, value) in step["changes"].items():
+            if name == "aperture":
+                if not math.isclose(values[APERTURE_FIELD]/10.0, float(value), abs_tol = 0.05):
+                    return False
+            elif (name in TELEMETRY_FIELDS) and (value != UNCHANGED) and \
+                 not matches(name, values[TELEMETRY_FIELDS[name]], value):
+                return False
+        return True
+
+    def status(self):
+        if not self.running():
+            return "Sequence %s" % self.message
+        step = self.steps[self.index]
+        lap = " (pass %d of %d)" % (self.lap + 1, self.repeat) if self.repeat > 1 else ""
+        return "%s, %d of %d%s: %s" % (step["name"], self.index + 1, len(self.steps), lap, self.state)
@@ -0,0 +1,141 @@
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import listening_final
+
+"""
+Ring of Star Camera frames (telemetry packet + image) in a named shared memory segment, so that processes on the same
+computer can hand frames to each other without copying them through sockets or pipes. There is a single writer; any
+number of readers can attach by name. Each slot is protected by a sequence number (a seqlock): the writer makes it
+odd while the slot is being written and even once it is complete, so readers can detect and retry torn reads without
+any locks shared between processes.
+
+Segment layout: ring header (frames written, number of slots), then for every slot its sequence number, the raw
+telemetry packet and the raw image bytes.
+"""
+
+RING_HEADER = struct.Struct("QQ")
+SLOT_HEADER_SIZE = 8
+SLOT_SIZE = SLOT_HEADER_SIZE + listening_final.TELEMETRY_SIZE + listening_final.IMAGE_SIZE
+
+"""
+Class for a shared memory ring of frames.
+Attributes: the shared memory segment, the number of slots and whether this process created (and owns) the segment.
+Methods: create() / attach() - open a ring; publish() - write a frame (writer only); latest() / read() - copy out a
+frame (readers); close() - detach, and remove the segment if this process owns it.
+"""
+class SharedFrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((2,), dtype = np.uint64, buffer = shm.buf)
+        self.n_slots = int(self.header[1])
+        self.slot_sequences = [np.ndarray((1,), dtype = np.uint64, buffer = shm.buf,
+                                          offset = RING_HEADER.size + i*SLOT_SIZE) for i in range(self.n_slots)]
+
+    """
+    Create a new ring (the creating process is the only one allowed to publish frames).
+    Inputs: name of the shared memory segment (None lets the system choose one) and the number of frame slots.
+    Outputs: The ring.
+    """
+    @classmethod
+    def create(cls, name = None, n_slots = 4):
+        shm = shared_memory.SharedMemory(name = name, create = True, size = RING_HEADER.size + n_slots*SLOT_SIZE)
+        RING_HEADER.pack_into(shm.buf, 0, 0, n_slots)
+        for i in range(n_slots):
+            struct.pack_into("Q", shm.buf, RING_HEADER.size + i*SLOT_SIZE, 0)
+        return cls(shm, True)
+
+    """
+    Attach to a ring created by another process.
+    Inputs: name of the shared memory segment, and whether this process was started by the creator through
+    multiprocessing (and so shares its resource tracker).
+    Outputs: The ring.
+    """
+    @classmethod
+    def attach(cls, name, child_process = False):
+        shm = shared_memory.SharedMemory(name = name)
+        # only the creator should remove the segment; otherwise Python removes it when an unrelated reader exits
+        if not child_process:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    """
+    Number of frames published so far (the index the next frame will get).
+    """
+    def framesWritten(self):
+        return int(self.header[0])
+
+    """
+    Write a frame into the next slot, overwriting the oldest one.
+    Inputs: the raw telemetry packet and the raw image bytes (any bytes-like objects).
+    Outputs: The index of the published frame.
+    """
+    def publish(self, telemetry, image):
+        index = int(self.header[0])
+        slot = index % self.n_slots
+        offset = RING_HEADER.size + slot*SLOT_SIZE
+        sequence = self.slot_sequences[slot]
+        # odd sequence number while the slot is being written
+        sequence[0] = 2*index + 1
+        start = offset + SLOT_HEADER_SIZE
+        self.shm.buf[start:start + listening_final.TELEMETRY_SIZE] = telemetry
+        start += listening_final.TELEMETRY_SIZE
+        self.shm.buf[start:start + listening_final.IMAGE_SIZE] = image
+        sequence[0] = 2*index + 2
+        self.header[0] = index + 1
+        return index
+
+    """
+    Copy a frame out of the ring.
+    Inputs: index of the frame, optionally a bytearray of IMAGE_SIZE bytes to copy the image into, and how many times
+    to retry if the writer is in the middle of overwriting the slot.
+    Outputs: (telemetry bytes, image bytearray), or None if the frame has already been overwritten.
+    """
+    def read(self, index, image_buffer = None, retries = 10):
+        if image_buffer is None:
+            image_buffer = bytearray(listening_final.IMAGE_SIZE)
+        slot = index % self.n_slots
+        offset = RING_HEADER.size + slot*SLOT_SIZE + SLOT_HEADER_SIZE
+        sequence = self.slot_sequences[slot]
+        for _ in range(retries):
+            before = int(sequence[0])
+            if before > 2*index + 2:
+                return None
+            if before != 2*index + 2:
+                # frame is still being written
+                time.sleep(0.001)
+                continue
+            telemetry = bytes(self.shm.buf[offset:offset + listening_final.TELEMETRY_SIZE])
+            image_start = offset + listening_final.TELEMETRY_SIZE
+            image_buffer[:] = self.shm.buf[image_start:image_start + listening_final.IMAGE_SIZE]
+            if int(sequence[0]) == before:
+                return (telemetry, image_buffer)
+        return None
+
+    """
+    Copy the most recently published frame out of the ring.
+    Inputs: optionally a bytearray of IMAGE_SIZE bytes to copy the image into.
+    Outputs: (frame index, telemetry bytes, image bytearray), or None if no frame is available yet.
+    """
+    def latest(self, image_buffer = None):
+        written = self.framesWritten()
+        if written == 0:
+            return None
+        frame = self.read(written - 1, image_buffer)
+        if frame is None:
+            return None
+        return (written - 1,) + frame
+
+    def close(self):
+        # numpy views must be released before the segment can be closed
+        self.header = None
+        self.slot_sequences = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,105 @@
+import argparse
+import socket
+import struct
+import threading
+import time
+import listening_final
+
+"""
+Loopback benchmark of the camera socket options: a stand-in camera on localhost streams telemetry packets and images
+like the real one (with an artificial delay before each frame and optionally a limited link rate), and a client
+receives them through listening_final with the chosen receive buffer, TCP_NODELAY and keepalive options, reporting
+the throughput it achieved. The delay only spaces the frames out; to give the connection a real round-trip time (which
+is what the receive buffer size matters for) add one to the loopback interface for the run, e.g.
+
+    sudo tc qdisc add dev lo root netem delay 50ms
+    python socket_bench.py --frames 60 --receive-buffer auto
+    sudo tc qdisc del dev lo root
+"""
+
+"""
+Stand-in Star Camera: accept one client and send it telemetry packets and images.
+Inputs: the listening socket, the number of frames, milliseconds to wait before each frame and the link rate in MB/s
+(None for as fast as possible).
+Outputs: None.
+"""
+def serveFrames(server_socket, n_frames, delay, rate):
+    (conn, _) = server_socket.accept()
+    image = bytes(bytearray(range(256))*(listening_final.IMAGE_SIZE//256 + 1))[:listening_final.IMAGE_SIZE]
+    view = memoryview(image)
+    chunk = 64*1024
+    try:
+        for _ in range(n_frames):
+            time.sleep(delay/1000.0)
+            values = [time.time()] + [0.0]*12 + [0]*8 + [0.0]*2 + [0]*14 + [0.0] + [0]*3
+            conn.sendall(struct.pack(listening_final.TELEMETRY_FORMAT, *values))
+            start = time.perf_counter()
+            for offset in range(0, len(image), chunk):
+                conn.sendall(view[offset:offset + chunk])
+                if rate is not None:
+                    # hold the link to the rate by waiting until the bytes sent so far are due
+                    due = start + (offset + chunk)/(rate*1e6)
+                    time.sleep(max(due - time.perf_counter(), 0.0))
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        conn.close()
+
+"""
+Receive frames from the stand-in camera through listening_final and measure the throughput.
+Inputs: the camera's port and the number of frames.
+Outputs: (image transfer rates in MB/s, frames per second over the whole run).
+"""
+def receiveFrames(port, n_frames):
+    (client_socket, _, _) = listening_final.establishStarCamSocket("127.0.0.1", port)
+    image_buffer = bytearray(listening_final.IMAGE_SIZE)
+    rates = []
+    start = time.perf_counter()
+    for _ in range(n_frames):
+        if listening_final.getStarCamData(client_socket) is None:
+            break
+        image_start = time.perf_counter()
+        if listening_final.getStarCamImage(client_socket, image_buffer) is None:
+            break
+        rates.append(listening_final.IMAGE_SIZE/max(time.perf_counter() - image_start, 1e-9)/1e6)
+    elapsed = time.perf_counter() - start
+    client_socket.close()
+    return (rates, len(rates)/elapsed)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the camera socket options against a loopback camera")
+    parser.add_argument("--frames", type = int, default = 50, help = "frames to send")
+    parser.add_argument("--delay", type = float, default = 0.0, help = "milliseconds to wait before each frame")
+    parser.add_argument("--rate", type = float, help = "link rate in MB/s (default: unlimited)")
+    parser.add_argument("--receive-buffer", type = listening_final.parseReceiveBuffer,
+                        help = "receive buffer of the client socket in KB, or auto to tune it (default: the system's)")
+    parser.add_argument("--no-nodelay", action = "store_true", help = "leave Nagle's algorithm on")
+    parser.add_argument("--no-keepalive", action = "store_true", help = "do not send keepalive probes")
+    args = parser.parse_args(argv)
+
+    listening_final.setReceiveBuffer(args.receive_buffer)
+    listening_final.tcp_nodelay = not args.no_nodelay
+    if args.no_keepalive:
+        listening_final.keepalive_idle = None
+    listening_final.backup_text = False
+    listening_final.backup_columnar = False
+    listening_final.verbose = False
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(("127.0.0.1", 0))
+    server_socket.listen(1)
+    server = threading.Thread(target = serveFrames, args = (server_socket, args.frames, args.delay, args.rate),
+                              daemon = True)
+    server.start()
+    (rates, fps) = receiveFrames(server_socket.getsockname()[1], args.frames)
+    server.join()
+    server_socket.close()
+    if not rates:
+        print("No frames received")
+        return
+    rates.sort()
+    print("%d frames, %.2f frames/s, image transfer %.1f MB/s median (%.1f - %.1f)" %
+          (len(rates), fps, rates[len(rates)//2], rates[0], rates[-1]))
+
+if __name__ == "__main__":
+    main()
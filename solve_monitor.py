@@ -0,0 +1,113 @@
+import math
+import numpy as np
+
+"""
+Astrometry solve-rate monitor. The camera sends all-zero pointing telemetry when it could not solve an image (the GUI
+leaves those packets out of the graphs); this counts them instead, keeping totals, the time between solves, the
+current and longest streaks of failed solves, and the solve rate in fixed time buckets held in a ring buffer of
+constant size. It also says when the recent solve rate falls below a threshold, e.g. because of clouds or defocus.
+"""
+
+# seconds of camera time per solve-rate bucket
+DEFAULT_BUCKET_SECONDS = 60.0
+# buckets kept in the ring buffer (6 hours of one-minute buckets)
+DEFAULT_BUCKETS = 360
+# the alert looks at the solve rate over this many of the most recent buckets...
+DEFAULT_ALERT_BUCKETS = 5
+# ...and only once there have been at least this many attempts in them
+MIN_ALERT_ATTEMPTS = 5
+
+"""
+Class for the solve-rate monitor.
+Attributes: counters, streaks and time between solves, the ring buffer of (bucket start, attempts, solves), and the
+alert threshold and state.
+Methods: add() - count one packet; series() - solve rate per bucket; recentRate() - solve rate over the most recent
+buckets; setThreshold() - change the alert threshold.
+"""
+class SolveMonitor:
+    def __init__(self, threshold = 0.5, bucket_seconds = DEFAULT_BUCKET_SECONDS, n_buckets = DEFAULT_BUCKETS,
+                 alert_buckets = DEFAULT_ALERT_BUCKETS):
+        self.threshold = threshold
+        self.bucket_seconds = bucket_seconds
+        self.alert_buckets = alert_buckets
+        self.bucket_numbers = np.full(n_buckets, -1, dtype = np.int64)
+        self.attempts = np.zeros(n_buckets, dtype = np.int32)
+        self.solves = np.zeros(n_buckets, dtype = np.int32)
+        self.latest_bucket = None
+        self.total = 0
+        self.solved = 0
+        self.failure_streak = 0
+        self.longest_failure_streak = 0
+        self.last_solve_time = None
+        self.last_gap = math.nan
+        self.longest_gap = math.nan
+        self.alerting = False
+
+    """
+    Count one telemetry packet.
+    Inputs: camera time in seconds and whether the image was solved.
+    Outputs: True if this packet raised the alert (the recent solve rate has just dropped below the threshold),
+    otherwise False.
+    """
+    def add(self, t, solved):
+        bucket = int(t//self.bucket_seconds)
+        slot = bucket % len(self.bucket_numbers)
+        if self.bucket_numbers[slot] != bucket:
+            # a new bucket (or one left over from a full lap of the ring ago)
+            self.bucket_numbers[slot] = bucket
+            self.attempts[slot] = 0
+            self.solves[slot] = 0
+        if (self.latest_bucket is None) or (bucket > self.latest_bucket):
+            self.latest_bucket = bucket
+        self.attempts[slot] += 1
+        self.total += 1
+        if solved:
+            self.solves[slot] += 1
+            self.solved += 1
+            self.failure_streak = 0
+            if self.last_solve_time is not None:
+                self.last_gap = t - self.last_solve_time
+                self.longest_gap = self.last_gap if math.isnan(self.longest_gap) else max(self.longest_gap,
+                                                                                          self.last_gap)
+            self.last_solve_time = t
+        else:
+            self.failure_streak += 1
+            self.longest_failure_streak = max(self.longest_failure_streak, self.failure_streak)
+
+        (rate, attempts) = self.recentRate()
+        alerting = (attempts >= MIN_ALERT_ATTEMPTS) and (rate < self.threshold)
+        raised = alerting and (not self.alerting)
+        self.alerting = alerting
+        return raised
+
+    """
+    Get the solve rate over the most recent alert_buckets buckets.
+    Inputs: self.
+    Outputs: (fraction of packets solved, number of packets), with NaN for the rate if there were none.
+    """
+    def recentRate(self):
+        if self.latest_bucket is None:
+            return (math.nan, 0)
+        recent = self.bucket_numbers > self.latest_bucket - self.alert_buckets
+        attempts = int(self.attempts[recent].sum())
+        if attempts == 0:
+            return (math.nan, 0)
+        return (self.solves[recent].sum()/attempts, attempts)
+
+    """
+    Get the solve rate of every bucket in the ring buffer.
+    Inputs: self.
+    Outputs: (bucket start times in seconds, fraction of packets solved in each), in time order.
+    """
+    def series(self):
+        used = np.flatnonzero(self.bucket_numbers >= 0)
+        used = used[np.argsort(self.bucket_numbers[used])]
+        return (self.bucket_numbers[used]*self.bucket_seconds, self.solves[used]/self.attempts[used])
+
+    def setThreshold(self, threshold):
+        self.threshold = threshold
+        (rate, attempts) = self.recentRate()
+        self.alerting = (attempts >= MIN_ALERT_ATTEMPTS) and (rate < self.threshold)
+
+    def rate(self):
+        return self.solved/self.total if self.total else math.nan
@@ -0,0 +1,329 @@
+import argparse
+import calendar
+import os
+import time
+import numpy as np
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+"""
+Columnar binary telemetry log, kept alongside (or instead of) data.txt. Every UTC day of camera time gets its own
+directory holding one file of little-endian float64 values per column, plus a sparse index with the time of every
+INDEX_STRIDE-th row. Since rows are appended in time order, a time-range query is a binary search of the sparse index,
+a binary search of one block of the time column, and a read of just the k rows in the range - no text parsing and no
+scan of the rest of the night. Both searches rely on that order, so a row whose camera time goes back before the last
+row of its day is left out of the log (data.txt still has it).
+
+Layout: <root>/<YYYY-MM-DD>/<column>.f64 for each of COLUMNS, and <root>/<YYYY-MM-DD>/index.f64 holding (time, row)
+pairs. Only one writer may append to a day at a time (interleaved appends would misalign the columns and the index), so
+each writer holds an exclusive lock on <root>/<YYYY-MM-DD>/lock while the day is open.
+"""
+
+# same numeric columns as data.txt (the GMT string is derived from ctime when needed)
+COLUMNS = ("ctime", "ra", "dec", "fr", "ps", "ir", "alt", "az")
+COLUMN_DTYPE = np.dtype("<f8")
+# one index entry per this many rows
+INDEX_STRIDE = 1024
+# default location of the log, next to data.txt
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "telemetry_log")
+# file in each day directory locked by the writer appending to the day
+LOCK_NAME = "lock"
+
+"""
+Raised when another writer (e.g. another GUI, the relay or a headless recorder started from the same directory) is
+already appending to a day of the log.
+"""
+class LogLockedError(OSError):
+    pass
+
+"""
+Name of the day directory a camera timestamp belongs to.
+Inputs: C time in seconds.
+Outputs: The UTC date as YYYY-MM-DD.
+"""
+def dayName(ctime):
+    return time.strftime("%Y-%m-%d", time.gmtime(ctime))
+
+"""
+Take an exclusive lock on an open file, without waiting for it.
+Inputs: the open lock file.
+Outputs: None. Raises LogLockedError if another writer holds the lock.
+"""
+def lockFile(lock_file):
+    try:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as error:
+        raise LogLockedError("another process is writing to %s" % os.path.dirname(lock_file.name)) from error
+
+"""
+Class for appending rows to the log, rotating to a new day directory when the camera time crosses midnight UTC.
+Attributes: root directory, the current day and its lock, open column and index files, its row count and the time of
+its last row.
+Methods: append() - add one row; appendRows() - add many rows at once; close() - close the open files.
+"""
+class TelemetryLogWriter:
+    def __init__(self, root = DEFAULT_ROOT):
+        self.root = root
+        self.day = None
+        self.files = {}
+        self.index_file = None
+        self.lock_file = None
+        self.rows = 0
+        self.last_time = -np.inf
+
+    """
+    Open the files of a day for appending, after locking it, and repair what a crash may have left behind: columns of
+    different lengths, and an index missing its last entries or with entries past the end of the columns.
+    Inputs: the day (see dayName()).
+    Outputs: None. Raises LogLockedError if another writer has the day open.
+    """
+    def openDay(self, day):
+        self.close()
+        day_dir = os.path.join(self.root, day)
+        os.makedirs(day_dir, exist_ok = True)
+        # lock before anything else, since the files are cut back below
+        lock_file = open(os.path.join(day_dir, LOCK_NAME), "a+b")
+        try:
+            lockFile(lock_file)
+        except LogLockedError:
+            lock_file.close()
+            raise
+        self.lock_file = lock_file
+        paths = {name: os.path.join(day_dir, name + ".f64") for name in COLUMNS}
+        # a crash between column writes can leave columns of different lengths, so cut them back to the shortest
+        lengths = [os.path.getsize(path)//COLUMN_DTYPE.itemsize if os.path.exists(path) else 0
+                   for path in paths.values()]
+        self.rows = min(lengths)
+        for (name, path) in paths.items():
+            with open(path, "ab") as column_file:
+                column_file.truncate(self.rows*COLUMN_DTYPE.itemsize)
+            self.files[name] = open(path, "ab")
+        self.last_time = -np.inf
+        if self.rows:
+            self.last_time = float(np.fromfile(paths["ctime"], dtype = COLUMN_DTYPE, count = 1, 
+                                               offset = (self.rows - 1)*COLUMN_DTYPE.itemsize)[0])
+        # only ever cut the index back, to its whole entries for rows that exist; entries lost in a crash are rebuilt 
+        # from the time column below, since padding the file would break the time order the searches rely on
+        index_path = os.path.join(day_dir, "index.f64")
+        entry_size = 2*COLUMN_DTYPE.itemsize
+        entries = os.path.getsize(index_path)//entry_size if os.path.exists(index_path) else 0
+        entries = min(entries, (self.rows + INDEX_STRIDE - 1)//INDEX_STRIDE)
+        with open(index_path, "ab") as index_file:
+            index_file.truncate(entries*entry_size)
+        self.index_file = open(index_path, "ab")
+        missing = np.arange(entries*INDEX_STRIDE, self.rows, INDEX_STRIDE)
+        if len(missing):
+            times = np.memmap(paths["ctime"], dtype = COLUMN_DTYPE, mode = "r", shape = (self.rows,))
+            self.index_file.write(np.column_stack((times[missing], missing)).astype(COLUMN_DTYPE).tobytes())
+            self.index_file.flush()
+            del times
+        self.day = day
+
+    """
+    Append one row of telemetry.
+    Inputs: the values of COLUMNS, in order.
+    Outputs: 1 if the row was left out because its time goes back before the last row of its day, otherwise 0.
+    """
+    def append(self, values):
+        return self.appendRows(np.asarray(values, dtype = COLUMN_DTYPE).reshape(1, len(COLUMNS)))
+
+    """
+    Append many rows of telemetry (e.g. when importing data.txt).
+    Inputs: 2D array with one row per packet and one column per entry of COLUMNS, in time order.
+    Outputs: The number of rows left out because their time goes back before an earlier row of their day.
+    """
+    def appendRows(self, rows):
+        rows = np.asarray(rows, dtype = COLUMN_DTYPE)
+        # split the rows where the UTC day changes
+        day_numbers = np.floor(rows[:, 0]/86400.0)
+        boundaries = np.flatnonzero(np.diff(day_numbers)) + 1
+        left_out = 0
+        for (start, end) in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(rows)]))):
+            day = dayName(rows[start, 0])
+            if day != self.day:
+                self.openDay(day)
+            block = rows[start:end]
+            # keep the day in time order: leave out rows before the latest time written so far
+            latest = np.maximum.accumulate(np.concatenate(([self.last_time], block[:-1, 0])))
+            in_order = block[:, 0] >= latest
+            if not in_order.all():
+                left_out += len(block) - int(np.count_nonzero(in_order))
+                block = block[in_order]
+                if len(block) == 0:
+                    continue
+            for (i, name) in enumerate(COLUMNS):
+                self.files[name].write(np.ascontiguousarray(block[:, i]).tobytes())
+                self.files[name].flush()
+            # index entries for every row that lands on a multiple of INDEX_STRIDE
+            first = -self.rows % INDEX_STRIDE
+            indexed = np.arange(first, len(block), INDEX_STRIDE)
+            if len(indexed):
+                entries = np.column_stack((block[indexed, 0], self.rows + indexed)).astype(COLUMN_DTYPE)
+                self.index_file.write(entries.tobytes())
+                self.index_file.flush()
+            self.rows += len(block)
+            self.last_time = float(block[-1, 0])
+        return left_out
+
+    def close(self):
+        for column_file in self.files.values():
+            column_file.close()
+        self.files = {}
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+        if self.lock_file is not None:
+            # closing the file releases the lock
+            self.lock_file.close()
+            self.lock_file = None
+        self.day = None
+        self.last_time = -np.inf
+
+"""
+Class for reading one day of the log through memory maps, so only the pages that are touched are read from disk.
+Attributes: the day, its row count, the memory-mapped columns and the sparse index.
+Methods: rowRange() - rows between two times; column() - memory-mapped column.
+"""
+class TelemetryLogDay:
+    def __init__(self, root, day):
+        self.day = day
+        day_dir = os.path.join(root, day)
+        lengths = [os.path.getsize(os.path.join(day_dir, name + ".f64"))//COLUMN_DTYPE.itemsize for name in COLUMNS]
+        self.rows = min(lengths)
+        self.columns = {}
+        for name in COLUMNS:
+            if self.rows:
+                self.columns[name] = np.memmap(os.path.join(day_dir, name + ".f64"), dtype = COLUMN_DTYPE,
+                                               mode = "r", shape = (self.rows,))
+            else:
+                self.columns[name] = np.zeros(0, dtype = COLUMN_DTYPE)
+        index_path = os.path.join(day_dir, "index.f64")
+        index = np.fromfile(index_path, dtype = COLUMN_DTYPE) if os.path.exists(index_path) else np.zeros(0)
+        index = index[:len(index) - len(index) % 2].reshape(-1, 2)
+        self.index_times = index[:, 0]
+        self.index_rows = index[:, 1].astype(np.int64)
+
+    def column(self, name):
+        return self.columns[name]
+
+    """
+    Find the rows whose time lies in [t0, t1].
+    Inputs: start and end C times in seconds.
+    Outputs: (first row, one past the last row).
+    """
+    def rowRange(self, t0, t1):
+        return (self.searchTime(t0, "left"), self.searchTime(t1, "right"))
+
+    def searchTime(self, t, side):
+        # the sparse index narrows the search to one block of INDEX_STRIDE rows of the time column
+        block = np.searchsorted(self.index_times, t, side = side)
+        low = int(self.index_rows[block - 1]) if block > 0 else 0
+        high = int(self.index_rows[block]) + 1 if block < len(self.index_rows) else self.rows
+        high = min(high, self.rows)
+        return low + int(np.searchsorted(self.columns["ctime"][low:high], t, side = side))
+
+"""
+Class for querying the whole log.
+Attributes: the root directory and the day readers opened so far.
+Methods: days() - available days; day() - reader for one day; query() - columns for a time range.
+"""
+class TelemetryLog:
+    def __init__(self, root = DEFAULT_ROOT):
+        self.root = root
+        self.open_days = {}
+
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def day(self, day):
+        # re-open the day if rows were appended since it was mapped
+        if day in self.open_days:
+            rows = os.path.getsize(os.path.join(self.root, day, "ctime.f64"))//COLUMN_DTYPE.itemsize
+            if rows == self.open_days[day].rows:
+                return self.open_days[day]
+        self.open_days[day] = TelemetryLogDay(self.root, day)
+        return self.open_days[day]
+
+    """
+    Read every column for the rows whose time lies in [t0, t1].
+    Inputs: start and end C times in seconds, and optionally which columns to read.
+    Outputs: Dictionary of column name to array of values.
+    """
+    def query(self, t0, t1, columns = COLUMNS):
+        pieces = {name: [] for name in columns}
+        first_day = dayName(t0)
+        last_day = dayName(t1)
+        for day in self.days():
+            if (day < first_day) or (day > last_day):
+                continue
+            reader = self.day(day)
+            (start, end) = reader.rowRange(t0, t1)
+            for name in columns:
+                pieces[name].append(np.array(reader.column(name)[start:end]))
+        return {name: np.concatenate(arrays) if arrays else np.zeros(0, dtype = COLUMN_DTYPE)
+                for (name, arrays) in pieces.items()}
+
+"""
+Import an existing data.txt backup file into the columnar log. Rows are appended to their days, so import older
+files before (or into a different root than) live logging of the same nights to keep each day in time order.
+Inputs: path of the data.txt file, root directory of the log, how many rows to convert at a time, the byte offsets of
+the part of the file to import and a progress function (see listening_final.iterBackupChunks()).
+Outputs: The number of rows imported (rows going back before a row already in their day are left out).
+"""
+def importBackupFile(data_path, root = DEFAULT_ROOT, chunk_rows = 65536, start = 0, end = None, progress = None):
+    # imported here since listening_final imports this module
+    import listening_final
+    writer = TelemetryLogWriter(root)
+    imported = 0
+    # the GMT column is left out, since it is derived from ctime
+    for rows in listening_final.iterBackupChunks(data_path, chunk_rows, start, end, progress):
+        if len(rows):
+            rows = rows.astype(COLUMN_DTYPE, copy = False)
+            # the log expects time order within a block
+            imported += len(rows) - writer.appendRows(rows[np.argsort(rows[:, 0], kind = "stable")])
+    writer.close()
+    return imported
+
+"""
+Parse a time given on the command line, either as C time in seconds or as an ISO date/time in UTC.
+"""
+def parseTime(text):
+    try:
+        return float(text)
+    except ValueError:
+        for time_format in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+            try:
+                return float(calendar.timegm(time.strptime(text, time_format)))
+            except ValueError:
+                pass
+    raise argparse.ArgumentTypeError("invalid time: %s" % text)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Columnar Star Camera telemetry log")
+    parser.add_argument("--root", default = DEFAULT_ROOT, help = "directory of the log")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    import_parser = subparsers.add_parser("import", help = "import a data.txt backup file")
+    import_parser.add_argument("data_file")
+    query_parser = subparsers.add_parser("query", help = "print the rows between two times as CSV")
+    query_parser.add_argument("start", type = parseTime)
+    query_parser.add_argument("end", type = parseTime)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        print("Imported %d rows into %s" % (importBackupFile(args.data_file, args.root), args.root))
+    elif args.command == "query":
+        result = TelemetryLog(args.root).query(args.start, args.end)
+        print(",".join(COLUMNS))
+        for row in zip(*(result[name] for name in COLUMNS)):
+            print(",".join(repr(float(value)) for value in row))
+
+if __name__ == "__main__":
+    main()